@@ -0,0 +1,360 @@
+"""Conexiones instrumentadas: cada sentencia queda medida.
+
+Los módulos piden la conexión con `conectar(connection_string)` en lugar de
+`pyodbc.connect`; los cursores que devuelve miden, por sentencia, el tiempo de
+ejecución y de lectura, las filas devueltas (o afectadas) y los bytes leídos,
+y lo anotan en `registro` junto con el endpoint que la lanzó.
+
+Una sentencia se da por terminada cuando se leen todas sus filas, cuando el
+cursor ejecuta otra o cuando se cierra el cursor o la conexión. Si tarda más
+que CLINICA_UMBRAL_LENTA_MS (200 ms por omisión) se escribe en el log de
+consultas lentas, con los parámetros reducidos a su tipo y tamaño; con
+CLINICA_LOG_LENTAS=ruta ese log va además a un archivo.
+"""
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from functools import lru_cache
+
+import pyodbc
+
+import trazas
+import viajes
+from metricas import espera_conexion
+
+UMBRAL_LENTA_MS = float(os.environ.get("CLINICA_UMBRAL_LENTA_MS", "200"))
+
+# Límites superiores (ms) de los cubos de los histogramas; el último es +inf
+LIMITES_MS = (0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float("inf"))
+
+logger = logging.getLogger("acceso_datos.lentas")
+if os.environ.get("CLINICA_LOG_LENTAS"):
+    _archivo = logging.FileHandler(os.environ["CLINICA_LOG_LENTAS"], encoding="utf-8")
+    _archivo.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    logger.addHandler(_archivo)
+
+# Endpoint de la petición en curso ("GET /citas/{id}"); lo fijan las aplicaciones
+endpoint_actual = contextvars.ContextVar("endpoint_actual", default=None)
+
+
+def marcar_endpoint(metodo, ruta):
+    """Anotar las sentencias que siguen a nombre de `metodo ruta`"""
+    return endpoint_actual.set(f"{metodo} {ruta}")
+
+
+@lru_cache(maxsize=1024)
+def normalizar_sentencia(sql):
+    """Texto de la sentencia en una línea y con las listas de `?` plegadas,
+    para que las variantes de un mismo IN (?, ?, ...) compartan estadísticas"""
+    return re.sub(r"\?(?:\s*,\s*\?)+", "?, ...", " ".join(sql.split()))
+
+
+def redactar(parametros):
+    """Parámetros sin sus valores: solo tipo y, para textos, longitud"""
+    redactados = []
+    for valor in parametros:
+        if valor is None:
+            redactados.append(None)
+        elif isinstance(valor, (str, bytes, bytearray)):
+            redactados.append(f"<{type(valor).__name__}:{len(valor)}>")
+        else:
+            redactados.append(f"<{type(valor).__name__}>")
+    return redactados
+
+
+def _bytes_fila(fila):
+    """Tamaño aproximado de una fila tal como llega del driver"""
+    total = 0
+    for valor in fila:
+        if valor is None:
+            continue
+        total += len(valor) if isinstance(valor, (str, bytes, bytearray)) else 8
+    return total
+
+
+class Histograma:
+    def __init__(self):
+        self.cubos = [0] * len(LIMITES_MS)
+        self.cantidad = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def anotar(self, ms):
+        i = 0
+        while ms > LIMITES_MS[i]:
+            i += 1
+        self.cubos[i] += 1
+        self.cantidad += 1
+        self.suma += ms
+        self.maximo = max(self.maximo, ms)
+
+    def percentil(self, p):
+        """Límite superior del cubo donde cae el percentil p (el máximo en el último)"""
+        if not self.cantidad:
+            return None
+        objetivo = p * self.cantidad / 100
+        acumulado = 0
+        for limite, cuenta in zip(LIMITES_MS, self.cubos):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return round(min(limite, self.maximo), 3)
+        return round(self.maximo, 3)
+
+
+class EstadisticasSentencia:
+    def __init__(self, sentencia):
+        self.sentencia = sentencia
+        self.duracion = Histograma()
+        self.filas = 0
+        self.bytes = 0
+        self.lentas = 0
+        self.por_endpoint = {}
+
+    def resumen(self):
+        h = self.duracion
+        return {
+            "sentencia": self.sentencia,
+            "ejecuciones": h.cantidad,
+            "total_ms": round(h.suma, 3),
+            "media_ms": round(h.suma / h.cantidad, 3) if h.cantidad else None,
+            "p50_ms": h.percentil(50),
+            "p95_ms": h.percentil(95),
+            "p99_ms": h.percentil(99),
+            "max_ms": round(h.maximo, 3),
+            "filas": self.filas,
+            "bytes": self.bytes,
+            "lentas": self.lentas,
+            "cubos_ms": dict(zip(map(str, LIMITES_MS), h.cubos)),
+            "por_endpoint": dict(self.por_endpoint),
+        }
+
+
+class Registro:
+    """Estadísticas por sentencia y últimas consultas lentas, compartidas entre hilos"""
+
+    def __init__(self, umbral_ms=UMBRAL_LENTA_MS, lentas_guardadas=200):
+        self.umbral_ms = umbral_ms
+        self._sentencias = {}
+        self._lentas = deque(maxlen=lentas_guardadas)
+        self._suscriptores = []
+        self._lock = threading.Lock()
+
+    def suscribir_lentas(self, funcion):
+        """Llamar funcion(entrada) con cada consulta lenta, en el hilo que la ejecutó"""
+        self._suscriptores.append(funcion)
+        return funcion
+
+    def anotar(self, sql, parametros, endpoint, ms, filas, leidos):
+        sentencia = normalizar_sentencia(sql)
+        lenta = ms >= self.umbral_ms
+        with self._lock:
+            estadisticas = self._sentencias.get(sentencia)
+            if estadisticas is None:
+                estadisticas = self._sentencias[sentencia] = EstadisticasSentencia(sentencia)
+            estadisticas.duracion.anotar(ms)
+            estadisticas.filas += filas
+            estadisticas.bytes += leidos
+            clave = endpoint or "-"
+            estadisticas.por_endpoint[clave] = estadisticas.por_endpoint.get(clave, 0) + 1
+            if lenta:
+                estadisticas.lentas += 1
+        if lenta:
+            entrada = {
+                "fecha": datetime.now().isoformat(timespec="milliseconds"),
+                "endpoint": endpoint,
+                "ms": round(ms, 3),
+                "filas": filas,
+                "bytes": leidos,
+                "sentencia": sentencia,
+                "parametros": redactar(parametros),
+            }
+            self._lentas.append(entrada)
+            logger.warning("%.1f ms  %s  filas=%d bytes=%d  %s  %s", ms, endpoint or "-", filas,
+                           leidos, sentencia, entrada["parametros"])
+            for funcion in self._suscriptores:
+                try:
+                    funcion(entrada)
+                except Exception:
+                    logger.exception("Error en el suscriptor %s de consultas lentas", funcion.__name__)
+
+    def sentencias(self):
+        """Resumen de cada sentencia, de la que más tiempo acumula a la que menos"""
+        with self._lock:
+            resumenes = [e.resumen() for e in self._sentencias.values()]
+        return sorted(resumenes, key=lambda r: r["total_ms"], reverse=True)
+
+    def lentas(self):
+        return list(self._lentas)
+
+    def reiniciar(self):
+        with self._lock:
+            self._sentencias.clear()
+            self._lentas.clear()
+
+
+registro = Registro()
+
+
+class Cursor:
+    """Cursor de pyodbc que mide cada sentencia; lo demás pasa tal cual"""
+
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._medicion = None
+
+    def __getattr__(self, nombre):
+        return getattr(self._cursor, nombre)
+
+    def __setattr__(self, nombre, valor):
+        if nombre.startswith("_"):
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._cursor, nombre, valor)
+
+    def _comenzar(self, sql, parametros):
+        self._terminar()
+        if len(parametros) == 1 and isinstance(parametros[0], (list, tuple)):
+            parametros = parametros[0]
+        self._medicion = [sql, parametros, endpoint_actual.get(), 0.0, 0, 0]
+
+    def _terminar(self):
+        medicion, self._medicion = self._medicion, None
+        if medicion is not None:
+            registro.anotar(*medicion)
+
+    def execute(self, sql, *parametros):
+        viajes.anotar(normalizar_sentencia(sql), endpoint_actual.get())
+        self._comenzar(sql, parametros)
+        tramo = trazas.abrir("execute", sentencia=normalizar_sentencia(sql))
+        comienzo = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *parametros)
+        finally:
+            self._medicion[3] += (time.perf_counter() - comienzo) * 1000
+            trazas.cerrar(tramo)
+        if self._cursor.description is None:
+            self._medicion[4] = max(self._cursor.rowcount, 0)
+            self._terminar()
+        return self
+
+    def executemany(self, sql, secuencia):
+        secuencia = list(secuencia)
+        viajes.anotar(normalizar_sentencia(sql), endpoint_actual.get())
+        self._comenzar(sql, secuencia[0] if secuencia else ())
+        tramo = trazas.abrir("executemany", sentencia=normalizar_sentencia(sql), filas=len(secuencia))
+        comienzo = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, secuencia)
+        finally:
+            self._medicion[3] += (time.perf_counter() - comienzo) * 1000
+            trazas.cerrar(tramo)
+            self._medicion[4] = len(secuencia)
+            self._terminar()
+
+    def _leer(self, leer, *argumentos):
+        tramo = trazas.abrir(leer.__name__)
+        comienzo = time.perf_counter()
+        resultado = leer(*argumentos)
+        if self._medicion is not None:
+            self._medicion[3] += (time.perf_counter() - comienzo) * 1000
+        if tramo is not None:
+            trazas.cerrar(tramo, filas=(len(resultado) if isinstance(resultado, list)
+                                        else int(resultado is not None)))
+        return resultado
+
+    def fetchone(self):
+        fila = self._leer(self._cursor.fetchone)
+        if self._medicion is not None:
+            if fila is None:
+                self._terminar()
+            else:
+                self._medicion[4] += 1
+                self._medicion[5] += _bytes_fila(fila)
+        return fila
+
+    def fetchmany(self, cantidad=1):
+        filas = self._leer(self._cursor.fetchmany, cantidad)
+        if self._medicion is not None:
+            self._medicion[4] += len(filas)
+            self._medicion[5] += sum(_bytes_fila(f) for f in filas)
+            if len(filas) < cantidad:
+                self._terminar()
+        return filas
+
+    def fetchall(self):
+        filas = self._leer(self._cursor.fetchall)
+        if self._medicion is not None:
+            self._medicion[4] += len(filas)
+            self._medicion[5] += sum(_bytes_fila(f) for f in filas)
+            self._terminar()
+        return filas
+
+    def close(self):
+        self._terminar()
+        self._cursor.close()
+
+    # Los métodos especiales no pasan por __getattr__
+    def __iter__(self):
+        fila = self.fetchone()
+        while fila is not None:
+            yield fila
+            fila = self.fetchone()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self._terminar()
+        return self._cursor.__exit__(tipo, valor, traza)
+
+
+class Conexion:
+    """Conexión de pyodbc cuyos cursores están instrumentados"""
+
+    def __init__(self, conexion):
+        self._conexion = conexion
+        self._cursores = []
+
+    def __getattr__(self, nombre):
+        return getattr(self._conexion, nombre)
+
+    def cursor(self):
+        cursor = Cursor(self._conexion.cursor())
+        self._cursores.append(cursor)
+        return cursor
+
+    def execute(self, sql, *parametros):
+        return self.cursor().execute(sql, *parametros)
+
+    def close(self):
+        for cursor in self._cursores:
+            cursor._terminar()
+        self._cursores.clear()
+        self._conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        return self._conexion.__exit__(tipo, valor, traza)
+
+
+def conectar(connection_string, **opciones):
+    """pyodbc.connect instrumentado; con el pooling de ODBC, el tiempo de
+    conectar es la espera por una conexión libre del pool"""
+    tramo = trazas.abrir("conectar")
+    comienzo = time.perf_counter()
+    conexion = pyodbc.connect(connection_string, **opciones)
+    espera_conexion.observar(time.perf_counter() - comienzo)
+    trazas.cerrar(tramo)
+    return Conexion(conexion)
+
+
+def conectar_sin_medir(connection_string, **opciones):
+    """Conexión directa, para el propio diagnóstico (no cuenta ni se traza)"""
+    return pyodbc.connect(connection_string, **opciones)
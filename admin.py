@@ -0,0 +1,19 @@
+"""Autorización de los endpoints /admin/*.
+
+Requieren CLINICA_TOKEN_ADMIN en el entorno y el mismo valor en
+`Authorization: Bearer ...` o `X-Admin-Token`; sin el token configurado no
+atienden a nadie.
+"""
+import hmac
+import os
+
+
+def autorizado(autorizacion, token_admin):
+    """Comparar el token recibido con CLINICA_TOKEN_ADMIN en tiempo constante"""
+    esperado = os.environ.get("CLINICA_TOKEN_ADMIN")
+    if not esperado:
+        return False
+    recibido = token_admin or ""
+    if not recibido and autorizacion and autorizacion.startswith("Bearer "):
+        recibido = autorizacion[len("Bearer "):]
+    return hmac.compare_digest(recibido.encode("utf-8"), esperado.encode("utf-8"))
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import time
+from datetime import date, timedelta
+
+from metricas import cache_consultas
+
+
+class AgendaDiaria:
+    """Agenda del día por (médico, fecha) ya unida con el nombre del paciente.
+
+    `leer_dia(fecha)` devuelve las citas de todos los médicos en esa fecha
+    (un solo SELECT con JOIN); `leer_paciente(id)` devuelve el nombre de un
+    paciente para parchear altas sueltas. Cada agenda lleva una versión que
+    cambia con cada modificación, para que los clientes pregunten barato; es
+    un resumen del contenido, así que todos los procesos que ven las mismas
+    citas dan la misma versión y un cliente puede consultar a cualquiera.
+    Los días se vuelven a leer cada `ttl` segundos para recoger cambios hechos
+    por otros procesos (por ejemplo, la materialización de series).
+    """
+
+    def __init__(self, leer_dia, leer_paciente, ttl=300):
+        self._leer_dia = leer_dia
+        self._leer_paciente = leer_paciente
+        self.ttl = ttl
+        self._agendas = {}
+        self._dias = {}
+        self._ubicacion = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _version(clave, entradas):
+        """Entero de 63 bits derivado del médico, la fecha y las citas"""
+        resumen = hashlib.blake2b(repr(clave).encode(), digest_size=8)
+        for id_cita in sorted(entradas):
+            cita = entradas[id_cita]
+            resumen.update(repr((
+                id_cita, cita["IdPaciente"], cita["FechaCita"].isoformat(timespec="seconds"),
+                cita["Motivo"], cita["Estado"], cita.get("NombrePaciente")
+            )).encode())
+        return int.from_bytes(resumen.digest(), "big") >> 1
+
+    def construir_dia(self, fecha):
+        """Leer todas las agendas de la fecha; conserva la versión si nada cambió"""
+        citas = self._leer_dia(fecha)
+        nuevas = {}
+        for cita in citas:
+            nuevas.setdefault(cita["IdMedico"], {})[cita["IdCita"]] = cita
+        with self._lock:
+            self._podar()
+            medicos = {m for (m, f) in self._agendas if f == fecha} | set(nuevas)
+            for id_medico in medicos:
+                clave = (id_medico, fecha)
+                actual = self._agendas.get(clave)
+                entradas = nuevas.get(id_medico, {})
+                if actual is None or actual["entradas"] != entradas:
+                    self._agendas[clave] = self._armar(clave, entradas)
+                for id_cita in entradas:
+                    self._ubicacion[id_cita] = clave
+            self._dias[fecha] = time.monotonic()
+
+    def _armar(self, clave, entradas):
+        return {
+            "version": self._version(clave, entradas),
+            "entradas": entradas,
+            "citas": sorted(entradas.values(), key=lambda c: (c["FechaCita"], c["IdCita"]))
+        }
+
+    def _podar(self):
+        ayer = date.today() - timedelta(days=1)
+        for fecha in [f for f in self._dias if f < ayer]:
+            del self._dias[fecha]
+        for clave in [c for c in self._agendas if c[1] < ayer]:
+            for id_cita in self._agendas.pop(clave)["entradas"]:
+                self._ubicacion.pop(id_cita, None)
+
+    def obtener(self, id_medico, fecha):
+        """(versión, citas ordenadas por hora) de la agenda del médico"""
+        with self._lock:
+            construido = self._dias.get(fecha)
+        if construido is None or time.monotonic() - construido > self.ttl:
+            cache_consultas.inc("agenda", "fallo")
+            self.construir_dia(fecha)
+        else:
+            cache_consultas.inc("agenda", "acierto")
+        with self._lock:
+            agenda = self._agendas.get((id_medico, fecha))
+            if agenda is None:
+                agenda = self._agendas[(id_medico, fecha)] = self._armar((id_medico, fecha), {})
+            return agenda["version"], agenda["citas"]
+
+    def aplicar(self, id_cita, cita):
+        """Parchear la agenda tras un alta o modificación (cita) o una baja (None)"""
+        nombre = None
+        if cita is not None:
+            with self._lock:
+                cargado = cita["FechaCita"].date() in self._dias
+            if cargado:
+                nombre = self._leer_paciente(cita["IdPaciente"])
+        with self._lock:
+            anterior = self._ubicacion.pop(id_cita, None)
+            if anterior in self._agendas:
+                entradas = dict(self._agendas[anterior]["entradas"])
+                entradas.pop(id_cita, None)
+                self._agendas[anterior] = self._armar(anterior, entradas)
+            if cita is None or cita["FechaCita"].date() not in self._dias:
+                return
+            clave = (cita["IdMedico"], cita["FechaCita"].date())
+            entradas = dict(self._agendas.get(clave, {"entradas": {}})["entradas"])
+            entradas[id_cita] = dict(cita, IdCita=id_cita, NombrePaciente=nombre)
+            self._agendas[clave] = self._armar(clave, entradas)
+            self._ubicacion[id_cita] = clave
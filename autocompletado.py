@@ -0,0 +1,100 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+from texto import normalizar
+
+# Cada entrada ocupa ~80 bytes (puntero + clave corta + id en el array), así que
+# un millón de entradas cabe en menos de 100 MB. Por encima del límite se ignoran
+# las altas nuevas en lugar de crecer sin control.
+MAX_ENTRADAS = 1_000_000
+
+
+def claves_de(texto):
+    """Claves de búsqueda: el texto completo y el resto a partir de cada palabra"""
+    palabras = normalizar(texto).split()
+    return [" ".join(palabras[i:]) for i in range(len(palabras))]
+
+
+class IndicePrefijos:
+    """Índice de prefijos en memoria sobre arreglos ordenados"""
+
+    def __init__(self, max_entradas=MAX_ENTRADAS):
+        self.max_entradas = max_entradas
+        self._claves = []
+        self._ids = array("q")
+        self._claves_por_id = {}
+        self._etiquetas = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._claves)
+
+    def cargar(self, registros):
+        """Reconstruir el índice completo a partir de tuplas (id, etiqueta, textos)"""
+        entradas = []
+        claves_por_id = {}
+        etiquetas = {}
+        for identificador, etiqueta, textos in registros:
+            claves = [c for texto in textos for c in claves_de(texto)]
+            if len(entradas) + len(claves) > self.max_entradas:
+                break
+            claves_por_id[identificador] = claves
+            etiquetas[identificador] = etiqueta
+            entradas.extend((clave, identificador) for clave in claves)
+        entradas.sort()
+        with self._lock:
+            self._claves = [clave for clave, _ in entradas]
+            self._ids = array("q", (identificador for _, identificador in entradas))
+            self._claves_por_id = claves_por_id
+            self._etiquetas = etiquetas
+
+    def agregar(self, identificador, etiqueta, textos):
+        """Insertar (o reemplazar) un registro; devuelve False si se alcanzó el límite"""
+        claves = [c for texto in textos for c in claves_de(texto)]
+        with self._lock:
+            # Si no cabe, el registro anterior queda como estaba
+            anteriores = len(self._claves_por_id.get(identificador, ()))
+            if len(self._claves) - anteriores + len(claves) > self.max_entradas:
+                return False
+            self._quitar(identificador)
+            for clave in claves:
+                posicion = bisect_right(self._claves, clave)
+                self._claves.insert(posicion, clave)
+                self._ids.insert(posicion, identificador)
+            self._claves_por_id[identificador] = claves
+            self._etiquetas[identificador] = etiqueta
+            return True
+
+    def eliminar(self, identificador):
+        with self._lock:
+            self._quitar(identificador)
+
+    def _quitar(self, identificador):
+        for clave in self._claves_por_id.pop(identificador, ()):
+            inicio = bisect_left(self._claves, clave)
+            fin = bisect_right(self._claves, clave, inicio)
+            for posicion in range(inicio, fin):
+                if self._ids[posicion] == identificador:
+                    del self._claves[posicion]
+                    del self._ids[posicion]
+                    break
+        self._etiquetas.pop(identificador, None)
+
+    def buscar(self, prefijo, limite=10):
+        """Registros cuyo texto (o alguna de sus palabras) empieza por el prefijo"""
+        prefijo = normalizar(prefijo)
+        if not prefijo:
+            return []
+        resultados = []
+        vistos = set()
+        with self._lock:
+            posicion = bisect_left(self._claves, prefijo)
+            while (posicion < len(self._claves) and len(resultados) < limite
+                   and self._claves[posicion].startswith(prefijo)):
+                identificador = self._ids[posicion]
+                if identificador not in vistos:
+                    vistos.add(identificador)
+                    resultados.append({"id": identificador, "texto": self._etiquetas[identificador]})
+                posicion += 1
+        return resultados
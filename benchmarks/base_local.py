@@ -0,0 +1,412 @@
+"""Base de datos local con la interfaz de pyodbc, para medir sin SQL Server.
+
+Guarda las tablas de ClinicaMedica en un archivo SQLite y traduce al vuelo
+las construcciones de T-SQL que usa el proyecto (OUTPUT INSERTED/DELETED,
+tablas #temporales, UPDATE/DELETE con JOIN, DATEADD, concatenación con +,
+sugerencias de bloqueo). No pretende emular SQL Server: las latencias que se
+miden con ella sirven para comparar versiones del código entre sí, no para
+estimar las de producción. En particular, SQLite serializa las escrituras.
+
+    from benchmarks import base_local
+    base_local.configurar("/tmp/clinica.db")
+    base_local.instalar()      # `import pyodbc` devuelve este módulo
+"""
+import re
+import sqlite3
+import sys
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from functools import lru_cache
+
+Error = sqlite3.Error
+IntegrityError = sqlite3.IntegrityError
+pooling = True
+
+_ruta = None
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS Pacientes (
+    IdPaciente INTEGER PRIMARY KEY,
+    Nombre VARCHAR(100) NOT NULL,
+    Apellido VARCHAR(100) NOT NULL,
+    FechaNacimiento DATE,
+    Sexo VARCHAR(1),
+    Telefono VARCHAR(20),
+    Direccion VARCHAR(255),
+    Email VARCHAR(100) COLLATE NOCASE,
+    TelefonoNormalizado VARCHAR(20) GENERATED ALWAYS AS (solo_digitos(Telefono)) STORED
+);
+CREATE INDEX IF NOT EXISTS IX_Pacientes_TelefonoNormalizado ON Pacientes (TelefonoNormalizado);
+CREATE INDEX IF NOT EXISTS IX_Pacientes_Email ON Pacientes (Email);
+
+CREATE TABLE IF NOT EXISTS Medicos (
+    IdMedico INTEGER PRIMARY KEY,
+    Nombre VARCHAR(100) NOT NULL,
+    Apellido VARCHAR(100) NOT NULL,
+    Especialidad VARCHAR(100) NOT NULL,
+    Telefono VARCHAR(20),
+    Email VARCHAR(100)
+);
+
+CREATE TABLE IF NOT EXISTS Citas (
+    IdCita INTEGER PRIMARY KEY,
+    IdPaciente INT NOT NULL,
+    IdMedico INT NOT NULL,
+    FechaCita DATETIME NOT NULL,
+    Motivo VARCHAR(255),
+    Estado VARCHAR(20) NOT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_Citas_IdMedico_FechaCita ON Citas (IdMedico, FechaCita);
+CREATE INDEX IF NOT EXISTS IX_Citas_IdPaciente ON Citas (IdPaciente);
+CREATE INDEX IF NOT EXISTS IX_Citas_Estado_FechaCita ON Citas (Estado, FechaCita);
+
+CREATE TABLE IF NOT EXISTS HorariosMedicos (
+    IdMedico INT NOT NULL,
+    DiaSemana TINYINT NOT NULL,
+    Bloques BINARY(36) NOT NULL,
+    PRIMARY KEY (IdMedico, DiaSemana)
+);
+
+CREATE TABLE IF NOT EXISTS ExcepcionesHorario (
+    IdExcepcion INTEGER PRIMARY KEY,
+    IdMedico INT NULL,
+    Fecha DATE NOT NULL,
+    Bloques BINARY(36) NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS UX_ExcepcionesHorario ON ExcepcionesHorario (IdMedico, Fecha);
+
+CREATE TABLE IF NOT EXISTS SeriesCitas (
+    IdSerie INTEGER PRIMARY KEY,
+    IdPaciente INT NOT NULL,
+    IdMedico INT NOT NULL,
+    Inicio DATETIME NOT NULL,
+    Frecuencia VARCHAR(10) NOT NULL,
+    Intervalo INT NOT NULL DEFAULT 1,
+    Cantidad INT NULL,
+    Hasta DATETIME NULL,
+    Motivo VARCHAR(255) NOT NULL,
+    MaterializadaHasta DATETIME NULL,
+    Activa BIT NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS IX_SeriesCitas_IdMedico ON SeriesCitas (IdMedico);
+
+CREATE TABLE IF NOT EXISTS SeriesOmitidas (
+    IdOmitida INTEGER PRIMARY KEY,
+    IdSerie INT NOT NULL,
+    FechaCita DATETIME NOT NULL,
+    Alta DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    Reprogramada BIT NOT NULL DEFAULT 0,
+    IdCita INT NULL
+);
+
+CREATE TABLE IF NOT EXISTS ListaEspera (
+    IdEspera INTEGER PRIMARY KEY,
+    IdPaciente INT NOT NULL,
+    IdMedico INT NULL,
+    Especialidad VARCHAR(100) NULL,
+    Prioridad INT NOT NULL DEFAULT 3,
+    Desde DATETIME NULL,
+    Hasta DATETIME NULL,
+    Alta DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    Estado VARCHAR(20) NOT NULL DEFAULT 'Esperando',
+    IdRetencion VARCHAR(32) NULL,
+    MedicoOfrecido INT NULL,
+    FechaOfrecida DATETIME NULL,
+    IdCita INT NULL
+);
+CREATE INDEX IF NOT EXISTS IX_ListaEspera_Estado ON ListaEspera (Estado);
+CREATE INDEX IF NOT EXISTS IX_ListaEspera_IdRetencion ON ListaEspera (IdRetencion)
+    WHERE IdRetencion IS NOT NULL;
+
+CREATE TABLE IF NOT EXISTS PacientesDuplicados (
+    IdPaciente1 INT NOT NULL,
+    IdPaciente2 INT NOT NULL,
+    Puntaje DECIMAL(5, 4) NOT NULL,
+    IdGrupo INT NOT NULL,
+    Estado VARCHAR(20) NOT NULL DEFAULT 'Pendiente',
+    FechaDeteccion DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (IdPaciente1, IdPaciente2)
+);
+
+CREATE TABLE IF NOT EXISTS RecordatoriosEnviados (
+    IdCita INT NOT NULL,
+    Tipo VARCHAR(3) NOT NULL,
+    Canal VARCHAR(5) NOT NULL,
+    FechaEnvio DATETIME NOT NULL DEFAULT (datetime('now', 'localtime')),
+    PRIMARY KEY (IdCita, Tipo, Canal)
+);
+"""
+
+
+# Conversión de tipos como la haría pyodbc: datetime/date de ida y vuelta
+sqlite3.register_adapter(datetime, lambda valor: valor.isoformat(" "))
+sqlite3.register_adapter(date, lambda valor: valor.isoformat())
+sqlite3.register_adapter(Decimal, float)
+for _tipo in ("DATETIME", "TIMESTAMP"):
+    sqlite3.register_converter(_tipo, lambda valor: datetime.fromisoformat(valor.decode()))
+sqlite3.register_converter("DATE", lambda valor: date.fromisoformat(valor.decode()[:10]))
+
+
+_UNIDADES = {"day": "days", "dd": "days", "hour": "hours", "hh": "hours",
+             "minute": "minutes", "mi": "minutes", "second": "seconds", "ss": "seconds",
+             "month": "months", "mm": "months", "year": "years", "yy": "years"}
+
+_SOLO_SET = re.compile(r"^\s*(SET\s+\w+(?:\s+[\w-]+)+\s*;?\s*)+$", re.I)
+_CREAR_SI_NO_EXISTE = re.compile(
+    r"IF\s+OBJECT_ID\('tempdb\.\.#(\w+)'\)\s+IS\s+NULL\s+CREATE\s+TABLE\s+#\1", re.I)
+_DATEADD = re.compile(r"DATEADD\(\s*(\w+)\s*,\s*([^,]+?)\s*,\s*([^()]+?)\s*\)", re.I)
+_SUGERENCIAS = re.compile(r"\s+WITH\s*\(\s*(?:ROWLOCK|READPAST|UPDLOCK|HOLDLOCK|NOLOCK)"
+                          r"(?:\s*,\s*\w+)*\s*\)", re.I)
+_OUTPUT = re.compile(r"\s+OUTPUT\s+((?:INSERTED|DELETED)\.\w+(?:\s*,\s*(?:INSERTED|DELETED)\.\w+)*)",
+                     re.I)
+_UPDATE_OUTPUT_DELETED = re.compile(
+    r"^\s*UPDATE\s+(\w+)\s+SET\s+(.*?)\s+OUTPUT\s+(DELETED\.\w+(?:\s*,\s*DELETED\.\w+)*)"
+    r"\s+WHERE\s+(.*)$", re.I | re.S)
+_UPDATE_JOIN = re.compile(
+    r"^\s*UPDATE\s+(\w+)\s+SET\s+(.*?)\s+FROM\s+(\w+)\s+\1\s+JOIN\s+(\(.*\)|\S+)\s+(\w+)\s+ON\s+(.*?)"
+    r"(?:\s+WHERE\s+(.*))?\s*$", re.I | re.S)
+_UPDATE_ALIAS = re.compile(
+    r"^\s*UPDATE\s+(\w+)\s+SET\s+(.*?)\s+FROM\s+(\w+)\s+\1(?:\s+WHERE\s+(.*))?\s*$", re.I | re.S)
+_DELETE_JOIN = re.compile(
+    r"^\s*DELETE\s+(\w+)\s+FROM\s+(\w+)\s+\1\s+JOIN\s+(\S+)\s+(\w+)\s+ON\s+(.*?)"
+    r"(?:\s+WHERE\s+(.*))?\s*$", re.I | re.S)
+
+
+@lru_cache(maxsize=1024)
+def traducir(sql):
+    """(sentencia SQLite, consulta previa o None, parámetros que usa la previa).
+
+    La consulta previa solo aparece en UPDATE ... OUTPUT DELETED, porque SQLite
+    devuelve con RETURNING los valores nuevos y no los anteriores.
+    """
+    if _SOLO_SET.match(sql):
+        return None, None, None
+    sql = _CREAR_SI_NO_EXISTE.sub(r"CREATE TEMP TABLE IF NOT EXISTS #\1", sql)
+    sql = re.sub(r"CREATE\s+TABLE\s+#", "CREATE TEMP TABLE #", sql, flags=re.I)
+    sql = re.sub(r"TRUNCATE\s+TABLE", "DELETE FROM", sql, flags=re.I)
+    sql = re.sub(r"#(\w+)", r"tmp_\1", sql)
+    sql = _SUGERENCIAS.sub("", sql)
+    sql = _DATEADD.sub(lambda m: f"datetime({m.group(3)}, ({m.group(2)}) || ' "
+                                 f"{_UNIDADES[m.group(1).lower()]}')", sql)
+    sql = re.sub(r"CAST\(\s*([^()]+?)\s+AS\s+DATE\s*\)", r"date(\1)", sql, flags=re.I)
+    sql = re.sub(r"GETDATE\(\)", "datetime('now', 'localtime')", sql, flags=re.I)
+    sql = sql.replace(" + ' ' + ", " || ' ' || ")
+
+    m = _UPDATE_OUTPUT_DELETED.match(sql)
+    if m:
+        tabla, asignaciones, salida, condicion = m.groups()
+        columnas = re.sub(r"DELETED\.", "", salida, flags=re.I)
+        return (f"UPDATE {tabla} SET {asignaciones} WHERE {condicion}",
+                f"SELECT {columnas} FROM {tabla} WHERE {condicion}",
+                asignaciones.count("?"))
+    m = _UPDATE_JOIN.match(sql)
+    if m:
+        alias, asignaciones, tabla, otra, otro_alias, union, condicion = m.groups()
+        asignaciones = re.sub(rf"\b{alias}\.(\w+)\s*=", r"\1 =", asignaciones)
+        condicion = f"({union}) AND ({condicion})" if condicion else union
+        return (f"UPDATE {tabla} AS {alias} SET {asignaciones} FROM {otra} AS {otro_alias} "
+                f"WHERE {condicion}", None, None)
+    m = _UPDATE_ALIAS.match(sql)
+    if m:
+        alias, asignaciones, tabla, condicion = m.groups()
+        asignaciones = re.sub(rf"\b{alias}\.(\w+)\s*=", r"\1 =", asignaciones)
+        return (f"UPDATE {tabla} AS {alias} SET {asignaciones}"
+                + (f" WHERE {condicion}" if condicion else ""), None, None)
+    m = _DELETE_JOIN.match(sql)
+    if m:
+        alias, tabla, otra, otro_alias, union, condicion = m.groups()
+        condicion = f"({union}) AND ({condicion})" if condicion else union
+        return (f"DELETE FROM {tabla} AS {alias} WHERE EXISTS "
+                f"(SELECT 1 FROM {otra} AS {otro_alias} WHERE {condicion})", None, None)
+    m = _OUTPUT.search(sql)
+    if m:
+        columnas = re.sub(r"(INSERTED|DELETED)\.", "", m.group(1), flags=re.I)
+        sql = f"{sql[:m.start()]}{sql[m.end():].rstrip().rstrip(';')} RETURNING {columnas}"
+    return sql, None, None
+
+
+class Fila(tuple):
+    """Como pyodbc.Row: acceso por posición y por nombre de columna"""
+
+    def __new__(cls, valores, indices):
+        fila = super().__new__(cls, valores)
+        fila._indices = indices
+        return fila
+
+    def __getattr__(self, nombre):
+        try:
+            return self[self._indices[nombre]]
+        except KeyError:
+            raise AttributeError(nombre) from None
+
+
+class Cursor:
+    def __init__(self, conexion):
+        self._cursor = conexion.cursor()
+        self._pendientes = None
+        self._indices = None
+        self.description = None
+        self.fast_executemany = False
+        self.rowcount = -1
+
+    @staticmethod
+    def _parametros(parametros):
+        if len(parametros) == 1 and isinstance(parametros[0], (list, tuple)):
+            return tuple(parametros[0])
+        return parametros
+
+    def execute(self, sql, *parametros):
+        parametros = self._parametros(parametros)
+        sentencia, previa, usados = traducir(sql)
+        self._pendientes = None
+        self._indices = None
+        self.description = None
+        if sentencia is None:
+            self.rowcount = -1
+            return self
+        if previa is not None:
+            self._cursor.execute(previa, parametros[usados:])
+            self._guardar_descripcion()
+            self._pendientes = self._cursor.fetchall()
+        self._cursor.execute(sentencia, parametros)
+        if previa is None and self._cursor.description is not None:
+            self._guardar_descripcion()
+            if "RETURNING" in sentencia:
+                # Leer todo ya, para que la sentencia termine antes del commit
+                self._pendientes = self._cursor.fetchall()
+        self.rowcount = (len(self._pendientes) if self._pendientes is not None and previa is None
+                         else self._cursor.rowcount)
+        return self
+
+    def executemany(self, sql, secuencia):
+        sentencia, _, _ = traducir(sql)
+        self._cursor.executemany(sentencia, [tuple(p) for p in secuencia])
+        self.rowcount = self._cursor.rowcount
+
+    def _guardar_descripcion(self):
+        self.description = self._cursor.description
+        self._indices = {columna[0]: i for i, columna in enumerate(self.description)}
+
+    def _fila(self, valores):
+        return None if valores is None else Fila(valores, self._indices)
+
+    def fetchone(self):
+        if self._pendientes is not None:
+            return self._fila(self._pendientes.pop(0)) if self._pendientes else None
+        return self._fila(self._cursor.fetchone())
+
+    def fetchmany(self, cantidad=1):
+        if self._pendientes is not None:
+            filas, self._pendientes = self._pendientes[:cantidad], self._pendientes[cantidad:]
+        else:
+            filas = self._cursor.fetchmany(cantidad)
+        return [self._fila(f) for f in filas]
+
+    def fetchall(self):
+        if self._pendientes is not None:
+            filas, self._pendientes = self._pendientes, []
+        else:
+            filas = self._cursor.fetchall()
+        return [self._fila(f) for f in filas]
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        # Como pyodbc: al salir sin error se confirma la transacción
+        if tipo is None:
+            self._cursor.connection.commit()
+
+    def close(self):
+        self._cursor.close()
+
+
+class Conexion:
+    def __init__(self, ruta):
+        # IMMEDIATE: la primera escritura toma el bloqueo de escritura y espera
+        # si hace falta, en vez de fallar al promover una lectura
+        self._conexion = sqlite3.connect(ruta, timeout=30, isolation_level="IMMEDIATE",
+                                         detect_types=sqlite3.PARSE_DECLTYPES,
+                                         check_same_thread=False)
+        _registrar_funciones(self._conexion)
+        self.autocommit = False
+
+    def cursor(self):
+        return Cursor(self._conexion)
+
+    def execute(self, sql, *parametros):
+        return self.cursor().execute(sql, *parametros)
+
+    def commit(self):
+        self._conexion.commit()
+
+    def rollback(self):
+        self._conexion.rollback()
+
+    def close(self):
+        self._conexion.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        if tipo is None:
+            self.commit()
+        else:
+            self.rollback()
+
+
+def _solo_digitos(texto):
+    """Equivalente de la expresión de TelefonoNormalizado en sql/indices_pacientes.sql"""
+    return "".join(c for c in texto if "0" <= c <= "9")[:20] if texto is not None else None
+
+
+def _registrar_funciones(conexion):
+    conexion.create_function("solo_digitos", 1, _solo_digitos, deterministic=True)
+
+
+def configurar(ruta):
+    """Elegir el archivo de la base local y crear las tablas si no existen"""
+    global _ruta
+    _ruta = str(ruta)
+    conexion = sqlite3.connect(_ruta)
+    _registrar_funciones(conexion)
+    conexion.execute("PRAGMA journal_mode=WAL")
+    conexion.executescript(ESQUEMA)
+    conexion.close()
+
+
+def connect(cadena=None, **opciones):
+    """Mismo uso que pyodbc.connect; la cadena de conexión se ignora"""
+    if _ruta is None:
+        raise Error("Base local sin configurar; llame a base_local.configurar(ruta)")
+    return Conexion(_ruta)
+
+
+def instalar():
+    """Hacer que `import pyodbc` (y los módulos ya importados) usen esta base"""
+    modulo = sys.modules[__name__]
+    sys.modules["pyodbc"] = modulo
+    for otro in list(sys.modules.values()):
+        if getattr(otro, "pyodbc", None) is not None and otro is not modulo:
+            otro.pyodbc = modulo
+
+
+def sembrar(pacientes=10_000, medicos=100, dias=120, citas_por_dia=9.0, semilla=0):
+    """Llenar la base con generador_datos: citas en los `dias` días centrados
+    en hoy, con las de antes de ahora ya ocurridas. Depende de la fecha, así
+    que solo es reproducible dentro del mismo día. Devuelve el total de filas
+    por tabla."""
+    from generador_datos import DestinoPyodbc, Generador, volcar
+
+    desde = date.today() - timedelta(days=dias // 2)
+    generador = Generador(semilla, pacientes, medicos, desde, desde + timedelta(days=dias),
+                          referencia=datetime.now(), citas_por_dia=citas_por_dia)
+    conexion = connect()
+    totales = volcar(generador, DestinoPyodbc(conexion))
+    conexion.execute("ANALYZE")
+    conexion.close()
+    return totales
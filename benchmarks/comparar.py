@@ -0,0 +1,453 @@
+"""Comparar dos resultados de benchmarks.ejecutar y detectar regresiones.
+
+Uso: python -m benchmarks.comparar base.json nuevo.json [--umbral 10]
+         [--umbral-p95 20] [--umbral-sentencias 25] [--umbral-viajes 5]
+         [--alfa 0.05] [--remuestreos 2000] [--solo citas] [--todas] [--json]
+
+La máquina cambia entre una corrida y la siguiente (frecuencia, caché, otros
+procesos) y eso mueve todas las rutas a la vez; las repeticiones de una
+corrida van una detrás de otra y comparten ese estado. Por eso la unidad de
+la prueba es la corrida (cada archivo), no la repetición: hay que alternar
+corridas de cada versión, 4 o más de cada lado, y pasar los archivos
+separados por coma. Por ejemplo, contra la base local:
+    for i in 1 2 3 4 5; do
+        git checkout main; python -m benchmarks.ejecutar --salida /tmp/base$i.json
+        git checkout -; python -m benchmarks.ejecutar --salida /tmp/nuevo$i.json
+    done
+    python -m benchmarks.comparar /tmp/base1.json,...,/tmp/base5.json \
+        /tmp/nuevo1.json,...,/tmp/nuevo5.json
+
+Para cada ruta y nivel de concurrencia:
+  - Mann-Whitney (exacta) sobre el p50 y el p95 de cada corrida dice si el
+    cambio supera al ruido entre corridas; con 3 y 3 corridas nunca llega a
+    p < 0.05, hacen falta 4 o más de cada lado;
+  - un bootstrap que remuestrea primero corridas y después peticiones da el
+    intervalo del cociente nuevo/base de p50 y p95.
+Es regresión si el cambio es significativo (p < alfa e intervalo sin el 1)
+y además mayor que el umbral; si supera el umbral sin ser significativo
+queda como "dudoso". También es regresión tener más errores, más viajes a la
+base por petición o más tiempo total en la base por petición.
+
+Para cada sentencia de acceso_datos que está en las dos versiones se
+comparan los viajes por petición y el tiempo medio de cada corrida, con la
+misma prueba. Una sentencia nueva o eliminada no es regresión por sí sola
+(cambiar N consultas por una con IN las reemplaza): cuenta a través de los
+viajes y el tiempo en la base del endpoint.
+
+Sale con código 1 si hay alguna regresión y 2 si los archivos no sirven.
+"""
+import argparse
+import itertools
+import json
+import math
+import re
+import sys
+
+import numpy as np
+
+VERSION_RESULTADOS = 2
+
+# Parámetros de ejecutar que tienen que coincidir para que comparar tenga sentido
+PARAMETROS_COMPARABLES = ("peticiones", "pacientes", "medicos", "dias", "semilla")
+
+# Hasta cuántas asignaciones de rangos se enumeran para la prueba exacta
+MAX_EXACTO = 20_000
+
+REGRESION, MEJORA, DUDOSO, IGUAL = "regresión", "mejora", "dudoso", "igual"
+
+
+def _rangos(valores):
+    """Rangos con empates promediados"""
+    _, inversa, cuentas = np.unique(valores, return_inverse=True, return_counts=True)
+    acumulado = np.cumsum(cuentas)
+    return (acumulado - (cuentas - 1) / 2)[inversa], cuentas
+
+
+def mann_whitney(base, nuevo):
+    """(p bilateral, probabilidad de que un valor nuevo supere a uno base).
+
+    Exacta (enumerando las asignaciones de rangos) cuando son pocas, como con
+    un puñado de repeticiones; si no, aproximación normal con corrección por
+    empates y por continuidad."""
+    n1, n2 = len(base), len(nuevo)
+    if not n1 or not n2:
+        return None, None
+    n = n1 + n2
+    rangos, cuentas = _rangos(np.concatenate([np.asarray(base, float), np.asarray(nuevo, float)]))
+    minimo = n2 * (n2 + 1) / 2
+    u_nuevo = rangos[n1:].sum() - minimo
+    distancia = abs(u_nuevo - n1 * n2 / 2)
+    if math.comb(n, n2) <= MAX_EXACTO:
+        asignaciones = np.array(list(itertools.combinations(range(n), n2)))
+        u = rangos[asignaciones].sum(axis=1) - minimo
+        p = float(np.mean(np.abs(u - n1 * n2 / 2) >= distancia - 1e-9))
+        return p, u_nuevo / (n1 * n2)
+    empates = float((cuentas ** 3 - cuentas).sum())
+    varianza = n1 * n2 / 12 * ((n + 1) - empates / (n * (n - 1)))
+    if varianza <= 0:
+        return 1.0, 0.5
+    z = max(distancia - 0.5, 0) / math.sqrt(varianza)
+    return min(1.0, math.erfc(z / math.sqrt(2))), u_nuevo / (n1 * n2)
+
+
+def p_minimo(n1, n2):
+    """El p más chico que puede dar la prueba exacta con n1 y n2 corridas"""
+    return 2 / math.comb(n1 + n2, n2) if n1 and n2 else 1.0
+
+
+def remuestrear(corridas, percentiles, veces, rng):
+    """Percentiles de `veces` remuestras jerárquicas: corridas y dentro de
+    cada una, peticiones, ambas con reemplazo -> matriz veces x percentiles"""
+    series = [np.asarray(r, float) for r in corridas if len(r)]
+    k = len(series)
+    if len({len(s) for s in series}) == 1:
+        matriz = np.stack(series)
+        n = matriz.shape[1]
+        elegidas = rng.integers(k, size=(veces, k, 1))
+        muestras = matriz[elegidas, rng.integers(n, size=(veces, k, n))].reshape(veces, k * n)
+        return np.percentile(muestras, percentiles, axis=1).T
+    resultado = np.empty((veces, len(percentiles)))
+    for i in range(veces):
+        muestra = np.concatenate([s[rng.integers(len(s), size=len(s))]
+                                  for s in (series[j] for j in rng.integers(k, size=k))])
+        resultado[i] = np.percentile(muestra, percentiles)
+    return resultado
+
+
+def _veredicto(cambio, significativo, umbral, peor=True):
+    """`cambio` en %, positivo = más lento (o peor)"""
+    if cambio is None:
+        return IGUAL
+    if abs(cambio) <= umbral:
+        return IGUAL
+    if not significativo:
+        return DUDOSO
+    return REGRESION if (cambio > 0) == peor else MEJORA
+
+
+def _cambio(base, nuevo):
+    if base is None or nuevo is None:
+        return None
+    if base == 0:
+        return 0.0 if nuevo == 0 else math.inf
+    return round((nuevo / base - 1) * 100, 1)
+
+
+def _peor(*veredictos):
+    for veredicto in (REGRESION, DUDOSO, MEJORA):
+        if veredicto in veredictos:
+            return veredicto
+    return IGUAL
+
+
+def _viajes(repeticiones):
+    peticiones = sum(r["peticiones"] for r in repeticiones)
+    ejecuciones = sum(s["ejecuciones"] for r in repeticiones for s in r.get("sentencias", ()))
+    return round(ejecuciones / peticiones, 2) if peticiones else None
+
+
+def _corridas(repeticiones):
+    """Repeticiones agrupadas por corrida (el archivo del que vienen)"""
+    grupos = {}
+    for repeticion in repeticiones:
+        grupos.setdefault(repeticion.get("corrida", 0), []).append(repeticion)
+    return list(grupos.values())
+
+
+def _latencias(corrida):
+    return [l for r in corrida for l in r["latencias_ms"]]
+
+
+def _tiempo_base(corrida):
+    """Milisegundos en la base por petición en una corrida"""
+    peticiones = sum(r["peticiones"] for r in corrida)
+    total = sum(s["total_ms"] for r in corrida for s in r.get("sentencias", ()))
+    return total / peticiones if peticiones else None
+
+
+def _por_corrida(latencias, q):
+    return [float(np.percentile(r, q)) for r in latencias if len(r)]
+
+
+def comparar_endpoint(base, nuevo, opciones, rng):
+    corridas_base, corridas_nuevo = _corridas(base["repeticiones"]), _corridas(nuevo["repeticiones"])
+    latencias_base = [_latencias(c) for c in corridas_base]
+    latencias_nuevo = [_latencias(c) for c in corridas_nuevo]
+    todas_base = [l for r in latencias_base for l in r]
+    todas_nuevo = [l for r in latencias_nuevo for l in r]
+    # La unidad de la prueba es la corrida: las repeticiones de una misma
+    # corrida van seguidas, comparten el estado de la máquina y no son independientes
+    p_p50, superioridad = mann_whitney(_por_corrida(latencias_base, 50), _por_corrida(latencias_nuevo, 50))
+    p_p95, _ = mann_whitney(_por_corrida(latencias_base, 95), _por_corrida(latencias_nuevo, 95))
+
+    cocientes = (remuestrear(latencias_nuevo, (50, 95), opciones.remuestreos, rng)
+                 / np.maximum(remuestrear(latencias_base, (50, 95), opciones.remuestreos, rng), 1e-9))
+    colas = (opciones.alfa / 2 * 100, (1 - opciones.alfa / 2) * 100)
+    intervalo_p50, intervalo_p95 = (np.percentile(cocientes[:, i], colas) for i in (0, 1))
+
+    p50 = (float(np.percentile(todas_base, 50)), float(np.percentile(todas_nuevo, 50)))
+    p95 = (float(np.percentile(todas_base, 95)), float(np.percentile(todas_nuevo, 95)))
+    cambio_p50, cambio_p95 = _cambio(*p50), _cambio(*p95)
+    significativo_p50 = p_p50 is not None and p_p50 < opciones.alfa and (
+        intervalo_p50[0] > 1 or intervalo_p50[1] < 1)
+    significativo_p95 = p_p95 is not None and p_p95 < opciones.alfa and (
+        intervalo_p95[0] > 1 or intervalo_p95[1] < 1)
+
+    viajes = (_viajes(base["repeticiones"]), _viajes(nuevo["repeticiones"]))
+    errores = (sum(r["errores"] for r in base["repeticiones"]),
+               sum(r["errores"] for r in nuevo["repeticiones"]))
+    motivos = []
+    veredictos = [_veredicto(cambio_p50, significativo_p50, opciones.umbral),
+                  _veredicto(cambio_p95, significativo_p95, opciones.umbral_p95)]
+    if veredictos[0] == REGRESION:
+        motivos.append(f"p50 {cambio_p50:+}%")
+    if veredictos[1] == REGRESION:
+        motivos.append(f"p95 {cambio_p95:+}%")
+    if errores[1] > errores[0]:
+        veredictos.append(REGRESION)
+        motivos.append(f"errores {errores[0]} -> {errores[1]}")
+    if None not in viajes:
+        veredicto_viajes = _veredicto(_cambio(*viajes), True, opciones.umbral_viajes)
+        veredictos.append(veredicto_viajes)
+        if veredicto_viajes == REGRESION:
+            motivos.append(f"viajes {viajes[0]} -> {viajes[1]}")
+    # Tiempo total en la base por petición: junta las sentencias nuevas y las
+    # eliminadas con las que siguen, así un cambio de forma se juzga por el total
+    tiempos = ([_tiempo_base(c) for c in corridas_base], [_tiempo_base(c) for c in corridas_nuevo])
+    tiempo_base = tuple(round(float(np.mean(t)), 3) if t and None not in t else None for t in tiempos)
+    cambio_tiempo = _cambio(*tiempo_base)
+    if cambio_tiempo is not None:
+        p_tiempo = mann_whitney(*tiempos)[0]
+        veredicto_tiempo = _veredicto(cambio_tiempo, p_tiempo is not None and p_tiempo < opciones.alfa,
+                                      opciones.umbral_sentencias)
+        veredictos.append(veredicto_tiempo)
+        if veredicto_tiempo == REGRESION:
+            motivos.append(f"tiempo en la base {cambio_tiempo:+}%")
+
+    return {
+        "servicio": base["servicio"],
+        "endpoint": base["endpoint"],
+        "concurrencia": base["concurrencia"],
+        "veredicto": _peor(*veredictos),
+        "motivos": motivos,
+        "p50_ms": [round(v, 3) for v in p50],
+        "p95_ms": [round(v, 3) for v in p95],
+        "cambio_p50": cambio_p50,
+        "intervalo_p50": [round((v - 1) * 100, 1) for v in intervalo_p50],
+        "cambio_p95": cambio_p95,
+        "intervalo_p95": [round((v - 1) * 100, 1) for v in intervalo_p95],
+        "p": round(p_p50, 4) if p_p50 is not None else None,
+        "p_p95": round(p_p95, 4) if p_p95 is not None else None,
+        "prob_mas_lenta": round(superioridad, 3) if superioridad is not None else None,
+        "viajes_por_peticion": list(viajes),
+        "tiempo_base_ms": list(tiempo_base),
+        "corridas": [len(corridas_base), len(corridas_nuevo)],
+        "errores": list(errores),
+    }
+
+
+def _sentencias(repeticiones):
+    """{sentencia: {"ejecuciones", "total_ms", "medias": media de cada corrida}}"""
+    acumuladas = {}
+    for corrida in _corridas(repeticiones):
+        por_corrida = {}
+        for repeticion in corrida:
+            for s in repeticion.get("sentencias", ()):
+                c = por_corrida.setdefault(s["sentencia"], [0, 0.0])
+                c[0] += s["ejecuciones"]
+                c[1] += s["total_ms"]
+        for sentencia, (ejecuciones, total_ms) in por_corrida.items():
+            a = acumuladas.setdefault(sentencia, {"ejecuciones": 0, "total_ms": 0.0, "medias": []})
+            a["ejecuciones"] += ejecuciones
+            a["total_ms"] += total_ms
+            if ejecuciones:
+                a["medias"].append(total_ms / ejecuciones)
+    return acumuladas
+
+
+def comparar_sentencias(base, nuevo, opciones):
+    peticiones = (sum(r["peticiones"] for r in base["repeticiones"]),
+                  sum(r["peticiones"] for r in nuevo["repeticiones"]))
+    antes, despues = _sentencias(base["repeticiones"]), _sentencias(nuevo["repeticiones"])
+    comparaciones = []
+    for sentencia in sorted(set(antes) | set(despues)):
+        a, d = antes.get(sentencia), despues.get(sentencia)
+        viajes = tuple(round(x["ejecuciones"] / n, 2) if x and n else 0.0
+                       for x, n in ((a, peticiones[0]), (d, peticiones[1])))
+        media = tuple(round(x["total_ms"] / x["ejecuciones"], 3) if x and x["ejecuciones"] else None
+                      for x in (a, d))
+        p = mann_whitney(a["medias"], d["medias"])[0] if a and d else None
+        cambio = _cambio(*media)
+        motivos = []
+        if a and d:
+            veredicto_tiempo = _veredicto(cambio, p is not None and p < opciones.alfa,
+                                          opciones.umbral_sentencias)
+            veredicto_viajes = _veredicto(_cambio(*viajes), True, opciones.umbral_viajes)
+            if veredicto_tiempo == REGRESION:
+                motivos.append(f"media {cambio:+}%")
+            if veredicto_viajes == REGRESION:
+                motivos.append(f"viajes {viajes[0]} -> {viajes[1]}")
+            veredicto = _peor(veredicto_tiempo, veredicto_viajes)
+        else:
+            # Nueva o eliminada: se informa y se juzga con los totales del endpoint
+            veredicto = IGUAL
+        comparaciones.append({
+            "sentencia": sentencia,
+            "veredicto": veredicto,
+            "motivos": motivos,
+            "estado": "nueva" if a is None else "eliminada" if d is None else None,
+            "viajes_por_peticion": list(viajes),
+            "media_ms": list(media),
+            "cambio_media": cambio,
+            "p": round(p, 4) if p is not None else None,
+        })
+    return comparaciones
+
+
+def _leer(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as archivo:
+            informe = json.load(archivo)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"No se pudo leer {ruta}: {e}") from e
+    if informe.get("version") != VERSION_RESULTADOS:
+        raise SystemExit(f"{ruta} tiene versión {informe.get('version')}; se espera "
+                         f"{VERSION_RESULTADOS} (volver a correr benchmarks.ejecutar)")
+    return informe
+
+
+def cargar(rutas):
+    """Uno o varios archivos separados por coma, cada uno una corrida; las
+    repeticiones de la misma ruta y concurrencia se juntan marcadas con el
+    número de corrida"""
+    informes = [_leer(ruta) for ruta in rutas.split(",") if ruta]
+    if not informes:
+        raise SystemExit("No se indicó ningún archivo de resultados")
+    if len({i.get("commit") for i in informes}) > 1:
+        raise SystemExit(f"Los archivos de {rutas} son de commits distintos")
+    resultados = {}
+    for corrida, otro in enumerate(informes):
+        for r in otro["resultados"]:
+            clave = (r["servicio"], r["endpoint"], r["concurrencia"])
+            repeticiones = [dict(repeticion, corrida=corrida) for repeticion in r["repeticiones"]]
+            if clave in resultados:
+                resultados[clave]["repeticiones"].extend(repeticiones)
+            else:
+                resultados[clave] = dict(r, repeticiones=repeticiones)
+    informe = informes[0]
+    return dict(informe, resultados=list(resultados.values()), parametros=dict(
+        informe["parametros"], corridas=len(informes),
+        repeticiones=sum(i["parametros"]["repeticiones"] for i in informes)))
+
+
+def comparar(base, nuevo, opciones):
+    rng = np.random.default_rng(opciones.semilla)
+    avisos = [f"El parámetro {p} difiere: {base['parametros'].get(p)} -> {nuevo['parametros'].get(p)}"
+              for p in PARAMETROS_COMPARABLES
+              if base["parametros"].get(p) != nuevo["parametros"].get(p)]
+    corridas = (base["parametros"].get("corridas", 1), nuevo["parametros"].get("corridas", 1))
+    if p_minimo(*corridas) >= opciones.alfa:
+        avisos.append(f"Con {corridas[0]} y {corridas[1]} corridas ningún cambio de tiempo puede ser "
+                      f"significativo con alfa {opciones.alfa}: alternar 4 o más corridas de cada "
+                      f"versión y pasar los archivos separados por coma")
+    indice = {(r["servicio"], r["endpoint"], r["concurrencia"]): r for r in nuevo["resultados"]}
+    endpoints = []
+    for resultado in base["resultados"]:
+        clave = (resultado["servicio"], resultado["endpoint"], resultado["concurrencia"])
+        if opciones.solo and not re.search(opciones.solo, f"{clave[0]} {clave[1]}"):
+            continue
+        otro = indice.pop(clave, None)
+        if otro is None:
+            avisos.append(f"Falta en el nuevo: {clave[0]} {clave[1]} c={clave[2]}")
+            continue
+        comparacion = comparar_endpoint(resultado, otro, opciones, rng)
+        comparacion["sentencias"] = comparar_sentencias(resultado, otro, opciones)
+        if any(s["veredicto"] == REGRESION for s in comparacion["sentencias"]):
+            comparacion["veredicto"] = REGRESION
+            comparacion["motivos"].append("sentencias")
+        endpoints.append(comparacion)
+    for clave in indice:
+        if not opciones.solo or re.search(opciones.solo, f"{clave[0]} {clave[1]}"):
+            avisos.append(f"Solo en el nuevo: {clave[0]} {clave[1]} c={clave[2]}")
+    return {
+        "base": {"commit": base.get("commit"), "fecha": base.get("fecha")},
+        "nuevo": {"commit": nuevo.get("commit"), "fecha": nuevo.get("fecha")},
+        "umbrales": {"p50": opciones.umbral, "p95": opciones.umbral_p95,
+                     "sentencias": opciones.umbral_sentencias, "viajes": opciones.umbral_viajes,
+                     "alfa": opciones.alfa},
+        "regresiones": sum(1 for e in endpoints if e["veredicto"] == REGRESION),
+        "avisos": avisos,
+        "endpoints": endpoints,
+    }
+
+
+def _p(valor):
+    return "-" if valor is None else f"{valor:.3f}"
+
+
+def _intervalo(valores):
+    return f"[{valores[0]:+.1f}, {valores[1]:+.1f}]"
+
+
+def imprimir(informe, todas=False):
+    print(f"Base {informe['base']['commit'] or '?'} ({informe['base']['fecha']}) -> "
+          f"nuevo {informe['nuevo']['commit'] or '?'} ({informe['nuevo']['fecha']})")
+    for aviso in informe["avisos"]:
+        print(f"  aviso: {aviso}")
+    print(f"\n{'servicio':<9} {'endpoint':<45} {'c':>3} {'p50 ms':>17} {'cambio %':>24} "
+          f"{'p95 cambio %':>24} {'p':>7}  veredicto")
+    for e in informe["endpoints"]:
+        if not todas and e["veredicto"] == IGUAL:
+            continue
+        print(f"{e['servicio']:<9} {e['endpoint']:<45} {e['concurrencia']:>3} "
+              f"{e['p50_ms'][0]:>7.2f} -> {e['p50_ms'][1]:>7.2f} "
+              f"{e['cambio_p50']:>+7.1f} {_intervalo(e['intervalo_p50']):>16} "
+              f"{e['cambio_p95']:>+7.1f} {_intervalo(e['intervalo_p95']):>16} "
+              f"{_p(e['p']):>7}  {e['veredicto']}"
+              + (f" ({', '.join(e['motivos'])})" if e["motivos"] else ""))
+        for s in e["sentencias"]:
+            if not todas and s["veredicto"] == IGUAL:
+                continue
+            print(f"    {s['veredicto']:<10} viajes {s['viajes_por_peticion'][0]} -> "
+                  f"{s['viajes_por_peticion'][1]}  media {s['media_ms'][0]} -> {s['media_ms'][1]} ms"
+                  + (f"  ({s['estado']})" if s["estado"] else "") + f"  {s['sentencia'][:100]}")
+    iguales = sum(1 for e in informe["endpoints"] if e["veredicto"] == IGUAL)
+    if iguales and not todas:
+        print(f"({iguales} sin cambios; --todas para verlos)")
+    print(f"\n{informe['regresiones']} regresiones en {len(informe['endpoints'])} comparaciones")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparar dos resultados de benchmarks")
+    parser.add_argument("base", help="resultados de referencia (por ejemplo, de main); "
+                                     "varios archivos separados por coma")
+    parser.add_argument("nuevo", help="resultados a evaluar; varios archivos separados por coma")
+    parser.add_argument("--umbral", type=float, default=10, help="cambio mínimo de p50 en %% para regresión")
+    parser.add_argument("--umbral-p95", type=float, default=20, help="cambio mínimo de p95 en %%")
+    parser.add_argument("--umbral-sentencias", type=float, default=25,
+                        help="cambio mínimo del tiempo medio de una sentencia en %%")
+    parser.add_argument("--umbral-viajes", type=float, default=5,
+                        help="aumento tolerado de viajes a la base por petición en %%")
+    parser.add_argument("--alfa", type=float, default=0.05, help="nivel de significación")
+    parser.add_argument("--remuestreos", type=int, default=2000, help="remuestras del bootstrap")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--solo", help="expresión regular sobre 'servicio MÉTODO ruta'")
+    parser.add_argument("--todas", action="store_true", help="mostrar también lo que no cambió")
+    parser.add_argument("--json", action="store_true", help="imprimir la comparación como JSON")
+    args = parser.parse_args()
+
+    try:
+        base, nuevo = cargar(args.base), cargar(args.nuevo)
+    except SystemExit as e:
+        print(e, file=sys.stderr)
+        sys.exit(2)
+    informe = comparar(base, nuevo, args)
+    if args.json:
+        print(json.dumps(informe, indent=2, ensure_ascii=False))
+    else:
+        imprimir(informe, args.todas)
+    sys.exit(1 if informe["regresiones"] else 0)
+
+
+if __name__ == '__main__':
+    main()
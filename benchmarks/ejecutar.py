@@ -0,0 +1,220 @@
+"""Medir cada ruta de las tres APIs contra la base local.
+
+Uso: python -m benchmarks.ejecutar [--concurrencia 1,4,16] [--peticiones 200]
+         [--repeticiones 3] [--solo citas] [--salida benchmarks/resultados.json]
+
+Siembra una base SQLite con volúmenes realistas, hace que los módulos usen esa
+base en lugar de pyodbc y llama a las aplicaciones en proceso (cliente de
+pruebas de Flask y de Starlette), sin red de por medio. Para cada ruta y nivel
+de concurrencia repite la medición `--repeticiones` veces y guarda, además
+del resumen, las latencias de cada repetición y las estadísticas por sentencia
+de acceso_datos, para poder compararlas después.
+"""
+import argparse
+import importlib
+import json
+import os
+import platform
+import re
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from benchmarks import base_local
+from benchmarks.escenarios import ESCENARIOS, Muestras
+
+VERSION_RESULTADOS = 2
+
+
+def percentil(ordenados, p):
+    """Percentil por rango más cercano de una lista ya ordenada"""
+    if not ordenados:
+        return None
+    posicion = max(0, min(len(ordenados) - 1, -(-p * len(ordenados) // 100) - 1))
+    return ordenados[posicion]
+
+
+def resumir(latencias, segundos):
+    ordenados = sorted(latencias)
+    return {
+        "peticiones": len(latencias),
+        "segundos": round(segundos, 4),
+        "rps": round(len(latencias) / segundos, 1) if segundos else None,
+        "media_ms": round(sum(latencias) / len(latencias), 3) if latencias else None,
+        "p50_ms": percentil(ordenados, 50),
+        "p95_ms": percentil(ordenados, 95),
+        "p99_ms": percentil(ordenados, 99),
+    }
+
+
+class Clientes:
+    """Un cliente de pruebas por hilo y servicio; llamar devuelve (estado, json)"""
+
+    def __init__(self, aplicaciones):
+        self._aplicaciones = aplicaciones
+        self._locales = threading.local()
+
+    def _cliente(self, servicio):
+        clientes = self._locales.__dict__.setdefault("clientes", {})
+        if servicio not in clientes:
+            app = self._aplicaciones[servicio]
+            if hasattr(app, "test_client"):
+                clientes[servicio] = app.test_client()
+            else:
+                from fastapi.testclient import TestClient
+                clientes[servicio] = TestClient(app, raise_server_exceptions=False)
+        return clientes[servicio]
+
+    def llamar(self, servicio, metodo, ruta, cuerpo=None, leer=False):
+        cliente = self._cliente(servicio)
+        if hasattr(cliente, "open"):
+            respuesta = cliente.open(ruta, method=metodo, json=cuerpo)
+            return respuesta.status_code, respuesta.get_json(silent=True) if leer else None
+        respuesta = cliente.request(metodo, ruta, json=cuerpo)
+        return respuesta.status_code, respuesta.json() if leer else None
+
+    def de(self, servicio):
+        return lambda metodo, ruta, cuerpo=None: self.llamar(servicio, metodo, ruta, cuerpo, leer=True)
+
+
+def medir(clientes, escenario, peticiones, concurrencia):
+    """Lanzar las peticiones repartidas entre `concurrencia` hilos"""
+    latencias = [0.0] * len(peticiones)
+    estados = [0] * len(peticiones)
+    salida = threading.Barrier(concurrencia + 1)
+
+    def trabajador(primero):
+        salida.wait()
+        for i in range(primero, len(peticiones), concurrencia):
+            ruta, cuerpo = peticiones[i]
+            comienzo = time.perf_counter()
+            try:
+                estados[i] = clientes.llamar(escenario.servicio, escenario.metodo, ruta, cuerpo)[0]
+            except Exception:
+                estados[i] = 0
+            latencias[i] = round((time.perf_counter() - comienzo) * 1000, 3)
+
+    hilos = [threading.Thread(target=trabajador, args=(w,)) for w in range(concurrencia)]
+    for hilo in hilos:
+        hilo.start()
+    salida.wait()
+    comienzo = time.perf_counter()
+    for hilo in hilos:
+        hilo.join()
+    segundos = time.perf_counter() - comienzo
+
+    conteo = {}
+    for estado in estados:
+        conteo[str(estado)] = conteo.get(str(estado), 0) + 1
+    resultado = resumir(latencias, segundos)
+    resultado["estados"] = conteo
+    resultado["errores"] = sum(1 for estado in estados if estado == 0 or estado >= 500)
+    resultado["latencias_ms"] = latencias
+    return resultado
+
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _lista(texto):
+    return [int(valor) for valor in texto.split(",") if valor]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de las APIs contra la base local")
+    parser.add_argument("--concurrencia", default="1,4,16", help="hilos simultáneos, separados por coma")
+    parser.add_argument("--peticiones", type=int, default=200, help="peticiones por ruta, nivel y repetición")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--calentamiento", type=int, default=20, help="peticiones previas sin medir")
+    parser.add_argument("--solo", help="expresión regular sobre 'servicio MÉTODO ruta'")
+    parser.add_argument("--pacientes", type=int, default=10_000)
+    parser.add_argument("--medicos", type=int, default=100)
+    parser.add_argument("--dias", type=int, default=120, help="días de citas sembrados alrededor de hoy")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--base", help="archivo SQLite a usar (por defecto uno temporal y nuevo)")
+    parser.add_argument("--salida", default="benchmarks/resultados.json")
+    args = parser.parse_args()
+
+    directorio = None
+    if args.base:
+        ruta, nueva = args.base, not os.path.exists(args.base)
+    else:
+        directorio = tempfile.TemporaryDirectory()
+        ruta, nueva = os.path.join(directorio.name, "clinica.db"), True
+    base_local.configurar(ruta)
+    if nueva:
+        comienzo = time.perf_counter()
+        volumen = base_local.sembrar(args.pacientes, args.medicos, args.dias, semilla=args.semilla)
+        print(f"Base sembrada en {time.perf_counter() - comienzo:.1f}s: {volumen}")
+    base_local.instalar()
+    # La base local no tiene caché de planes que consultar
+    os.environ.setdefault("CLINICA_PLANES_POR_MINUTO", "0")
+    import acceso_datos
+    aplicaciones = {servicio: importlib.import_module(servicio).app
+                    for servicio in ("pacientes", "medicos", "citas")}
+    clientes = Clientes(aplicaciones)
+    muestras = Muestras(args.semilla)
+
+    escenarios = [e for e in ESCENARIOS
+                  if not args.solo or re.search(args.solo, f"{e.servicio} {e.nombre}")]
+    resultados = []
+    for numero, escenario in enumerate(escenarios):
+        cantidad = max(5, int(args.peticiones * escenario.fraccion))
+        llamar = clientes.de(escenario.servicio)
+        calentamiento = escenario.peticiones(muestras, max(1, int(args.calentamiento * escenario.fraccion)),
+                                             hash((args.semilla, numero, -1)), llamar)
+        medir(clientes, escenario, calentamiento, 1)
+        for concurrencia in _lista(args.concurrencia):
+            repeticiones = []
+            for repeticion in range(args.repeticiones):
+                semilla = hash((args.semilla, numero, concurrencia, repeticion))
+                peticiones = escenario.peticiones(muestras, cantidad, semilla, llamar)
+                acceso_datos.registro.reiniciar()
+                medicion = medir(clientes, escenario, peticiones, concurrencia)
+                medicion["sentencias"] = [
+                    {clave: valor for clave, valor in sentencia.items() if clave != "por_endpoint"}
+                    for sentencia in acceso_datos.registro.sentencias()
+                ]
+                medicion["viajes_por_peticion"] = round(
+                    sum(s["ejecuciones"] for s in medicion["sentencias"]) / len(peticiones), 2)
+                repeticiones.append(medicion)
+            todas = [latencia for r in repeticiones for latencia in r["latencias_ms"]]
+            resumen = resumir(todas, sum(r["segundos"] for r in repeticiones))
+            resumen["errores"] = sum(r["errores"] for r in repeticiones)
+            resultados.append({
+                "servicio": escenario.servicio,
+                "endpoint": escenario.nombre,
+                "concurrencia": concurrencia,
+                "resumen": resumen,
+                "repeticiones": repeticiones,
+            })
+            print(f"{escenario.servicio:<9} {escenario.nombre:<45} c={concurrencia:<3} "
+                  f"{resumen['rps']:>8} req/s  p50 {resumen['p50_ms']:>8.2f}  "
+                  f"p95 {resumen['p95_ms']:>8.2f}  p99 {resumen['p99_ms']:>8.2f} ms"
+                  + (f"  errores {resumen['errores']}" if resumen["errores"] else ""))
+
+    informe = {
+        "version": VERSION_RESULTADOS,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": vars(args),
+        "resultados": resultados,
+    }
+    with open(args.salida, "w", encoding="utf-8") as archivo:
+        json.dump(informe, archivo, ensure_ascii=False)
+    print(f"Resultados en {args.salida}")
+    if directorio is not None:
+        directorio.cleanup()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+"""Una petición representativa por cada ruta de pacientes, medicos y citas.
+
+Cada escenario sabe armar la i-ésima petición a partir de los datos de muestra
+(`Muestras`) y un generador aleatorio con semilla. Los que consumen recursos
+(bajas, confirmar o liberar una retención, fusionar) los crean antes con
+`preparar`, fuera del tiempo medido.
+"""
+import random
+from datetime import date, datetime, time, timedelta
+
+from benchmarks import base_local
+from generador_datos import ESPECIALIDADES, JORNADA, MINUTOS_CITA, MOTIVOS, NOMBRES
+
+# Las altas de citas caen más allá de los días sembrados, para que choquen poco
+DIAS_ALTAS = (120, 480)
+# Feriados y excepciones van a años que ninguna otra petición usa
+ANIO_FERIADOS = 2040
+
+
+def _muestra(rng, filas, limite):
+    return rng.sample(filas, min(limite, len(filas)))
+
+
+class Muestras:
+    """Filas reales de la base sembrada de las que salen los parámetros"""
+
+    def __init__(self, semilla=0, limite=2000):
+        rng = random.Random(semilla)
+        conn = base_local.connect()
+        cursor = conn.cursor()
+        cursor.execute("SELECT IdPaciente, Nombre, Apellido, FechaNacimiento, Sexo, Telefono, "
+                       "Direccion, Email FROM Pacientes")
+        self.pacientes = _muestra(rng, cursor.fetchall(), limite)
+        cursor.execute("SELECT * FROM Medicos")
+        self.medicos = cursor.fetchall()
+        cursor.execute("SELECT * FROM Citas WHERE FechaCita >= ? AND Estado <> 'Cancelada'",
+                       datetime.now())
+        self.citas = _muestra(rng, cursor.fetchall(), limite)
+        cursor.execute("SELECT DISTINCT date(FechaCita) AS Dia FROM Citas")
+        self.dias = [date.fromisoformat(fila.Dia) for fila in cursor.fetchall()]
+        conn.close()
+        self.palabras = sorted({p for motivo in MOTIVOS for p in motivo.lower().split() if len(p) > 3})
+
+
+def _hueco(muestras, rng):
+    """(IdMedico, FechaCita) dentro de la jornada, lejos de los días sembrados"""
+    dia = date.today() + timedelta(days=rng.randint(*DIAS_ALTAS))
+    while dia.weekday() >= 5:
+        dia += timedelta(days=1)
+    minuto = rng.randrange(0, 8 * 60, MINUTOS_CITA)
+    return rng.choice(muestras.medicos).IdMedico, datetime.combine(dia, time(8)) + timedelta(minutes=minuto)
+
+
+def _paciente_nuevo(rng):
+    nombre = rng.choice(NOMBRES)
+    return {
+        "Nombre": nombre, "Apellido": "Prueba Carga",
+        "FechaNacimiento": str(date(1950, 1, 1) + timedelta(days=rng.randrange(25000))),
+        "Sexo": rng.choice("FM"), "Telefono": f"699 {rng.randrange(1000):03d} {rng.randrange(1000):03d}",
+        "Direccion": "Calle Mayor 1", "Email": f"carga{rng.randrange(10**9)}@correo.es"
+    }
+
+
+def _paciente_modificado(muestras, rng):
+    fila = rng.choice(muestras.pacientes)
+    return (f"/api/pacientes/{fila.IdPaciente}", {
+        "Nombre": fila.Nombre, "Apellido": fila.Apellido,
+        "FechaNacimiento": str(fila.FechaNacimiento), "Sexo": fila.Sexo,
+        "Telefono": fila.Telefono, "Direccion": f"Calle {rng.choice(NOMBRES)} {rng.randrange(1, 200)}",
+        "Email": fila.Email})
+
+
+def _insertar(sql, filas):
+    """Insertar directamente en la base local; devuelve los ids generados"""
+    conn = base_local.connect()
+    cursor = conn.cursor()
+    ids = []
+    for fila in filas:
+        cursor.execute(sql, *fila)
+        ids.append(cursor.fetchone()[0])
+    conn.commit()
+    conn.close()
+    return ids
+
+
+class Escenario:
+    def __init__(self, servicio, metodo, ruta, peticion, preparar=None, fraccion=1.0):
+        self.servicio = servicio
+        self.metodo = metodo
+        self.ruta = ruta
+        self.nombre = f"{metodo} {ruta}"
+        self._peticion = peticion
+        self._preparar = preparar
+        # Las rutas que devuelven tablas enteras se miden con menos peticiones
+        self.fraccion = fraccion
+
+    def peticiones(self, muestras, cantidad, semilla, cliente):
+        """Lista de (ruta, cuerpo) ya resuelta, para no generar nada mientras se mide"""
+        rng = random.Random(semilla)
+        datos = (self._preparar(muestras, rng, cantidad, cliente) if self._preparar
+                 else [None] * cantidad)
+        return [self._peticion(muestras, rng, datos[i]) for i in range(cantidad)]
+
+
+# --- pacientes (Flask) -------------------------------------------------------
+
+def _preparar_pacientes(muestras, rng, cantidad, cliente):
+    return _insertar(
+        "INSERT INTO Pacientes (Nombre, Apellido, FechaNacimiento, Sexo, Telefono, Direccion, Email) "
+        "OUTPUT INSERTED.IdPaciente VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [tuple(_paciente_nuevo(rng).values()) for _ in range(cantidad)]
+    )
+
+
+def _preparar_fusiones(muestras, rng, cantidad, cliente):
+    ids = _preparar_pacientes(muestras, rng, 2 * cantidad, cliente)
+    return list(zip(ids[::2], ids[1::2]))
+
+
+PACIENTES = [
+    Escenario("pacientes", "GET", "/api/pacientes",
+              lambda m, rng, _: ("/api/pacientes", None), fraccion=0.1),
+    Escenario("pacientes", "GET", "/api/pacientes/autocompletar",
+              lambda m, rng, _: (f"/api/pacientes/autocompletar?q={rng.choice(m.pacientes).Apellido[:3]}", None)),
+    Escenario("pacientes", "GET", "/api/pacientes/telefono/<telefono>",
+              lambda m, rng, _: (f"/api/pacientes/telefono/{rng.choice(m.pacientes).Telefono}", None)),
+    Escenario("pacientes", "GET", "/api/pacientes/email/<email>",
+              lambda m, rng, _: (f"/api/pacientes/email/{rng.choice(m.pacientes).Email}", None)),
+    Escenario("pacientes", "GET", "/api/pacientes/<id>",
+              lambda m, rng, _: (f"/api/pacientes/{rng.choice(m.pacientes).IdPaciente}", None)),
+    Escenario("pacientes", "POST", "/api/pacientes",
+              lambda m, rng, _: ("/api/pacientes", [_paciente_nuevo(rng)])),
+    Escenario("pacientes", "PUT", "/api/pacientes/<id>",
+              lambda m, rng, _: _paciente_modificado(m, rng)),
+    Escenario("pacientes", "DELETE", "/api/pacientes/<id>",
+              lambda m, rng, id: (f"/api/pacientes/{id}", None), preparar=_preparar_pacientes),
+    Escenario("pacientes", "POST", "/api/pacientes/fusionar",
+              lambda m, rng, par: ("/api/pacientes/fusionar",
+                                   [{"IdSobreviviente": par[0], "IdDuplicado": par[1]}]),
+              preparar=_preparar_fusiones),
+]
+
+
+# --- medicos (FastAPI) -------------------------------------------------------
+
+def _medico_nuevo(rng):
+    return {"Nombre": rng.choice(NOMBRES), "Apellido": "Prueba Carga",
+            "Especialidad": rng.choice(list(ESPECIALIDADES)), "Telefono": "910000000",
+            "Email": f"carga{rng.randrange(10**9)}@clinica.es"}
+
+
+def _preparar_medicos(muestras, rng, cantidad, cliente):
+    return _insertar(
+        "INSERT INTO Medicos (Nombre, Apellido, Especialidad, Telefono, Email) "
+        "OUTPUT INSERTED.IdMedico VALUES (?, ?, ?, ?, ?)",
+        [tuple(_medico_nuevo(rng).values()) for _ in range(cantidad)]
+    )
+
+
+def _medico_modificado(muestras, rng):
+    fila = rng.choice(muestras.medicos)
+    return (f"/medicos/{fila.IdMedico}", {
+        "Nombre": fila.Nombre, "Apellido": fila.Apellido, "Especialidad": fila.Especialidad,
+        "Telefono": f"91{rng.randrange(10_000_000):07d}", "Email": fila.Email})
+
+
+def _fecha_feriado(rng):
+    return str(date(ANIO_FERIADOS, 1, 1) + timedelta(days=rng.randrange(3650)))
+
+
+def _dia_sembrado(m, rng):
+    return rng.choice(m.dias)
+
+
+PLANTILLA = {dia: JORNADA for dia in ("Lunes", "Martes", "Miercoles", "Jueves", "Viernes")}
+
+MEDICOS = [
+    Escenario("medicos", "POST", "/medicos",
+              lambda m, rng, _: ("/medicos", _medico_nuevo(rng))),
+    Escenario("medicos", "GET", "/medicos",
+              lambda m, rng, _: ("/medicos", None)),
+    Escenario("medicos", "GET", "/medicos/autocompletar",
+              lambda m, rng, _: (f"/medicos/autocompletar?q={rng.choice(list(ESPECIALIDADES))[:4]}", None)),
+    Escenario("medicos", "POST", "/medicos/feriados",
+              lambda m, rng, _: ("/medicos/feriados", {"Fecha": _fecha_feriado(rng), "Tramos": []})),
+    Escenario("medicos", "GET", "/medicos/{id}/horario",
+              lambda m, rng, _: (f"/medicos/{rng.choice(m.medicos).IdMedico}/horario", None)),
+    Escenario("medicos", "PUT", "/medicos/{id}/horario",
+              lambda m, rng, _: (f"/medicos/{rng.choice(m.medicos).IdMedico}/horario", PLANTILLA)),
+    Escenario("medicos", "POST", "/medicos/{id}/excepciones",
+              lambda m, rng, _: (f"/medicos/{rng.choice(m.medicos).IdMedico}/excepciones",
+                                 {"Fecha": _fecha_feriado(rng), "Tramos": [("09:00", "13:00")]})),
+    Escenario("medicos", "GET", "/medicos/{id}/disponible",
+              lambda m, rng, _: (f"/medicos/{rng.choice(m.medicos).IdMedico}/disponible"
+                                 f"?instante={_dia_sembrado(m, rng)}T{rng.randrange(7, 18):02d}:00:00", None)),
+    Escenario("medicos", "GET", "/medicos/{id}/minutos-libres",
+              lambda m, rng, _: (f"/medicos/{rng.choice(m.medicos).IdMedico}/minutos-libres"
+                                 f"?fecha={_dia_sembrado(m, rng)}", None)),
+    Escenario("medicos", "PUT", "/medicos/{id}",
+              lambda m, rng, _: _medico_modificado(m, rng)),
+    Escenario("medicos", "DELETE", "/medicos/{id}",
+              lambda m, rng, id: (f"/medicos/{id}", None), preparar=_preparar_medicos),
+]
+
+
+# --- citas (FastAPI, routers/cita_router.py) ---------------------------------
+
+def _cita_nueva(m, rng):
+    id_medico, fecha = _hueco(m, rng)
+    return {"IdPaciente": rng.choice(m.pacientes).IdPaciente, "IdMedico": id_medico,
+            "FechaCita": fecha.isoformat(), "Motivo": rng.choice(MOTIVOS), "Estado": "Pendiente"}
+
+
+def _preparar_citas(muestras, rng, cantidad, cliente):
+    filas = []
+    for _ in range(cantidad):
+        cita = _cita_nueva(muestras, rng)
+        filas.append((cita["IdPaciente"], cita["IdMedico"], datetime.fromisoformat(cita["FechaCita"]),
+                      cita["Motivo"], cita["Estado"]))
+    return _insertar("INSERT INTO Citas (IdPaciente, IdMedico, FechaCita, Motivo, Estado) "
+                     "OUTPUT INSERTED.IdCita VALUES (?, ?, ?, ?, ?)", filas)
+
+
+def _retencion_nueva(muestras, rng, minutos):
+    id_medico, fecha = _hueco(muestras, rng)
+    return {"IdPaciente": rng.choice(muestras.pacientes).IdPaciente, "IdMedico": id_medico,
+            "FechaCita": fecha.isoformat(), "Minutos": minutos}
+
+
+def _preparar_retenciones(muestras, rng, cantidad, cliente):
+    """Retenciones reales creadas por la API (viven en memoria del proceso)"""
+    ids, intentos = [], 0
+    while len(ids) < cantidad and intentos < 5 * cantidad:
+        intentos += 1
+        estado, cuerpo = cliente("POST", "/citas/holds", _retencion_nueva(muestras, rng, 60))
+        if estado == 200:
+            ids.append(cuerpo["IdRetencion"])
+    return ids + ["inexistente"] * (cantidad - len(ids))
+
+
+def _preparar_series(muestras, rng, cantidad, cliente):
+    filas = []
+    for _ in range(min(cantidad, 50)):
+        id_medico, fecha = _hueco(muestras, rng)
+        filas.append((rng.choice(muestras.pacientes).IdPaciente, id_medico, fecha, "SEMANAL", 1, 52,
+                      None, rng.choice(MOTIVOS)))
+    ids = _insertar("INSERT INTO SeriesCitas (IdPaciente, IdMedico, Inicio, Frecuencia, Intervalo, "
+                    "Cantidad, Hasta, Motivo) OUTPUT INSERTED.IdSerie VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    filas)
+    return [ids[i % len(ids)] for i in range(cantidad)]
+
+
+def _preparar_espera(muestras, rng, cantidad, cliente):
+    return _insertar(
+        "INSERT INTO ListaEspera (IdPaciente, IdMedico, Prioridad) OUTPUT INSERTED.IdEspera "
+        "VALUES (?, ?, ?)",
+        [(rng.choice(muestras.pacientes).IdPaciente, rng.choice(muestras.medicos).IdMedico,
+          rng.randint(1, 5)) for _ in range(cantidad)]
+    )
+
+
+def _serie_nueva(m, rng):
+    id_medico, fecha = _hueco(m, rng)
+    return {"IdPaciente": rng.choice(m.pacientes).IdPaciente, "IdMedico": id_medico,
+            "Inicio": fecha.isoformat(), "Frecuencia": "SEMANAL", "Cantidad": 4,
+            "Motivo": rng.choice(MOTIVOS)}
+
+
+def _reprogramacion(m, rng):
+    dia = datetime.combine(rng.choice([d for d in m.dias if d >= date.today()] or m.dias), time())
+    return {"IdMedico": rng.choice(m.medicos).IdMedico, "Desde": dia.isoformat(),
+            "Hasta": (dia + timedelta(days=1)).isoformat(), "Aplicar": False}
+
+
+def _cita_modificada(m, rng):
+    fila = rng.choice(m.citas)
+    return (f"/citas/{fila.IdCita}", {
+        "IdPaciente": fila.IdPaciente, "IdMedico": fila.IdMedico, "FechaCita": fila.FechaCita.isoformat(),
+        "Motivo": rng.choice(MOTIVOS), "Estado": fila.Estado})
+
+
+CITAS = [
+    Escenario("citas", "POST", "/citas/",
+              lambda m, rng, _: ("/citas/", _cita_nueva(m, rng))),
+    Escenario("citas", "GET", "/citas/",
+              lambda m, rng, _: ("/citas/", None), fraccion=0.05),
+    Escenario("citas", "GET", "/citas/{id}",
+              lambda m, rng, _: (f"/citas/{rng.choice(m.citas).IdCita}", None)),
+    Escenario("citas", "PUT", "/citas/{id}",
+              lambda m, rng, _: _cita_modificada(m, rng)),
+    Escenario("citas", "DELETE", "/citas/{id}",
+              lambda m, rng, id: (f"/citas/{id}", None), preparar=_preparar_citas),
+    Escenario("citas", "POST", "/citas/holds",
+              lambda m, rng, _: ("/citas/holds", _retencion_nueva(m, rng, 5))),
+    Escenario("citas", "POST", "/citas/holds/{id_retencion}/confirmar",
+              lambda m, rng, id: (f"/citas/holds/{id}/confirmar", {"Motivo": rng.choice(MOTIVOS)}),
+              preparar=_preparar_retenciones),
+    Escenario("citas", "DELETE", "/citas/holds/{id_retencion}",
+              lambda m, rng, id: (f"/citas/holds/{id}", None), preparar=_preparar_retenciones),
+    Escenario("citas", "POST", "/citas/series",
+              lambda m, rng, _: ("/citas/series", _serie_nueva(m, rng))),
+    Escenario("citas", "GET", "/citas/series/{id_serie}/ocurrencias",
+              lambda m, rng, id: (f"/citas/series/{id}/ocurrencias", None), preparar=_preparar_series),
+    Escenario("citas", "POST", "/citas/reprogramar",
+              lambda m, rng, _: ("/citas/reprogramar", _reprogramacion(m, rng)), fraccion=0.25),
+    Escenario("citas", "POST", "/citas/espera",
+              lambda m, rng, _: ("/citas/espera", {
+                  "IdPaciente": rng.choice(m.pacientes).IdPaciente,
+                  "Especialidad": rng.choice(list(ESPECIALIDADES)), "Prioridad": rng.randint(1, 5)})),
+    Escenario("citas", "GET", "/citas/espera/{id_espera}",
+              lambda m, rng, id: (f"/citas/espera/{id}", None), preparar=_preparar_espera),
+    Escenario("citas", "DELETE", "/citas/espera/{id_espera}",
+              lambda m, rng, id: (f"/citas/espera/{id}", None), preparar=_preparar_espera),
+    Escenario("citas", "GET", "/citas/agenda/{id_medico}",
+              lambda m, rng, _: (f"/citas/agenda/{rng.choice(m.medicos).IdMedico}"
+                                 f"?fecha={_dia_sembrado(m, rng)}", None)),
+    Escenario("citas", "GET", "/citas/disponibilidad",
+              lambda m, rng, _: (f"/citas/disponibilidad?medico={rng.choice(m.medicos).IdMedico}"
+                                 f"&fecha={_dia_sembrado(m, rng)}", None)),
+    Escenario("citas", "GET", "/citas/buscar",
+              lambda m, rng, _: (f"/citas/buscar?q={rng.choice(m.palabras)}", None)),
+]
+
+ESCENARIOS = PACIENTES + MEDICOS + CITAS
@@ -0,0 +1,95 @@
+import re
+import threading
+
+from texto import normalizar
+
+PALABRAS_VACIAS = frozenset("""
+    a al algo algun alguna algunas alguno algunos ante antes aun bajo bien cada como con
+    contra cual cuando de del desde donde dos durante e el ella ellas ellos en entre era
+    es esa esas ese eso esos esta estas este esto estos fue ha hace hacia hasta hay la las
+    le les lo los mas me mi muy nada ni no nos o otra otro para pero poco por porque que
+    quien se segun ser si sin sobre su sus tambien tan te tiene toda todo tras tu un una
+    uno unos usted y ya
+""".split())
+
+# Sufijos ordenados de más largo a más corto; es una versión reducida del
+# algoritmo Snowball para español, suficiente para agrupar singular/plural,
+# género y las terminaciones más comunes de los motivos de consulta.
+SUFIJOS = (
+    "amientos", "imientos", "aciones", "uciones", "amiento", "imiento", "adoras",
+    "adores", "ancias", "encias", "logias", "mente", "acion", "ucion", "ancia",
+    "encia", "logia", "adora", "ador", "ante", "anza", "ibles", "ables", "ible",
+    "able", "icos", "icas", "osos", "osas", "ados", "adas", "idos", "idas", "ico",
+    "ica", "oso", "osa", "ado", "ada", "ido", "ida", "ando", "iendo", "ar", "er",
+    "ir", "es", "os", "as", "s", "o", "a", "e",
+)
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def raiz(palabra):
+    """Quitar el sufijo más largo que deje al menos tres letras"""
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= 3:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def terminos(texto):
+    return [raiz(p) for p in TOKEN.findall(normalizar(texto)) if p not in PALABRAS_VACIAS]
+
+
+class IndiceInvertido:
+    """Índice invertido en memoria sobre el Motivo de las citas"""
+
+    def __init__(self):
+        self._postings = {}
+        self._documentos = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._documentos)
+
+    def agregar(self, id_cita, id_medico, fecha, motivo):
+        claves = frozenset(terminos(motivo))
+        with self._lock:
+            self._quitar(id_cita)
+            self._documentos[id_cita] = (id_medico, fecha, claves)
+            for clave in claves:
+                self._postings.setdefault(clave, set()).add(id_cita)
+
+    def eliminar(self, id_cita):
+        with self._lock:
+            self._quitar(id_cita)
+
+    def _quitar(self, id_cita):
+        documento = self._documentos.pop(id_cita, None)
+        if documento is None:
+            return
+        for clave in documento[2]:
+            ids = self._postings[clave]
+            ids.discard(id_cita)
+            if not ids:
+                del self._postings[clave]
+
+    def buscar(self, consulta, desde=None, hasta=None, id_medico=None, pagina=1, tamano=20):
+        """Devuelve (total, ids de la página) ordenados por fecha descendente"""
+        claves = set(terminos(consulta))
+        if not claves:
+            return 0, []
+        with self._lock:
+            listas = sorted((self._postings.get(c, set()) for c in claves), key=len)
+            ids = set(listas[0])
+            for lista in listas[1:]:
+                ids &= lista
+            encontrados = []
+            for id_cita in ids:
+                medico, fecha, _ = self._documentos[id_cita]
+                if id_medico is not None and medico != id_medico:
+                    continue
+                if (desde is not None and fecha < desde) or (hasta is not None and fecha > hasta):
+                    continue
+                encontrados.append((fecha, id_cita))
+        encontrados.sort(reverse=True)
+        inicio = (pagina - 1) * tamano
+        return len(encontrados), [id_cita for _, id_cita in encontrados[inicio:inicio + tamano]]
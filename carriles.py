@@ -0,0 +1,33 @@
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CarrilesReserva:
+    """Reparte las escrituras de citas en carriles de un solo hilo según IdMedico.
+
+    Todas las reservas de un mismo médico caen siempre en el mismo carril y se
+    atienden en orden de llegada, de modo que la comprobación de choques y el
+    INSERT nunca compiten entre sí; médicos distintos avanzan en paralelo en
+    carriles distintos. Las funciones enviadas no deben esperar a otro carril.
+    """
+
+    def __init__(self, cantidad=16):
+        self._carriles = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"carril-{i}")
+            for i in range(cantidad)
+        ]
+
+    def carril(self, id_medico):
+        return self._carriles[id_medico % len(self._carriles)]
+
+    def ejecutar(self, id_medico, funcion, *args):
+        """Ejecutar funcion(*args) en el carril del médico y esperar el resultado.
+
+        Corre con una copia del contexto de quien llama, para que el endpoint,
+        los viajes y la traza de la petición sigan valiendo dentro del carril."""
+        contexto = contextvars.copy_context()
+        return self.carril(id_medico).submit(contexto.run, funcion, *args).result()
+
+    def cerrar(self):
+        for carril in self._carriles:
+            carril.shutdown(wait=True)
@@ -0,0 +1,15 @@
+from fastapi import FastAPI
+
+from acceso_datos import conectar_sin_medir
+from metricas import instrumentar_fastapi
+from perfilador import instrumentar_fastapi as perfilar_fastapi
+from planes import instrumentar_fastapi as planes_fastapi
+from trazas import instrumentar_fastapi as trazar_fastapi
+from routers import cita_router
+
+app = FastAPI()
+instrumentar_fastapi(app)
+trazar_fastapi(app)
+perfilar_fastapi(app)
+planes_fastapi(app, lambda: conectar_sin_medir(cita_router.connection_string))
+app.include_router(cita_router.router)
@@ -0,0 +1,349 @@
+"""Diagnóstico de la conexión a SQL Server y sugerencias para la cadena de conexión.
+
+Uso: python diagnostico_conexion.py [--cadena "..."] [--hilos 1,4,16,32]
+         [--tamanos 1,10,100,1000,5000] [--paquetes 4096,8192,16384,32767]
+         [--consulta "SELECT * FROM Citas"] [--filas 100000] [--json]
+
+Mide, en este orden:
+  - conectar: la primera conexión (en frío), las siguientes con el pooling de
+    ODBC (como lo usan las APIs) y, en un proceso aparte, sin pooling;
+  - ida y vuelta: histograma de latencias de SELECT 1 sobre una conexión;
+  - lectura: filas/s y MB/s de `--consulta` con distintos tamaños de
+    fetchmany y con distintos `Packet Size` en la cadena de conexión;
+  - pool: N hilos a la vez abriendo conexión, haciendo SELECT 1 y cerrándola.
+
+Al final imprime qué cambiar (o dejar como está) en la cadena de conexión y
+en el código que lee resultados.
+"""
+import argparse
+import json
+import multiprocessing
+import statistics
+import threading
+import time
+
+import pyodbc
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=MANUEL\\MSSQL2022;"
+    "DATABASE=ClinicaMedica;"
+    "Trusted_Connection=yes;"
+)
+
+LIMITES_MS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 25, 50, 100, 250, 1000)
+PAQUETE_POR_OMISION = 4096
+
+
+def percentiles(valores):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return {}
+
+    def p(q):
+        return round(ordenados[min(len(ordenados) - 1, int(q / 100 * len(ordenados)))], 3)
+
+    return {"n": len(ordenados), "min": round(ordenados[0], 3), "p50": p(50), "p90": p(90),
+            "p99": p(99), "max": round(ordenados[-1], 3), "media": round(statistics.fmean(ordenados), 3)}
+
+
+def histograma(valores):
+    """{límite: cuenta}; el último cubo junta todo lo que pasa del mayor límite"""
+    cubos = {str(limite): 0 for limite in LIMITES_MS}
+    cubos[f">{LIMITES_MS[-1]}"] = 0
+    for valor in valores:
+        for limite in LIMITES_MS:
+            if valor <= limite:
+                cubos[str(limite)] += 1
+                break
+        else:
+            cubos[f">{LIMITES_MS[-1]}"] += 1
+    return cubos
+
+
+def _ms(comienzo):
+    return (time.perf_counter() - comienzo) * 1000
+
+
+def _con_paquete(cadena, tamano):
+    return cadena.rstrip(";") + f";Packet Size={tamano};"
+
+
+def medir_conexion(cadena, veces):
+    """Primera conexión del proceso y las siguientes, ya servidas por el pool"""
+    tiempos = []
+    for _ in range(veces):
+        comienzo = time.perf_counter()
+        conn = pyodbc.connect(cadena)
+        tiempos.append(_ms(comienzo))
+        conn.close()
+    return {"primera_ms": round(tiempos[0], 3), "pool": percentiles(tiempos[1:])}
+
+
+def _conectar_sin_pool(cadena, veces):
+    # pooling se lee al crear el entorno ODBC: por eso corre en un proceso nuevo
+    pyodbc.pooling = False
+    tiempos = []
+    for _ in range(veces):
+        comienzo = time.perf_counter()
+        conn = pyodbc.connect(cadena)
+        tiempos.append(_ms(comienzo))
+        conn.close()
+    return tiempos
+
+
+def medir_sin_pool(cadena, veces):
+    try:
+        with multiprocessing.get_context("spawn").Pool(1) as proceso:
+            return percentiles(proceso.apply_async(_conectar_sin_pool, (cadena, veces)).get(timeout=60))
+    except Exception as e:
+        return {"error": str(e) or type(e).__name__}
+
+
+def medir_ida_y_vuelta(conn, veces):
+    cursor = conn.cursor()
+    tiempos = []
+    for _ in range(veces):
+        comienzo = time.perf_counter()
+        cursor.execute("SELECT 1")
+        cursor.fetchone()
+        tiempos.append(_ms(comienzo))
+    cursor.close()
+    return {"latencia": percentiles(tiempos), "histograma_ms": histograma(tiempos)}
+
+
+def _tamano_fila(fila):
+    return sum(len(v) if isinstance(v, (str, bytes, bytearray)) else 8 for v in fila if v is not None)
+
+
+def medir_lectura(conn, consulta, filas, tamano):
+    """Leer hasta `filas` filas de a `tamano`; el tiempo incluye el execute"""
+    cursor = conn.cursor()
+    leidas = bytes_leidos = 0
+    comienzo = time.perf_counter()
+    cursor.execute(consulta)
+    primera_ms = None
+    while leidas < filas:
+        lote = cursor.fetchmany(min(tamano, filas - leidas))
+        if primera_ms is None:
+            primera_ms = _ms(comienzo)
+        if not lote:
+            break
+        leidas += len(lote)
+        bytes_leidos += sum(_tamano_fila(f) for f in lote)
+    segundos = time.perf_counter() - comienzo
+    cursor.close()
+    return {
+        "tamano": tamano,
+        "filas": leidas,
+        "segundos": round(segundos, 4),
+        "filas_por_s": round(leidas / segundos) if segundos else None,
+        "mb_por_s": round(bytes_leidos / segundos / 1e6, 2) if segundos else None,
+        "primera_fila_ms": round(primera_ms or 0, 3),
+    }
+
+
+def medir_paquetes(cadena, consulta, filas, tamano, paquetes):
+    resultados = []
+    for paquete in paquetes:
+        try:
+            conn = pyodbc.connect(_con_paquete(cadena, paquete))
+        except pyodbc.Error as e:
+            resultados.append({"paquete": paquete, "error": str(e)})
+            continue
+        medir_lectura(conn, consulta, min(filas, 1000), tamano)  # calentar caché y plan
+        resultado = medir_lectura(conn, consulta, filas, tamano)
+        resultado["paquete"] = paquete
+        resultados.append(resultado)
+        conn.close()
+    return resultados
+
+
+def medir_pool(cadena, hilos, segundos):
+    """Cada hilo repite conectar + SELECT 1 + cerrar durante `segundos`"""
+    esperas, errores = [], []
+    lock = threading.Lock()
+    largada = threading.Barrier(hilos + 1)
+    fin = [0.0]
+
+    def trabajador():
+        propias, fallas = [], []
+        largada.wait()
+        while time.perf_counter() < fin[0]:
+            comienzo = time.perf_counter()
+            try:
+                conn = pyodbc.connect(cadena)
+                propias.append(_ms(comienzo))
+                conn.execute("SELECT 1").fetchone()
+                conn.close()
+            except pyodbc.Error as e:
+                fallas.append(str(e))
+        with lock:
+            esperas.extend(propias)
+            errores.extend(fallas)
+
+    trabajadores = [threading.Thread(target=trabajador) for _ in range(hilos)]
+    for hilo in trabajadores:
+        hilo.start()
+    fin[0] = time.perf_counter() + segundos
+    largada.wait()
+    for hilo in trabajadores:
+        hilo.join()
+    return {
+        "hilos": hilos,
+        "operaciones_por_s": round(len(esperas) / segundos, 1),
+        "conectar": percentiles(esperas),
+        "errores": len(errores),
+        "primer_error": errores[0] if errores else None,
+    }
+
+
+def recomendaciones(informe):
+    consejos = []
+    conexion = informe["conexion"]
+    pool_p50 = conexion["pool"].get("p50")
+    sin_pool_p50 = (informe.get("sin_pool") or {}).get("p50")
+    if pool_p50 is not None and sin_pool_p50:
+        if sin_pool_p50 > 3 * pool_p50:
+            consejos.append(f"Conectar sin pool cuesta {sin_pool_p50} ms y con pool {pool_p50} ms: "
+                            "mantener pyodbc.pooling = True (el valor por omisión) y no abrir "
+                            "conexiones fuera de acceso_datos.conectar.")
+        else:
+            consejos.append(f"El pool casi no ahorra ({pool_p50} frente a {sin_pool_p50} ms): "
+                            "revisar que el driver tenga el pooling de ODBC activado.")
+
+    ida = informe["ida_y_vuelta"]["latencia"]
+    if ida.get("p50") is not None:
+        if ida["p50"] >= 1:
+            consejos.append(f"Cada ida y vuelta cuesta {ida['p50']} ms (p50): la red domina; "
+                            "juntar consultas (IN, JOIN, executemany con fast_executemany) y "
+                            "vigilar clinica_db_viajes_por_peticion.")
+        if ida.get("p99", 0) > 10 * max(ida["p50"], 0.01):
+            consejos.append(f"p99 de SELECT 1 = {ida['p99']} ms, más de 10 veces el p50: hay "
+                            "pausas en la red o en el servidor; repetir el diagnóstico en otro horario.")
+
+    lecturas = [l for l in informe["lectura"] if l.get("filas_por_s")]
+    if lecturas:
+        mejor = max(lecturas, key=lambda l: l["filas_por_s"])
+        peor_uno = next((l for l in lecturas if l["tamano"] == 1), None)
+        consejos.append(f"Leer de a {mejor['tamano']} filas da {mejor['filas_por_s']} filas/s"
+                        + (f" ({mejor['filas_por_s'] / peor_uno['filas_por_s']:.1f} veces fetchone)"
+                           if peor_uno and peor_uno["filas_por_s"] else "")
+                        + f": usar fetchmany({mejor['tamano']}) o cursor.arraysize = "
+                          f"{mejor['tamano']} en las lecturas grandes.")
+
+    paquetes = [p for p in informe["paquetes"] if p.get("filas_por_s")]
+    base = next((p for p in paquetes if p["paquete"] == PAQUETE_POR_OMISION), None)
+    if paquetes and base:
+        mejor = max(paquetes, key=lambda p: p["filas_por_s"])
+        if mejor["paquete"] != PAQUETE_POR_OMISION and mejor["filas_por_s"] > 1.1 * base["filas_por_s"]:
+            consejos.append(f"Agregar 'Packet Size={mejor['paquete']};' a la cadena de conexión: "
+                            f"{mejor['filas_por_s']} frente a {base['filas_por_s']} filas/s con "
+                            f"{PAQUETE_POR_OMISION}.")
+        else:
+            consejos.append(f"Packet Size: el valor por omisión ({PAQUETE_POR_OMISION}) rinde igual "
+                            "que los mayores; no hace falta cambiarlo.")
+    for paquete in informe["paquetes"]:
+        if paquete.get("error"):
+            consejos.append(f"El servidor no aceptó Packet Size={paquete['paquete']}: {paquete['error']}")
+
+    pool = [p for p in informe["pool"] if p["conectar"]]
+    if len(pool) >= 2:
+        uno, mayor = pool[0], pool[-1]
+        if mayor["conectar"]["p99"] > 5 * max(uno["conectar"]["p99"], 0.01):
+            consejos.append(f"Con {mayor['hilos']} hilos conectar llega a {mayor['conectar']['p99']} ms "
+                            f"(p99) frente a {uno['conectar']['p99']} ms con {uno['hilos']}: limitar los "
+                            "workers por proceso o repartir la carga en más procesos.")
+        if mayor["operaciones_por_s"] < 1.2 * uno["operaciones_por_s"]:
+            consejos.append(f"Más hilos no dan más operaciones ({uno['operaciones_por_s']}/s con "
+                            f"{uno['hilos']}, {mayor['operaciones_por_s']}/s con {mayor['hilos']}): "
+                            "el cuello está en el servidor o en la red, no en el pool.")
+    if any(p["errores"] for p in informe["pool"]):
+        consejos.append("Hubo errores al conectar con muchos hilos: revisar el límite de "
+                        "conexiones del servidor y el tiempo de espera (Connection Timeout).")
+    return consejos
+
+
+def diagnosticar(cadena, hilos, tamanos, paquetes, consulta, filas, veces=50, segundos_pool=3):
+    informe = {"cadena": cadena}
+    conexion = medir_conexion(cadena, veces)
+    informe["conexion"] = conexion
+    informe["sin_pool"] = medir_sin_pool(cadena, max(5, veces // 5))
+
+    conn = pyodbc.connect(cadena)
+    try:
+        informe["servidor"] = str(conn.execute("SELECT @@VERSION").fetchone()[0]).splitlines()[0]
+    except pyodbc.Error:
+        informe["servidor"] = None
+    informe["ida_y_vuelta"] = medir_ida_y_vuelta(conn, veces * 10)
+    medir_lectura(conn, consulta, min(filas, 1000), 100)  # calentar
+    informe["lectura"] = [medir_lectura(conn, consulta, filas, tamano) for tamano in tamanos]
+    conn.close()
+
+    tamano_paquetes = max(tamanos)
+    informe["paquetes"] = medir_paquetes(cadena, consulta, filas, tamano_paquetes, paquetes)
+    informe["pool"] = [medir_pool(cadena, n, segundos_pool) for n in hilos]
+    informe["recomendaciones"] = recomendaciones(informe)
+    return informe
+
+
+def imprimir(informe):
+    conexion = informe["conexion"]
+    print(f"Servidor: {informe['servidor'] or 'desconocido'}")
+    sin_pool = informe["sin_pool"]
+    print(f"\nConectar: primera {conexion['primera_ms']} ms; con pool p50 {conexion['pool'].get('p50')} "
+          f"p99 {conexion['pool'].get('p99')} ms; sin pool "
+          + (f"error: {sin_pool['error']}" if "error" in sin_pool else
+             f"p50 {sin_pool.get('p50')} p99 {sin_pool.get('p99')} ms"))
+    ida = informe["ida_y_vuelta"]
+    print(f"\nSELECT 1: p50 {ida['latencia']['p50']}  p90 {ida['latencia']['p90']}  "
+          f"p99 {ida['latencia']['p99']}  max {ida['latencia']['max']} ms")
+    mayor = max(ida["histograma_ms"].values()) or 1
+    for limite, cuenta in ida["histograma_ms"].items():
+        etiqueta = limite if limite.startswith(">") else f"<={limite}"
+        print(f"  {etiqueta:>8} ms {cuenta:>6} {'#' * round(40 * cuenta / mayor)}")
+    print("\nfetchmany   filas/s     MB/s  primera fila")
+    for l in informe["lectura"]:
+        print(f"  {l['tamano']:>7}  {l['filas_por_s'] or 0:>8}  {l['mb_por_s'] or 0:>7}  {l['primera_fila_ms']:>8} ms")
+    print("\nPacket Size filas/s     MB/s")
+    for p in informe["paquetes"]:
+        if p.get("error"):
+            print(f"  {p['paquete']:>7}  error: {p['error']}")
+        else:
+            print(f"  {p['paquete']:>7}  {p['filas_por_s'] or 0:>8}  {p['mb_por_s'] or 0:>7}")
+    print("\nHilos  op/s  conectar p50/p99 ms  errores")
+    for p in informe["pool"]:
+        c = p["conectar"]
+        print(f"  {p['hilos']:>3}  {p['operaciones_por_s']:>7}  {c.get('p50')}/{c.get('p99')}  {p['errores']}")
+    print("\nRecomendaciones:")
+    for consejo in informe["recomendaciones"]:
+        print(f"  - {consejo}")
+
+
+def _lista(texto):
+    return [int(valor) for valor in texto.split(",") if valor]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Diagnosticar la conexión a SQL Server")
+    parser.add_argument("--cadena", default=connection_string, help="cadena de conexión a probar")
+    parser.add_argument("--hilos", default="1,4,16,32", help="hilos simultáneos para probar el pool")
+    parser.add_argument("--tamanos", default="1,10,100,1000,5000", help="tamaños de fetchmany")
+    parser.add_argument("--paquetes", default="4096,8192,16384,32767", help="valores de Packet Size")
+    parser.add_argument("--consulta", default="SELECT * FROM Citas", help="consulta para medir lectura")
+    parser.add_argument("--filas", type=int, default=100_000, help="máximo de filas a leer por prueba")
+    parser.add_argument("--veces", type=int, default=50, help="conexiones a medir")
+    parser.add_argument("--segundos", type=float, default=3, help="duración de cada prueba de pool")
+    parser.add_argument("--json", action="store_true", help="imprimir el informe como JSON")
+    args = parser.parse_args()
+
+    informe = diagnosticar(args.cadena, _lista(args.hilos), _lista(args.tamanos), _lista(args.paquetes),
+                           args.consulta, args.filas, args.veces, args.segundos)
+    if args.json:
+        print(json.dumps(informe, indent=2, ensure_ascii=False))
+    else:
+        imprimir(informe)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+"""Detección de pacientes duplicados.
+
+Uso: python duplicados.py [--umbral 0.88] [--procesos 8]
+
+Agrupa los pacientes por claves de bloqueo (fecha de nacimiento y apellido
+normalizado), compara solo los pares dentro de cada bloque en procesos en
+paralelo y guarda los pares candidatos en PacientesDuplicados para revisión.
+"""
+import argparse
+import time
+from collections import defaultdict
+from multiprocessing import Pool
+
+import pyodbc
+
+from texto import normalizar, normalizar_email, normalizar_telefono
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=localhost;"
+    "DATABASE=ClinicaMedica;"
+    "UID=usuario_sql;"
+    "PWD=beatriz1902"
+)
+
+# Los bloques más grandes que esto (apellidos muy frecuentes) se comparan con
+# vecindad ordenada en vez de todos contra todos, para no volver cuadrático.
+MAX_BLOQUE = 400
+VENTANA = 25
+
+
+def jaro_winkler(a, b):
+    if a == b:
+        return 1.0
+    if not a or not b:
+        return 0.0
+    distancia = max(len(a), len(b)) // 2 - 1
+    usados_b = [False] * len(b)
+    coincidencias_a = []
+    for i, c in enumerate(a):
+        for j in range(max(0, i - distancia), min(len(b), i + distancia + 1)):
+            if not usados_b[j] and b[j] == c:
+                usados_b[j] = True
+                coincidencias_a.append(c)
+                break
+    m = len(coincidencias_a)
+    if m == 0:
+        return 0.0
+    coincidencias_b = [c for c, usado in zip(b, usados_b) if usado]
+    transposiciones = sum(x != y for x, y in zip(coincidencias_a, coincidencias_b)) / 2
+    jaro = (m / len(a) + m / len(b) + (m - transposiciones) / m) / 3
+    prefijo = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefijo += 1
+    return jaro + prefijo * 0.1 * (1 - jaro)
+
+
+def similitud_fechas(a, b):
+    """1 si son iguales; crédito parcial para los errores de tipeo habituales
+    (un dígito distinto, día y mes invertidos, o solo el día distinto)"""
+    if a is None or b is None:
+        return 0.0
+    if a == b:
+        return 1.0
+    texto_a, texto_b = a.isoformat(), b.isoformat()
+    if sum(x != y for x, y in zip(texto_a, texto_b)) == 1:
+        return 0.95
+    if a.year == b.year and a.month == b.day and a.day == b.month:
+        return 0.95
+    if a.year == b.year and a.month == b.month:
+        return 0.75
+    return 0.0
+
+
+def puntaje(p, q):
+    """Similitud entre dos pacientes normalizados, entre 0 y 1"""
+    _, nombre_p, apellido_p, fecha_p, sexo_p, telefono_p, email_p = p
+    _, nombre_q, apellido_q, fecha_q, sexo_q, telefono_q, email_q = q
+    valor = 0.35 * jaro_winkler(apellido_p, apellido_q) + 0.30 * jaro_winkler(nombre_p, nombre_q)
+    # Con crédito parcial por la fecha, el bloque por apellido puede llegar al
+    # umbral con una fecha mal tipeada (el bloque por fecha no lo vería)
+    valor += 0.20 * similitud_fechas(fecha_p, fecha_q)
+    valor += 0.05 if sexo_p == sexo_q else 0.0
+    if (telefono_p and telefono_p == telefono_q) or (email_p and email_p == email_q):
+        valor += 0.10
+    return valor
+
+
+def normalizar_paciente(fila):
+    return (
+        fila.IdPaciente,
+        normalizar(fila.Nombre),
+        normalizar(fila.Apellido),
+        fila.FechaNacimiento,
+        (fila.Sexo or "").strip().upper()[:1],
+        normalizar_telefono(fila.Telefono),
+        normalizar_email(fila.Email),
+    )
+
+
+def claves_bloqueo(paciente):
+    _, nombre, apellido, fecha, _, _, _ = paciente
+    primer_apellido = apellido.split(" ")[0] if apellido else ""
+    claves = []
+    if fecha is not None:
+        claves.append(("fecha", fecha))
+    if primer_apellido:
+        claves.append(("apellido", primer_apellido, nombre[:1]))
+    return claves
+
+
+def comparar_bloques(argumentos):
+    """Trabajo de cada proceso: pares con puntaje >= umbral en un lote de bloques"""
+    bloques, umbral = argumentos
+    pares = []
+    for bloque in bloques:
+        if len(bloque) <= MAX_BLOQUE:
+            candidatos = ((i, j) for i in range(len(bloque)) for j in range(i + 1, len(bloque)))
+        else:
+            bloque = sorted(bloque, key=lambda p: (p[2], p[1]))
+            candidatos = ((i, j) for i in range(len(bloque))
+                          for j in range(i + 1, min(i + VENTANA, len(bloque))))
+        for i, j in candidatos:
+            valor = puntaje(bloque[i], bloque[j])
+            if valor >= umbral:
+                a, b = sorted((bloque[i][0], bloque[j][0]))
+                pares.append((a, b, round(valor, 4)))
+    return pares
+
+
+def lotes_de_bloques(bloques, tamano):
+    lote, pacientes = [], 0
+    for bloque in bloques:
+        lote.append(bloque)
+        pacientes += len(bloque)
+        if pacientes >= tamano:
+            yield lote
+            lote, pacientes = [], 0
+    if lote:
+        yield lote
+
+
+def agrupar(pares):
+    """Unión-búsqueda: cada paciente queda en el grupo de su id más bajo"""
+    padre = {}
+
+    def raiz(x):
+        padre.setdefault(x, x)
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
+
+    for a, b, _ in pares:
+        ra, rb = raiz(a), raiz(b)
+        if ra != rb:
+            padre[max(ra, rb)] = min(ra, rb)
+    return {x: raiz(x) for x in padre}
+
+
+def detectar(umbral=0.88, procesos=None, lote=20000):
+    inicio = time.perf_counter()
+    conn = pyodbc.connect(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT IdPaciente, Nombre, Apellido, FechaNacimiento, Sexo, Telefono, Email
+        FROM Pacientes
+    """)
+    bloques = defaultdict(list)
+    total = 0
+    while True:
+        filas = cursor.fetchmany(50000)
+        if not filas:
+            break
+        for fila in filas:
+            paciente = normalizar_paciente(fila)
+            for clave in claves_bloqueo(paciente):
+                bloques[clave].append(paciente)
+        total += len(filas)
+    print(f"{total} pacientes leídos en {len(bloques)} bloques ({time.perf_counter() - inicio:.1f}s)")
+
+    trabajos = ((l, umbral) for l in lotes_de_bloques((b for b in bloques.values() if len(b) > 1), lote))
+    mejores = {}
+    with Pool(procesos) as pool:
+        for pares in pool.imap_unordered(comparar_bloques, trabajos):
+            for a, b, valor in pares:
+                if valor > mejores.get((a, b), 0):
+                    mejores[(a, b)] = valor
+    pares = [(a, b, valor) for (a, b), valor in mejores.items()]
+    grupos = agrupar(pares)
+    print(f"{len(pares)} pares candidatos en {len(set(grupos.values()))} grupos "
+          f"({time.perf_counter() - inicio:.1f}s)")
+
+    # Los pares ya revisados se conservan; solo se reemplazan los pendientes
+    cursor.execute("DELETE FROM PacientesDuplicados WHERE Estado = 'Pendiente'")
+    cursor.execute("SELECT IdPaciente1, IdPaciente2 FROM PacientesDuplicados")
+    revisados = {(fila.IdPaciente1, fila.IdPaciente2) for fila in cursor.fetchall()}
+    cursor.fast_executemany = True
+    filas = [(a, b, valor, grupos[a]) for a, b, valor in pares if (a, b) not in revisados]
+    for i in range(0, len(filas), 10000):
+        cursor.executemany("""
+            INSERT INTO PacientesDuplicados (IdPaciente1, IdPaciente2, Puntaje, IdGrupo)
+            VALUES (?, ?, ?, ?)
+        """, filas[i:i + 10000])
+    conn.commit()
+    conn.close()
+    print(f"Candidatos guardados en PacientesDuplicados ({time.perf_counter() - inicio:.1f}s)")
+    return len(pares)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Detectar pacientes duplicados")
+    parser.add_argument("--umbral", type=float, default=0.88, help="puntaje mínimo de un par")
+    parser.add_argument("--procesos", type=int, default=None, help="procesos en paralelo")
+    parser.add_argument("--lote", type=int, default=20000, help="pacientes por trabajo")
+    args = parser.parse_args()
+    detectar(args.umbral, args.procesos, args.lote)
@@ -0,0 +1,20 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+_suscriptores = []
+
+
+def suscribir(funcion):
+    """Registrar funcion(evento, **datos); se puede usar como decorador"""
+    _suscriptores.append(funcion)
+    return funcion
+
+
+def publicar(evento, **datos):
+    """Avisar a todos los suscriptores; el fallo de uno no afecta a los demás"""
+    for funcion in _suscriptores:
+        try:
+            funcion(evento, **datos)
+        except Exception:
+            logger.exception("Error en el suscriptor %s del evento %s", funcion.__name__, evento)
@@ -0,0 +1,154 @@
+"""Fusión de pacientes duplicados.
+
+Uso: python fusion_pacientes.py --aprobados [--lote 250]
+     python fusion_pacientes.py --archivo pares.csv
+
+Mueve las citas, series y entradas de la lista de espera de cada duplicado a
+su sobreviviente y borra el duplicado, por lotes de pares en transacciones
+separadas con sentencias de conjunto.
+"""
+import argparse
+import csv
+import time
+
+import pyodbc
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=localhost;"
+    "DATABASE=ClinicaMedica;"
+    "UID=usuario_sql;"
+    "PWD=beatriz1902"
+)
+
+# SQL Server intenta escalar a bloqueo de tabla a partir de ~5000 bloqueos por
+# sentencia; si un lote mueve más citas que esto, el siguiente lote se reduce.
+MAX_FILAS_POR_LOTE = 4000
+
+
+def resolver_cadenas(pares):
+    """Dado [(sobreviviente, duplicado)], apunta cada duplicado a su sobreviviente final"""
+    destino = {}
+    for sobreviviente, duplicado in pares:
+        if sobreviviente != duplicado:
+            destino[duplicado] = sobreviviente
+    resueltos = {}
+    for duplicado in destino:
+        final, vistos = destino[duplicado], {duplicado}
+        while final in destino and final not in vistos:
+            vistos.add(final)
+            final = destino[final]
+        if final != duplicado:
+            resueltos[duplicado] = final
+    return [(sobreviviente, duplicado) for duplicado, sobreviviente in resueltos.items()]
+
+
+def fusionar(conn, pares, tamano_lote=250):
+    """Fusionar los pares por lotes; genera un informe por lote confirmado"""
+    pares = resolver_cadenas(pares)
+    cursor = conn.cursor()
+    cursor.execute("""
+        IF OBJECT_ID('tempdb..#Fusion') IS NULL
+            CREATE TABLE #Fusion (IdDuplicado INT PRIMARY KEY, IdSobreviviente INT NOT NULL)
+    """)
+    cursor.fast_executemany = True
+    inicio, numero = 0, 0
+    while inicio < len(pares):
+        lote = pares[inicio:inicio + tamano_lote]
+        numero += 1
+        comienzo = time.perf_counter()
+        try:
+            cursor.execute("TRUNCATE TABLE #Fusion")
+            cursor.executemany(
+                "INSERT INTO #Fusion (IdSobreviviente, IdDuplicado) VALUES (?, ?)", lote
+            )
+            cursor.execute("""
+                UPDATE c SET c.IdPaciente = f.IdSobreviviente
+                FROM Citas c JOIN #Fusion f ON c.IdPaciente = f.IdDuplicado
+            """)
+            citas = cursor.rowcount
+            # Las series del duplicado pasan al sobreviviente antes del borrado (FK)
+            cursor.execute("""
+                UPDATE s SET s.IdPaciente = f.IdSobreviviente
+                FROM SeriesCitas s JOIN #Fusion f ON s.IdPaciente = f.IdDuplicado
+            """)
+            # En la lista de espera, si los dos esperan al mismo médico o
+            # especialidad se queda la entrada del sobreviviente
+            cursor.execute("""
+                DELETE e FROM ListaEspera e JOIN #Fusion f ON e.IdPaciente = f.IdDuplicado
+                WHERE e.Estado = 'Esperando' AND EXISTS (
+                    SELECT 1 FROM ListaEspera s
+                    WHERE s.IdPaciente = f.IdSobreviviente
+                      AND s.Estado IN ('Esperando', 'Ofrecida')
+                      AND (s.IdMedico = e.IdMedico OR s.Especialidad = e.Especialidad)
+                )
+            """)
+            cursor.execute("""
+                UPDATE e SET e.IdPaciente = f.IdSobreviviente
+                FROM ListaEspera e JOIN #Fusion f ON e.IdPaciente = f.IdDuplicado
+            """)
+            cursor.execute("""
+                UPDATE d SET d.Estado = 'Fusionado'
+                FROM PacientesDuplicados d
+                JOIN #Fusion f ON f.IdDuplicado IN (d.IdPaciente1, d.IdPaciente2)
+            """)
+            cursor.execute("""
+                DELETE p FROM Pacientes p JOIN #Fusion f ON p.IdPaciente = f.IdDuplicado
+            """)
+            pacientes = cursor.rowcount
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        segundos = time.perf_counter() - comienzo
+        yield {
+            "lote": numero,
+            "pares": len(lote),
+            "citas_movidas": citas,
+            "pacientes_eliminados": pacientes,
+            "segundos": round(segundos, 4),
+            "pares_por_segundo": round(len(lote) / segundos, 1) if segundos else None,
+            "duplicados": [duplicado for _, duplicado in lote],
+        }
+        inicio += len(lote)
+        if citas > MAX_FILAS_POR_LOTE and tamano_lote > 1:
+            tamano_lote = max(1, tamano_lote * MAX_FILAS_POR_LOTE // citas)
+
+
+def pares_aprobados(cursor):
+    """Pares aprobados en la revisión; sobrevive el paciente más antiguo"""
+    cursor.execute("""
+        SELECT IdPaciente1, IdPaciente2 FROM PacientesDuplicados WHERE Estado = 'Aprobado'
+    """)
+    return [(fila.IdPaciente1, fila.IdPaciente2) for fila in cursor.fetchall()]
+
+
+def pares_de_archivo(ruta):
+    with open(ruta, newline="", encoding="utf-8") as archivo:
+        return [(int(fila["IdSobreviviente"]), int(fila["IdDuplicado"]))
+                for fila in csv.DictReader(archivo)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fusionar pacientes duplicados")
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--aprobados", action="store_true",
+                        help="fusionar los pares aprobados en PacientesDuplicados")
+    origen.add_argument("--archivo", help="CSV con columnas IdSobreviviente,IdDuplicado")
+    parser.add_argument("--lote", type=int, default=250, help="pares por transacción")
+    args = parser.parse_args()
+
+    conn = pyodbc.connect(connection_string)
+    pares = pares_aprobados(conn.cursor()) if args.aprobados else pares_de_archivo(args.archivo)
+    total_citas = total_pacientes = 0
+    comienzo = time.perf_counter()
+    for informe in fusionar(conn, pares, args.lote):
+        total_citas += informe["citas_movidas"]
+        total_pacientes += informe["pacientes_eliminados"]
+        print(f"lote {informe['lote']}: {informe['pares']} pares, "
+              f"{informe['citas_movidas']} citas movidas, "
+              f"{informe['pacientes_eliminados']} pacientes eliminados, "
+              f"{informe['segundos']}s ({informe['pares_por_segundo']} pares/s)")
+    conn.close()
+    print(f"Total: {total_pacientes} pacientes fusionados, {total_citas} citas movidas "
+          f"en {time.perf_counter() - comienzo:.1f}s")
@@ -0,0 +1,354 @@
+"""Generador de datos sintéticos de la clínica a escala de producción.
+
+Uso: python generador_datos.py --pacientes 2000000 --medicos 3000 \\
+         --desde 2023-01-01 --hasta 2026-12-31 --semilla 42 \\
+         --destino sqlserver | csv --directorio datos/ | local --base clinica.db
+
+Los datos salen de una semilla: cada bloque de pacientes y cada médico tiene
+su propio generador, SeedSequence(semilla, spawn_key), así el resultado no
+depende del tamaño de los lotes de escritura ni del destino. Las fechas por
+defecto son fijas (no dependen de hoy), así que la misma semilla y los mismos
+tamaños dan las mismas filas aunque no se pasen --desde/--hasta/--referencia. Todo se genera por
+columnas con NumPy y se vuelca en lotes (fast_executemany en SQL Server,
+archivos CSV para BULK INSERT/bcp, o la base local de los benchmarks).
+
+Distribuciones: nombres y apellidos frecuentes con pesos tipo Zipf, edades
+adultas más probables, especialidades con más médicos de familia, demanda por
+médico con estacionalidad mensual (agosto flojo, invierno cargado) y semanal,
+y ausencias según especialidad. Las citas de un médico nunca se pisan.
+"""
+import argparse
+import csv
+import os
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from horarios import a_bytes, mascara_de_tramos
+from texto import normalizar
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=MANUEL\\MSSQL2022;"
+    "DATABASE=ClinicaMedica;"
+    "Trusted_Connection=yes;"
+)
+
+NOMBRES_MUJER = ["María", "Carmen", "Ana", "Laura", "Lucía", "Marta", "Elena", "Sofía", "Paula",
+                 "Isabel", "Beatriz", "Rosa", "Cristina", "Teresa", "Raquel", "Pilar", "Silvia",
+                 "Andrea", "Nuria", "Patricia", "Julia", "Irene", "Alba", "Sara", "Claudia"]
+NOMBRES_HOMBRE = ["José", "Antonio", "Manuel", "Francisco", "David", "Javier", "Daniel", "Carlos",
+                  "Miguel", "Pedro", "Alejandro", "Pablo", "Jorge", "Luis", "Sergio", "Fernando",
+                  "Rafael", "Alberto", "Diego", "Adrián", "Juan", "Álvaro", "Hugo", "Mario", "Raúl"]
+NOMBRES = NOMBRES_MUJER + NOMBRES_HOMBRE
+APELLIDOS = ["García", "Rodríguez", "González", "Fernández", "López", "Martínez", "Sánchez",
+             "Pérez", "Gómez", "Martín", "Jiménez", "Ruiz", "Hernández", "Díaz", "Moreno",
+             "Muñoz", "Álvarez", "Romero", "Alonso", "Gutiérrez", "Navarro", "Torres",
+             "Domínguez", "Vázquez", "Ramos", "Gil", "Ramírez", "Serrano", "Blanco", "Molina",
+             "Morales", "Suárez", "Ortega", "Delgado", "Castro", "Ortiz", "Rubio", "Marín",
+             "Sanz", "Núñez", "Iglesias", "Medina", "Garrido", "Cortés", "Castillo", "Santos"]
+CALLES = ["Calle Mayor", "Avenida de la Constitución", "Calle Real", "Paseo del Prado",
+          "Calle de Alcalá", "Avenida de América", "Calle San Juan", "Plaza de España",
+          "Calle Nueva", "Calle del Carmen", "Avenida Andalucía", "Calle Iglesia"]
+DOMINIOS = ["gmail.com", "hotmail.com", "yahoo.es", "outlook.es", "correo.es"]
+
+# Especialidad: (peso en la plantilla de médicos, tasa de ausencias)
+ESPECIALIDADES = {
+    "Medicina General": (30, 0.10),
+    "Pediatría": (12, 0.07),
+    "Cardiología": (7, 0.06),
+    "Dermatología": (6, 0.14),
+    "Ginecología": (8, 0.09),
+    "Traumatología": (8, 0.11),
+    "Oftalmología": (6, 0.12),
+    "Neurología": (5, 0.08),
+    "Psiquiatría": (5, 0.18),
+    "Endocrinología": (5, 0.10),
+}
+MOTIVOS = ["Control de presión arterial", "Dolor de cabeza persistente", "Revisión anual",
+           "Dolor abdominal", "Control de diabetes", "Tos y fiebre", "Dolor lumbar",
+           "Erupción en la piel", "Revisión de análisis", "Vacunación", "Mareos frecuentes",
+           "Dolor de rodilla", "Control de embarazo", "Renovación de receta",
+           "Dolor en el pecho", "Insomnio", "Revisión de la vista", "Alergia estacional"]
+
+JORNADA = [("08:00", "16:00")]
+MINUTOS_CITA = 30
+HUECOS_POR_DIA = 8 * 60 // MINUTOS_CITA
+TASA_CANCELACION = 0.08
+# Rango por defecto de la línea de comandos: fijo para que sea reproducible
+DESDE_POR_DEFECTO = date(2024, 1, 1)
+HASTA_POR_DEFECTO = date(2026, 3, 31)
+DIAS_FUTUROS = 90
+# Demanda relativa por mes (enero..diciembre) y por día (lunes..viernes)
+ESTACIONALIDAD_MENSUAL = np.array([1.15, 1.15, 1.05, 1.0, 0.95, 0.9, 0.75, 0.6, 0.95, 1.05, 1.1, 1.0])
+ESTACIONALIDAD_SEMANAL = np.array([1.1, 1.05, 1.0, 1.0, 0.85])
+# Los pacientes se generan en bloques lógicos fijos para que la semilla
+# determine los datos sin importar el tamaño de lote de escritura
+BLOQUE_PACIENTES = 100_000
+
+COLUMNAS = {
+    "Pacientes": ("IdPaciente", "Nombre", "Apellido", "FechaNacimiento", "Sexo", "Telefono",
+                  "Direccion", "Email"),
+    "Medicos": ("IdMedico", "Nombre", "Apellido", "Especialidad", "Telefono", "Email"),
+    "HorariosMedicos": ("IdMedico", "DiaSemana", "Bloques"),
+    "Citas": ("IdCita", "IdPaciente", "IdMedico", "FechaCita", "Motivo", "Estado"),
+}
+CON_IDENTIDAD = {"Pacientes", "Medicos", "Citas"}
+
+
+def _pesos_zipf(cantidad, exponente=0.8):
+    pesos = 1.0 / np.arange(1, cantidad + 1) ** exponente
+    return pesos / pesos.sum()
+
+
+def _sin_acentos(valores):
+    return np.array([normalizar(v).replace(" ", "") for v in valores], dtype=object)
+
+
+class Generador:
+    """Tablas de la clínica como lotes de columnas (dict nombre -> array)"""
+
+    def __init__(self, semilla, pacientes, medicos, desde, hasta, referencia=None, citas_por_dia=9.0):
+        self.pacientes = pacientes
+        self.medicos = medicos
+        self.desde = desde
+        self.hasta = hasta
+        # Antes de `referencia` las citas ya ocurrieron (Completada/Ausente);
+        # por defecto, la medianoche de DIAS_FUTUROS días antes de `hasta`
+        if referencia is None:
+            referencia = datetime.combine(hasta - timedelta(days=DIAS_FUTUROS), datetime.min.time())
+        self.referencia = np.datetime64(referencia, "m")
+        self.citas_por_dia = citas_por_dia
+        self.semilla = semilla
+        self._especialidades = list(ESPECIALIDADES)
+        rng = self._rng(2)
+        pesos = np.array([peso for peso, _ in ESPECIALIDADES.values()], dtype=float)
+        self.especialidad_de = rng.choice(len(self._especialidades), medicos, p=pesos / pesos.sum())
+
+    def _rng(self, *clave):
+        """Generador propio de una parte de los datos: (tabla, bloque o médico)"""
+        return np.random.default_rng(np.random.SeedSequence(self.semilla, spawn_key=clave))
+
+    def _personas(self, rng, cantidad):
+        mujer = rng.random(cantidad) < 0.52
+        nombres = np.where(
+            mujer,
+            np.array(NOMBRES_MUJER, dtype=object)[rng.choice(len(NOMBRES_MUJER), cantidad,
+                                                             p=_pesos_zipf(len(NOMBRES_MUJER)))],
+            np.array(NOMBRES_HOMBRE, dtype=object)[rng.choice(len(NOMBRES_HOMBRE), cantidad,
+                                                              p=_pesos_zipf(len(NOMBRES_HOMBRE)))]
+        )
+        pesos = _pesos_zipf(len(APELLIDOS))
+        primero = rng.choice(len(APELLIDOS), cantidad, p=pesos)
+        segundo = rng.choice(len(APELLIDOS), cantidad, p=pesos)
+        return mujer, nombres, primero, segundo
+
+    def generar_pacientes(self):
+        planos_nombre = {n: normalizar(n) for n in NOMBRES}
+        apellidos = np.array(APELLIDOS, dtype=object)
+        planos_apellido = _sin_acentos(APELLIDOS)
+        for numero in range(-(-self.pacientes // BLOQUE_PACIENTES)):
+            rng = self._rng(0, numero)
+            inicio = numero * BLOQUE_PACIENTES + 1
+            cantidad = min(BLOQUE_PACIENTES, self.pacientes - inicio + 1)
+            ids = np.arange(inicio, inicio + cantidad)
+            mujer, nombres, primero, segundo = self._personas(rng, cantidad)
+            edades = np.abs(rng.normal(45, 22, cantidad)) % 100
+            nacimiento = (np.datetime64(self.hasta, "D")
+                          - (edades * 365.25).astype("timedelta64[D]")).tolist()
+            telefonos = rng.integers(600_000_000, 800_000_000, cantidad).tolist()
+            numeros = rng.integers(1, 200, cantidad).tolist()
+            calles = rng.integers(len(CALLES), size=cantidad).tolist()
+            dominios = rng.integers(len(DOMINIOS), size=cantidad).tolist()
+            yield {
+                "IdPaciente": ids,
+                "Nombre": nombres,
+                "Apellido": apellidos[primero] + " " + apellidos[segundo],
+                "FechaNacimiento": nacimiento,
+                "Sexo": np.where(mujer, "F", "M"),
+                "Telefono": [f"{t // 1_000_000} {t // 1000 % 1000:03d} {t % 1000:03d}" for t in telefonos],
+                "Direccion": [f"{CALLES[c]} {n}" for c, n in zip(calles, numeros)],
+                "Email": [f"{planos_nombre[n]}.{a}{i}@{DOMINIOS[d]}" for n, a, i, d in
+                          zip(nombres.tolist(), planos_apellido[primero].tolist(), ids.tolist(), dominios)],
+            }
+
+    def generar_medicos(self):
+        rng = self._rng(1)
+        ids = np.arange(1, self.medicos + 1)
+        _, nombres, primero, _ = self._personas(rng, self.medicos)
+        planos = _sin_acentos(APELLIDOS)
+        yield {
+            "IdMedico": ids,
+            "Nombre": nombres,
+            "Apellido": np.array(APELLIDOS, dtype=object)[primero],
+            "Especialidad": np.array(self._especialidades, dtype=object)[self.especialidad_de],
+            "Telefono": [f"91{t:07d}" for t in rng.integers(0, 10_000_000, self.medicos).tolist()],
+            "Email": [f"{normalizar(n)}.{a}{i}@clinica.es" for n, a, i in
+                      zip(nombres.tolist(), planos[primero].tolist(), ids.tolist())],
+        }
+
+    def generar_horarios(self):
+        bloques = a_bytes(mascara_de_tramos(JORNADA))
+        ids = np.repeat(np.arange(1, self.medicos + 1), 5)
+        yield {
+            "IdMedico": ids,
+            "DiaSemana": np.tile(np.arange(5), self.medicos),
+            "Bloques": [bloques] * len(ids),
+        }
+
+    def generar_citas(self, tamano_lote=200_000):
+        """Citas de cada médico día por día; los lotes juntan médicos enteros"""
+        dias = np.arange(np.datetime64(self.desde, "D"), np.datetime64(self.hasta, "D"))
+        semana = (dias.astype("int64") + 3) % 7          # 1970-01-01 fue jueves
+        dias = dias[semana < 5]
+        semana = semana[semana < 5]
+        meses = dias.astype("datetime64[M]").astype("int64") % 12
+        demanda_dia = self.citas_por_dia * ESTACIONALIDAD_MENSUAL[meses] * ESTACIONALIDAD_SEMANAL[semana]
+        inicio_jornada = dias.astype("datetime64[m]") + np.timedelta64(8 * 60, "m")
+        ausencias = np.array([tasa for _, tasa in ESPECIALIDADES.values()])
+        pesos_motivo = _pesos_zipf(len(MOTIVOS), 0.6)
+        motivos = np.array(MOTIVOS, dtype=object)
+        estados = np.array(["Completada", "Ausente", "Cancelada", "Pendiente", "Confirmada"], dtype=object)
+
+        siguiente_id = 1
+        pendiente = []
+        for indice in range(self.medicos):
+            rng = self._rng(3, indice)
+            factor = rng.lognormal(0, 0.25)
+            cantidades = np.minimum(rng.poisson(demanda_dia * factor), HUECOS_POR_DIA)
+            # Orden aleatorio de los huecos de cada día; se toman los primeros k
+            rango = rng.random((len(dias), HUECOS_POR_DIA)).argsort(axis=1).argsort(axis=1)
+            dia, hueco = np.nonzero(rango < cantidades[:, None])
+            n = len(dia)
+            fechas = inicio_jornada[dia] + (hueco * MINUTOS_CITA).astype("timedelta64[m]")
+
+            azar = rng.random(n)
+            pasada = fechas < self.referencia
+            cercana = fechas < self.referencia + np.timedelta64(2, "D")
+            codigo = np.where(pasada, np.where(azar < ausencias[self.especialidad_de[indice]], 1, 0),
+                              np.where(rng.random(n) < np.where(cercana, 0.6, 0.1), 4, 3))
+            codigo[azar > 1 - TASA_CANCELACION] = 2
+            pacientes = 1 + (self.pacientes * rng.random(n) ** 1.3).astype(np.int64)
+
+            pendiente.append({
+                "IdCita": np.arange(siguiente_id, siguiente_id + n),
+                "IdPaciente": np.minimum(pacientes, self.pacientes),
+                "IdMedico": np.full(n, indice + 1),
+                "FechaCita": fechas.astype("datetime64[us]"),
+                "Motivo": motivos[rng.choice(len(MOTIVOS), n, p=pesos_motivo)],
+                "Estado": estados[codigo],
+            })
+            siguiente_id += n
+            if sum(len(p["IdCita"]) for p in pendiente) >= tamano_lote or indice == self.medicos - 1:
+                yield {columna: np.concatenate([p[columna] for p in pendiente])
+                       for columna in COLUMNAS["Citas"]}
+                pendiente = []
+
+
+def _filas(bloque, columnas):
+    return list(zip(*[(valores.tolist() if isinstance(valores, np.ndarray) else valores)
+                      for valores in (bloque[c] for c in columnas)]))
+
+
+class DestinoPyodbc:
+    """Inserción por lotes con fast_executemany (SQL Server o la base local)"""
+
+    def __init__(self, conn, tamano_lote=50_000):
+        self.conn = conn
+        self.tamano_lote = tamano_lote
+
+    def escribir(self, tabla, bloques):
+        columnas = COLUMNAS[tabla]
+        cursor = self.conn.cursor()
+        cursor.fast_executemany = True
+        sql = f"INSERT INTO {tabla} ({', '.join(columnas)}) VALUES ({', '.join('?' for _ in columnas)})"
+        if tabla in CON_IDENTIDAD:
+            cursor.execute(f"SET IDENTITY_INSERT {tabla} ON")
+        total = 0
+        for bloque in bloques:
+            filas = _filas(bloque, columnas)
+            for inicio in range(0, len(filas), self.tamano_lote):
+                cursor.executemany(sql, filas[inicio:inicio + self.tamano_lote])
+                self.conn.commit()
+            total += len(filas)
+        if tabla in CON_IDENTIDAD:
+            cursor.execute(f"SET IDENTITY_INSERT {tabla} OFF")
+        return total
+
+
+class DestinoCSV:
+    """Un CSV por tabla, listo para BULK INSERT o bcp"""
+
+    def __init__(self, directorio):
+        self.directorio = directorio
+        os.makedirs(directorio, exist_ok=True)
+
+    def escribir(self, tabla, bloques):
+        columnas = COLUMNAS[tabla]
+        total = 0
+        with open(os.path.join(self.directorio, f"{tabla}.csv"), "w", newline="", encoding="utf-8") as archivo:
+            escritor = csv.writer(archivo)
+            escritor.writerow(columnas)
+            for bloque in bloques:
+                filas = _filas(bloque, columnas)
+                if tabla == "HorariosMedicos":
+                    filas = [(m, d, b.hex()) for m, d, b in filas]
+                escritor.writerows(filas)
+                total += len(filas)
+        return total
+
+
+def volcar(generador, destino, informar=None):
+    """Generar y escribir las cuatro tablas en orden; devuelve filas por tabla"""
+    totales = {}
+    for tabla, bloques in (("Medicos", generador.generar_medicos()),
+                           ("HorariosMedicos", generador.generar_horarios()),
+                           ("Pacientes", generador.generar_pacientes()),
+                           ("Citas", generador.generar_citas())):
+        comienzo = time.perf_counter()
+        totales[tabla] = destino.escribir(tabla, bloques)
+        if informar:
+            segundos = time.perf_counter() - comienzo
+            informar(f"{tabla}: {totales[tabla]} filas en {segundos:.1f}s "
+                     f"({totales[tabla] / max(segundos, 1e-9):,.0f} filas/s)")
+    return totales
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Generar datos sintéticos de la clínica")
+    parser.add_argument("--pacientes", type=int, default=1_000_000)
+    parser.add_argument("--medicos", type=int, default=2_000)
+    parser.add_argument("--desde", type=date.fromisoformat, default=DESDE_POR_DEFECTO)
+    parser.add_argument("--hasta", type=date.fromisoformat, default=HASTA_POR_DEFECTO)
+    parser.add_argument("--referencia", type=datetime.fromisoformat,
+                        help="instante que separa citas pasadas de futuras "
+                             f"(por defecto, {DIAS_FUTUROS} días antes de --hasta)")
+    parser.add_argument("--citas-por-dia", type=float, default=9.0, help="media por médico y día laborable")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--destino", choices=("sqlserver", "csv", "local"), default="csv")
+    parser.add_argument("--directorio", default="datos", help="carpeta de salida para csv")
+    parser.add_argument("--base", help="archivo SQLite para el destino local")
+    parser.add_argument("--lote", type=int, default=50_000, help="filas por executemany")
+    args = parser.parse_args()
+
+    generador = Generador(args.semilla, args.pacientes, args.medicos, args.desde, args.hasta,
+                          args.referencia, args.citas_por_dia)
+    conn = None
+    if args.destino == "csv":
+        destino = DestinoCSV(args.directorio)
+    elif args.destino == "local":
+        from benchmarks import base_local
+        base_local.configurar(args.base or "clinica.db")
+        conn = base_local.connect()
+        destino = DestinoPyodbc(conn, args.lote)
+    else:
+        # pyodbc solo hace falta para este destino
+        import pyodbc
+        conn = pyodbc.connect(connection_string)
+        destino = DestinoPyodbc(conn, args.lote)
+    comienzo = time.perf_counter()
+    totales = volcar(generador, destino, print)
+    if conn is not None:
+        conn.close()
+    print(f"{sum(totales.values())} filas en {time.perf_counter() - comienzo:.1f}s")
@@ -0,0 +1,227 @@
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+
+from metricas import cache_consultas
+
+# Cada día se representa como un entero de 288 bits: un bit por cada bloque
+# de 5 minutos. Así "¿trabaja a esta hora?" es un desplazamiento y un AND, y
+# "minutos libres" es un AND NOT seguido de un conteo de bits.
+MINUTOS_POR_BIT = 5
+BITS_POR_DIA = 24 * 60 // MINUTOS_POR_BIT
+BYTES_POR_DIA = BITS_POR_DIA // 8
+DIA_COMPLETO = (1 << BITS_POR_DIA) - 1
+DURACION_CITA_MINUTOS = 30
+
+
+def bit_de(instante):
+    return (instante.hour * 60 + instante.minute) // MINUTOS_POR_BIT
+
+
+def mascara_rango(inicio_minuto, fin_minuto):
+    """Bits que cubren [inicio, fin) en minutos desde medianoche"""
+    primero = inicio_minuto // MINUTOS_POR_BIT
+    ultimo = -(-fin_minuto // MINUTOS_POR_BIT)
+    if ultimo <= primero:
+        return 0
+    return ((1 << (ultimo - primero)) - 1) << primero
+
+
+def mascara_cita(instante, duracion=DURACION_CITA_MINUTOS):
+    inicio = instante.hour * 60 + instante.minute
+    return mascara_rango(inicio, min(inicio + duracion, 24 * 60))
+
+
+def mascara_intervalo(dia, desde, hasta):
+    """Bits del día `dia` que cubre el intervalo [desde, hasta)"""
+    inicio_dia = datetime.combine(dia, datetime.min.time())
+    desde = max(desde, inicio_dia)
+    hasta = min(hasta, inicio_dia + timedelta(days=1))
+    if desde >= hasta:
+        return 0
+    return mascara_rango(int((desde - inicio_dia).total_seconds()) // 60,
+                         -(-int((hasta - inicio_dia).total_seconds()) // 60))
+
+
+def inicios_libres(libres, paso=DURACION_CITA_MINUTOS, duracion=DURACION_CITA_MINUTOS):
+    """Minutos desde medianoche en los que cabe una cita completa dentro de `libres`"""
+    inicios = []
+    for minuto in range(0, 24 * 60 - duracion + 1, paso):
+        mascara = mascara_rango(minuto, minuto + duracion)
+        if libres & mascara == mascara:
+            inicios.append(minuto)
+    return inicios
+
+
+def mascara_de_tramos(tramos):
+    """Convertir [("08:00", "12:00"), ...] en la máscara del día.
+
+    ValueError si una hora no es HH:MM, si el tramo no cumple
+    00:00 <= inicio < fin <= 24:00 o si no cae en bloques de 5 minutos."""
+    mascara = 0
+    for inicio, fin in tramos:
+        desde, hasta = _minutos(inicio), _minutos(fin)
+        if not 0 <= desde < hasta <= 24 * 60:
+            raise ValueError(f"Tramo inválido {inicio}-{fin}: el inicio debe ser anterior al fin "
+                             "y el fin no puede pasar de 24:00")
+        if desde % MINUTOS_POR_BIT or hasta % MINUTOS_POR_BIT:
+            raise ValueError(f"Tramo inválido {inicio}-{fin}: las horas deben ser múltiplos de "
+                             f"{MINUTOS_POR_BIT} minutos")
+        mascara |= mascara_rango(desde, hasta)
+    return mascara
+
+
+def tramos_de_mascara(mascara):
+    """Inverso de mascara_de_tramos, para mostrar el horario"""
+    tramos, bit = [], 0
+    while bit < BITS_POR_DIA:
+        if mascara >> bit & 1:
+            inicio = bit
+            while bit < BITS_POR_DIA and mascara >> bit & 1:
+                bit += 1
+            tramos.append((_hora(inicio * MINUTOS_POR_BIT), _hora(bit * MINUTOS_POR_BIT)))
+        else:
+            bit += 1
+    return tramos
+
+
+def a_bytes(mascara):
+    return mascara.to_bytes(BYTES_POR_DIA, "little")
+
+
+def de_bytes(datos):
+    return int.from_bytes(bytes(datos), "little") if datos is not None else 0
+
+
+_HORA = re.compile(r"(\d{2}):([0-5]\d)")
+
+
+def _minutos(texto):
+    coincidencia = _HORA.fullmatch(texto)
+    if coincidencia is None:
+        raise ValueError(f"Hora inválida {texto!r}: use HH:MM")
+    return int(coincidencia.group(1)) * 60 + int(coincidencia.group(2))
+
+
+def _hora(minutos):
+    return f"{minutos // 60:02d}:{minutos % 60:02d}"
+
+
+class Horario:
+    """Plantilla semanal de un médico más sus excepciones por fecha"""
+
+    def __init__(self, semana=None, excepciones=None):
+        self.semana = list(semana) if semana else [0] * 7
+        self.excepciones = dict(excepciones or {})
+
+    def mascara_dia(self, dia):
+        if dia in self.excepciones:
+            return self.excepciones[dia]
+        return self.semana[dia.weekday()]
+
+    def trabaja(self, instante):
+        return bool(self.mascara_dia(instante.date()) >> bit_de(instante) & 1)
+
+    def cubre(self, instante, duracion=DURACION_CITA_MINUTOS):
+        """True si todo el intervalo [instante, instante + duración) es laborable"""
+        mascara = mascara_cita(instante, duracion)
+        return self.mascara_dia(instante.date()) & mascara == mascara
+
+    def minutos_libres(self, dia, ocupados=0):
+        return (self.mascara_dia(dia) & ~ocupados).bit_count() * MINUTOS_POR_BIT
+
+
+class CacheHorarios:
+    """Horarios por médico leídos de la base de datos y guardados en memoria.
+
+    Las entradas caducan a los `ttl` segundos para que otros procesos vean los
+    cambios de plantilla; en el proceso que los hace se invalidan al momento.
+    """
+
+    def __init__(self, conectar, ttl=60):
+        self._conectar = conectar
+        self.ttl = ttl
+        self._horarios = {}
+        self._lock = threading.Lock()
+
+    def obtener(self, id_medico):
+        """Horario del médico, o None si aún no tiene plantilla definida"""
+        return self.obtener_varios([id_medico])[id_medico]
+
+    def obtener_varios(self, ids_medico):
+        """{IdMedico: horario o None}; los que no están en memoria se leen juntos"""
+        ahora = time.monotonic()
+        horarios, faltan = {}, []
+        with self._lock:
+            for id_medico in set(ids_medico):
+                entrada = self._horarios.get(id_medico)
+                if entrada is not None and ahora - entrada[1] < self.ttl:
+                    horarios[id_medico] = entrada[0]
+                else:
+                    faltan.append(id_medico)
+        if horarios:
+            cache_consultas.inc("horarios", "acierto", valor=len(horarios))
+        if faltan:
+            cache_consultas.inc("horarios", "fallo", valor=len(faltan))
+            leidos = self._leer(faltan)
+            with self._lock:
+                for id_medico, horario in leidos.items():
+                    self._horarios[id_medico] = (horario, time.monotonic())
+            horarios.update(leidos)
+        return horarios
+
+    def invalidar(self, id_medico=None):
+        """Olvidar un médico, o todos si no se indica ninguno (p. ej. un feriado)"""
+        with self._lock:
+            if id_medico is None:
+                self._horarios.clear()
+            else:
+                self._horarios.pop(id_medico, None)
+
+    def _leer(self, ids_medico):
+        """Plantillas y excepciones de varios médicos con una consulta de cada una"""
+        conn = self._conectar()
+        cursor = conn.cursor()
+        marcadores = ", ".join("?" for _ in ids_medico)
+        cursor.execute(f"""
+            SELECT IdMedico, DiaSemana, Bloques FROM HorariosMedicos WHERE IdMedico IN ({marcadores})
+        """, *ids_medico)
+        semanas = {}
+        for fila in cursor.fetchall():
+            semanas.setdefault(fila.IdMedico, [0] * 7)[fila.DiaSemana] = de_bytes(fila.Bloques)
+        if not semanas:
+            conn.close()
+            return {id_medico: None for id_medico in ids_medico}
+        # Las excepciones sin médico (IdMedico NULL) son feriados de toda la clínica;
+        # las del médico se aplican después y los reemplazan
+        con_plantilla = list(semanas)
+        marcadores = ", ".join("?" for _ in con_plantilla)
+        cursor.execute(f"""
+            SELECT IdMedico, Fecha, Bloques FROM ExcepcionesHorario
+            WHERE IdMedico IN ({marcadores}) OR IdMedico IS NULL
+            ORDER BY CASE WHEN IdMedico IS NULL THEN 0 ELSE 1 END
+        """, *con_plantilla)
+        feriados, excepciones = {}, {id_medico: {} for id_medico in con_plantilla}
+        for fila in cursor.fetchall():
+            fecha = fila.Fecha.date() if isinstance(fila.Fecha, datetime) else fila.Fecha
+            if fila.IdMedico is None:
+                feriados[fecha] = de_bytes(fila.Bloques)
+            else:
+                excepciones[fila.IdMedico][fecha] = de_bytes(fila.Bloques)
+        conn.close()
+        return {
+            id_medico: Horario(semanas[id_medico], {**feriados, **excepciones[id_medico]})
+            if id_medico in semanas else None
+            for id_medico in ids_medico
+        }
+
+
+def validar_cita(horario, instante, duracion=DURACION_CITA_MINUTOS):
+    """Mensaje de error si el médico no atiende en ese horario, None si es válido"""
+    if horario is None:
+        return None
+    if not horario.cubre(instante, duracion):
+        fin = instante + timedelta(minutes=duracion)
+        return f"El médico no atiende entre {instante:%Y-%m-%d %H:%M} y {fin:%H:%M}"
+    return None
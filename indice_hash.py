@@ -0,0 +1,58 @@
+import threading
+
+
+class IndiceHash:
+    """Índice exacto en memoria: valor normalizado -> ids que lo tienen"""
+
+    def __init__(self, normalizador):
+        self.normalizador = normalizador
+        self._ids_por_valor = {}
+        self._valor_por_id = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._valor_por_id)
+
+    def cargar(self, pares):
+        """Reconstruir el índice a partir de tuplas (id, valor)"""
+        ids_por_valor = {}
+        valor_por_id = {}
+        for identificador, valor in pares:
+            valor = self.normalizador(valor)
+            if valor:
+                ids_por_valor.setdefault(valor, set()).add(identificador)
+                valor_por_id[identificador] = valor
+        with self._lock:
+            self._ids_por_valor = ids_por_valor
+            self._valor_por_id = valor_por_id
+
+    def agregar(self, identificador, valor):
+        valor = self.normalizador(valor)
+        with self._lock:
+            self._quitar(identificador)
+            if valor:
+                self._ids_por_valor.setdefault(valor, set()).add(identificador)
+                self._valor_por_id[identificador] = valor
+
+    def eliminar(self, identificador):
+        with self._lock:
+            self._quitar(identificador)
+
+    def _quitar(self, identificador):
+        valor = self._valor_por_id.pop(identificador, None)
+        if valor is None:
+            return
+        ids = self._ids_por_valor.get(valor)
+        ids.discard(identificador)
+        if not ids:
+            del self._ids_por_valor[valor]
+
+    def valor(self, identificador):
+        """Valor normalizado guardado para el id, o None"""
+        with self._lock:
+            return self._valor_por_id.get(identificador)
+
+    def buscar(self, valor):
+        valor = self.normalizador(valor)
+        with self._lock:
+            return sorted(self._ids_por_valor.get(valor, ()))
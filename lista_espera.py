@@ -0,0 +1,86 @@
+import heapq
+import itertools
+import threading
+
+
+class EntradaEspera:
+    def __init__(self, id_espera, id_paciente, id_medico, especialidad, prioridad, desde, hasta, alta):
+        self.IdEspera = id_espera
+        self.IdPaciente = id_paciente
+        self.IdMedico = id_medico
+        self.Especialidad = especialidad
+        self.Prioridad = prioridad
+        self.Desde = desde
+        self.Hasta = hasta
+        self.Alta = alta
+
+    def acepta(self, instante):
+        return (self.Desde is None or instante >= self.Desde) and (self.Hasta is None or instante <= self.Hasta)
+
+    def a_dict(self):
+        return dict(vars(self))
+
+
+class ListaEspera:
+    """Pacientes en espera en montículos por médico y por especialidad.
+
+    El orden es (Prioridad, Alta): menor prioridad numérica primero y, a
+    igualdad, quien llegó antes. Las bajas se marcan y se descartan al salir
+    del montículo.
+    """
+
+    def __init__(self):
+        self._por_medico = {}
+        self._por_especialidad = {}
+        self._entradas = {}
+        self._secuencia = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def agregar(self, entrada):
+        with self._lock:
+            self._entradas[entrada.IdEspera] = entrada
+            item = (entrada.Prioridad, entrada.Alta, next(self._secuencia), entrada.IdEspera)
+            if entrada.IdMedico is not None:
+                heapq.heappush(self._por_medico.setdefault(entrada.IdMedico, []), item)
+            else:
+                heapq.heappush(self._por_especialidad.setdefault(entrada.Especialidad, []), item)
+
+    def obtener(self, id_espera):
+        with self._lock:
+            return self._entradas.get(id_espera)
+
+    def quitar(self, id_espera):
+        with self._lock:
+            return self._entradas.pop(id_espera, None)
+
+    def _mejor_de(self, monticulo, instante):
+        """Primer item vigente del montículo que acepta el instante (sin sacarlo)"""
+        descartados, mejor = [], None
+        while monticulo:
+            item = heapq.heappop(monticulo)
+            entrada = self._entradas.get(item[3])
+            if entrada is None:
+                continue
+            descartados.append(item)
+            if entrada.acepta(instante):
+                mejor = item
+                break
+        for item in descartados:
+            heapq.heappush(monticulo, item)
+        return mejor
+
+    def tomar_mejor(self, id_medico, especialidad, instante):
+        """Sacar de la lista al mejor candidato para un horario liberado"""
+        with self._lock:
+            candidatos = [
+                item for item in (
+                    self._mejor_de(self._por_medico.get(id_medico, []), instante),
+                    self._mejor_de(self._por_especialidad.get(especialidad, []), instante),
+                ) if item is not None
+            ]
+            if not candidatos:
+                return None
+            return self._entradas.pop(min(candidatos)[3])
@@ -1,9 +1,35 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, HTTPException, Request
 from pydantic import BaseModel
-import pyodbc
+from datetime import date, datetime
+from typing import List, Tuple
+import threading
+
+from acceso_datos import conectar, conectar_sin_medir, marcar_endpoint
+from autocompletado import IndicePrefijos
+from horarios import (
+    CacheHorarios, a_bytes, mascara_cita, mascara_de_tramos, tramos_de_mascara
+)
+from metricas import instrumentar_fastapi
+from perfilador import instrumentar_fastapi as perfilar_fastapi
+from planes import instrumentar_fastapi as planes_fastapi
+from trazas import instrumentar_fastapi as trazar_fastapi
+from models.cita import ESTADOS_INACTIVOS
+
+
+async def _marcar_endpoint(request: Request):
+    marcar_endpoint(request.method, request.scope["route"].path)
 
 
-app = FastAPI()
+app = FastAPI(dependencies=[Depends(_marcar_endpoint)])
+instrumentar_fastapi(app)
+trazar_fastapi(app)
+perfilar_fastapi(app)
+planes_fastapi(app, lambda: conectar_sin_medir(connection_string))
+
+# Índice en memoria para el autocompletado por nombre y especialidad
+indice_medicos = IndicePrefijos()
+_indice_cargado = False
+_lock_indice = threading.Lock()
 
 
 connection_string = (
@@ -21,17 +47,71 @@ class Medico(BaseModel):
     Telefono: str
     Email: str
 
+
+# Tramos ("HH:MM", "HH:MM") en los que el médico atiende cada día de la semana
+class PlantillaHorario(BaseModel):
+    Lunes: List[Tuple[str, str]] = []
+    Martes: List[Tuple[str, str]] = []
+    Miercoles: List[Tuple[str, str]] = []
+    Jueves: List[Tuple[str, str]] = []
+    Viernes: List[Tuple[str, str]] = []
+    Sabado: List[Tuple[str, str]] = []
+    Domingo: List[Tuple[str, str]] = []
+
+
+# Sin tramos, la fecha queda como no laborable (vacaciones, feriado)
+class ExcepcionHorario(BaseModel):
+    Fecha: date
+    Tramos: List[Tuple[str, str]] = []
+
+
+DIAS_SEMANA = ["Lunes", "Martes", "Miercoles", "Jueves", "Viernes", "Sabado", "Domingo"]
+
+horarios_medicos = CacheHorarios(lambda: conectar(connection_string))
+
+
+def _mascara_tramos(tramos):
+    """Máscara de los tramos pedidos o 422 si alguno no es válido"""
+    try:
+        return mascara_de_tramos(tramos)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+def _registro_indice(id, nombre, apellido, especialidad):
+    nombre_completo = f"{nombre} {apellido}"
+    return id, f"{nombre_completo} ({especialidad})", [nombre_completo, especialidad]
+
+
+def _cargar_indice():
+    global _indice_cargado
+    with _lock_indice:
+        if _indice_cargado:
+            return
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("SELECT IdMedico, Nombre, Apellido, Especialidad FROM Medicos")
+        indice_medicos.cargar(
+            _registro_indice(row.IdMedico, row.Nombre, row.Apellido, row.Especialidad)
+            for row in cursor.fetchall()
+        )
+        conn.close()
+        _indice_cargado = True
+
 @app.post("/medicos")
 def crear_medico(medico: Medico):
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("""
             INSERT INTO Medicos (Nombre, Apellido, Especialidad, Telefono, Email)
+            OUTPUT INSERTED.IdMedico
             VALUES (?, ?, ?, ?, ?)
         """, medico.Nombre, medico.Apellido, medico.Especialidad, medico.Telefono, medico.Email)
+        id = cursor.fetchone()[0]
         conn.commit()
         conn.close()
+        indice_medicos.agregar(*_registro_indice(id, medico.Nombre, medico.Apellido, medico.Especialidad))
         return {"mensaje": "Médico creado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -39,7 +119,7 @@ def crear_medico(medico: Medico):
 @app.get("/medicos")
 def obtener_medicos():
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM Medicos")
         rows = cursor.fetchall()
@@ -58,18 +138,141 @@ def obtener_medicos():
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/medicos/autocompletar")
+def autocompletar_medicos(q: str = "", limite: int = 10):
+    try:
+        _cargar_indice()
+        return indice_medicos.buscar(q, min(limite, 50))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/medicos/feriados")
+def crear_feriado(excepcion: ExcepcionHorario):
+    try:
+        bloques = a_bytes(_mascara_tramos(excepcion.Tramos))
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ExcepcionesHorario WHERE IdMedico IS NULL AND Fecha = ?", excepcion.Fecha)
+        cursor.execute("""
+            INSERT INTO ExcepcionesHorario (IdMedico, Fecha, Bloques) VALUES (NULL, ?, ?)
+        """, excepcion.Fecha, bloques)
+        conn.commit()
+        conn.close()
+        horarios_medicos.invalidar()
+        return {"mensaje": "Feriado registrado exitosamente"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/medicos/{id}/horario")
+def obtener_horario(id: int):
+    try:
+        horario = horarios_medicos.obtener(id)
+        if horario is None:
+            raise HTTPException(status_code=404, detail="El médico no tiene horario definido")
+        return {
+            "semana": {dia: tramos_de_mascara(horario.semana[i]) for i, dia in enumerate(DIAS_SEMANA)},
+            "excepciones": [
+                {"Fecha": fecha, "Tramos": tramos_de_mascara(mascara)}
+                for fecha, mascara in sorted(horario.excepciones.items())
+            ]
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/medicos/{id}/horario")
+def actualizar_horario(id: int, plantilla: PlantillaHorario):
+    try:
+        filas = [(id, i, a_bytes(_mascara_tramos(getattr(plantilla, dia)))) for i, dia in enumerate(DIAS_SEMANA)]
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM HorariosMedicos WHERE IdMedico = ?", id)
+        cursor.executemany(
+            "INSERT INTO HorariosMedicos (IdMedico, DiaSemana, Bloques) VALUES (?, ?, ?)",
+            filas
+        )
+        conn.commit()
+        conn.close()
+        horarios_medicos.invalidar(id)
+        return {"mensaje": "Horario actualizado exitosamente"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/medicos/{id}/excepciones")
+def crear_excepcion(id: int, excepcion: ExcepcionHorario):
+    try:
+        bloques = a_bytes(_mascara_tramos(excepcion.Tramos))
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM ExcepcionesHorario WHERE IdMedico = ? AND Fecha = ?", id, excepcion.Fecha)
+        cursor.execute("""
+            INSERT INTO ExcepcionesHorario (IdMedico, Fecha, Bloques) VALUES (?, ?, ?)
+        """, id, excepcion.Fecha, bloques)
+        conn.commit()
+        conn.close()
+        horarios_medicos.invalidar(id)
+        return {"mensaje": "Excepción registrada exitosamente"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/medicos/{id}/disponible")
+def medico_disponible(id: int, instante: datetime):
+    try:
+        horario = horarios_medicos.obtener(id)
+        if horario is None:
+            raise HTTPException(status_code=404, detail="El médico no tiene horario definido")
+        return {"IdMedico": id, "instante": instante, "trabaja": horario.trabaja(instante)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/medicos/{id}/minutos-libres")
+def minutos_libres(id: int, fecha: date):
+    try:
+        horario = horarios_medicos.obtener(id)
+        if horario is None:
+            raise HTTPException(status_code=404, detail="El médico no tiene horario definido")
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        inactivos = ", ".join("?" for _ in ESTADOS_INACTIVOS)
+        cursor.execute(f"""
+            SELECT FechaCita FROM Citas
+            WHERE IdMedico = ? AND FechaCita >= ? AND FechaCita < DATEADD(day, 1, ?)
+              AND Estado NOT IN ({inactivos})
+        """, id, fecha, fecha, *ESTADOS_INACTIVOS)
+        ocupados = 0
+        for row in cursor.fetchall():
+            ocupados |= mascara_cita(row.FechaCita)
+        conn.close()
+        return {"IdMedico": id, "fecha": fecha, "minutos_libres": horario.minutos_libres(fecha, ocupados)}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.put("/medicos/{id}")
 def actualizar_medico(id: int, medico: Medico):
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("""
             UPDATE Medicos
             SET Nombre = ?, Apellido = ?, Especialidad = ?, Telefono = ?, Email = ?
             WHERE IdMedico = ?
         """, medico.Nombre, medico.Apellido, medico.Especialidad, medico.Telefono, medico.Email, id)
+        actualizados = cursor.rowcount
         conn.commit()
         conn.close()
+        if actualizados:
+            indice_medicos.agregar(*_registro_indice(id, medico.Nombre, medico.Apellido, medico.Especialidad))
         return {"mensaje": "Médico actualizado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -77,11 +280,12 @@ def actualizar_medico(id: int, medico: Medico):
 @app.delete("/medicos/{id}")
 def eliminar_medico(id: int):
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("DELETE FROM Medicos WHERE IdMedico = ?", id)
         conn.commit()
         conn.close()
+        indice_medicos.eliminar(id)
         return {"mensaje": "Médico eliminado exitosamente"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
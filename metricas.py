@@ -0,0 +1,282 @@
+"""Métricas de las APIs en el formato de texto de Prometheus.
+
+Cada hilo suma en su propio fragmento (un dict en threading.local), así que
+anotar no toma ningún lock: son un par de operaciones de diccionario. Solo la
+lectura de /metrics recorre los fragmentos de todos los hilos y los suma; los
+de hilos que terminaron se pliegan en un acumulado para no perder cuentas.
+
+`instrumentar_flask(app)` e `instrumentar_fastapi(app)` agregan la ruta
+/metrics y miden cada petición: latencia por ruta, método y estado, peticiones
+en curso, viajes a la base por petición (los cuenta acceso_datos) y las
+peticiones con patrones N+1 o que se pasaron de su presupuesto (ver viajes).
+"""
+import math
+import threading
+import time
+import weakref
+
+from viajes import Viajes, viajes_peticion
+
+LIMITES_SEGUNDOS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_VIAJES = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+TIPO_CONTENIDO = "text/plain; version=0.0.4; charset=utf-8"
+
+_metricas = []
+
+
+class _Fragmentos:
+    """Un dict de valores por hilo; cada hilo escribe solo en el suyo"""
+
+    def __init__(self, combinar):
+        self._combinar = combinar
+        self._local = threading.local()
+        self._vivos = []
+        self._retirados = {}
+        self._lock = threading.Lock()
+
+    def propio(self):
+        try:
+            return self._local.valores
+        except AttributeError:
+            valores = self._local.valores = {}
+            with self._lock:
+                self._vivos.append(valores)
+            weakref.finalize(threading.current_thread(), self._retirar, valores)
+            return valores
+
+    def _retirar(self, valores):
+        with self._lock:
+            self._vivos = [v for v in self._vivos if v is not valores]
+            for clave, valor in valores.items():
+                self._retirados[clave] = self._combinar(self._retirados.get(clave), valor)
+
+    def sumar(self):
+        with self._lock:
+            fragmentos = [dict(self._retirados)] + [dict(v) for v in self._vivos]
+        total = {}
+        for fragmento in fragmentos:
+            for clave, valor in fragmento.items():
+                total[clave] = self._combinar(total.get(clave), valor)
+        return total
+
+
+def _sumar_numeros(a, b):
+    return b if a is None else a + b
+
+
+def _sumar_listas(a, b):
+    return list(b) if a is None else [x + y for x, y in zip(a, b)]
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = tuple(etiquetas)
+        _metricas.append(self)
+
+    def _etiquetas(self, valores, extra=""):
+        pares = [f'{e}="{_escapar(str(v))}"' for e, v in zip(self.etiquetas, valores)]
+        if extra:
+            pares.append(extra)
+        return "{" + ",".join(pares) + "}" if pares else ""
+
+    def _cabecera(self):
+        return [f"# HELP {self.nombre} {self.ayuda}", f"# TYPE {self.nombre} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda, etiquetas=()):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._fragmentos = _Fragmentos(_sumar_numeros)
+
+    def inc(self, *etiquetas, valor=1):
+        valores = self._fragmentos.propio()
+        valores[etiquetas] = valores.get(etiquetas, 0) + valor
+
+    def valores(self):
+        return self._fragmentos.sumar()
+
+    def exponer(self):
+        lineas = self._cabecera()
+        for etiquetas, valor in sorted(self.valores().items()):
+            lineas.append(f"{self.nombre}{self._etiquetas(etiquetas)} {_numero(valor)}")
+        return lineas
+
+
+class Medidor(Contador):
+    """Valor que sube y baja (cada hilo acumula sus propias diferencias), o
+    calculado al leer si se pasa `calcular()` -> {etiquetas: valor}"""
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), calcular=None):
+        super().__init__(nombre, ayuda, etiquetas)
+        self._calcular = calcular
+
+    def valores(self):
+        return self._calcular() if self._calcular else super().valores()
+
+
+class Histograma(_Metrica):
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, etiquetas=(), limites=LIMITES_SEGUNDOS):
+        super().__init__(nombre, ayuda, etiquetas)
+        self.limites = tuple(limites)
+        self._fragmentos = _Fragmentos(_sumar_listas)
+
+    def observar(self, valor, *etiquetas):
+        """Anotar `valor`; la lista guarda un cubo por límite, +Inf, suma y cantidad"""
+        valores = self._fragmentos.propio()
+        cubos = valores.get(etiquetas)
+        if cubos is None:
+            cubos = valores[etiquetas] = [0] * (len(self.limites) + 3)
+        i = 0
+        limites = self.limites
+        while i < len(limites) and valor > limites[i]:
+            i += 1
+        cubos[i] += 1
+        cubos[-2] += valor
+        cubos[-1] += 1
+
+    def exponer(self):
+        lineas = self._cabecera()
+        for etiquetas, cubos in sorted(self._fragmentos.sumar().items()):
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + (math.inf,), cubos):
+                acumulado += cuenta
+                le = 'le="+Inf"' if limite == math.inf else f'le="{_numero(limite)}"'
+                lineas.append(f"{self.nombre}_bucket{self._etiquetas(etiquetas, le)} {acumulado}")
+            lineas.append(f"{self.nombre}_sum{self._etiquetas(etiquetas)} {_numero(cubos[-2])}")
+            lineas.append(f"{self.nombre}_count{self._etiquetas(etiquetas)} {cubos[-1]}")
+        return lineas
+
+
+def _escapar(texto):
+    return texto.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _numero(valor):
+    if isinstance(valor, float) and valor.is_integer():
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+def _tasa_aciertos():
+    tasas = {}
+    consultas = cache_consultas.valores()
+    for cache in {c for c, _ in consultas}:
+        aciertos = consultas.get((cache, "acierto"), 0)
+        total = aciertos + consultas.get((cache, "fallo"), 0)
+        tasas[(cache,)] = aciertos / total if total else 0.0
+    return tasas
+
+
+duracion_peticiones = Histograma(
+    "clinica_peticion_duracion_segundos", "Duración de las peticiones HTTP",
+    ("metodo", "ruta", "estado"))
+peticiones_en_curso = Medidor("clinica_peticiones_en_curso", "Peticiones HTTP en curso")
+viajes_por_peticion = Histograma(
+    "clinica_db_viajes_por_peticion", "Sentencias enviadas a la base por petición",
+    ("metodo", "ruta"), LIMITES_VIAJES)
+n_mas_uno = Contador(
+    "clinica_db_n_mas_uno_total", "Peticiones con una misma sentencia repetida (posible N+1)",
+    ("metodo", "ruta"))
+presupuesto_excedido = Contador(
+    "clinica_db_presupuesto_excedido_total", "Peticiones que superaron su presupuesto de viajes",
+    ("metodo", "ruta"))
+espera_conexion = Histograma(
+    "clinica_db_conexion_espera_segundos", "Tiempo para obtener una conexión del pool de ODBC")
+cache_consultas = Contador(
+    "clinica_cache_consultas_total", "Consultas a las cachés en memoria", ("cache", "resultado"))
+cache_tasa_aciertos = Medidor(
+    "clinica_cache_tasa_aciertos", "Fracción de consultas a la caché servidas sin ir a la base",
+    ("cache",), calcular=_tasa_aciertos)
+
+
+def exponer():
+    """Todas las métricas en el formato de texto de Prometheus"""
+    lineas = []
+    for metrica in _metricas:
+        lineas.extend(metrica.exponer())
+    return "\n".join(lineas) + "\n"
+
+
+def _terminar_peticion(comienzo, viajes, metodo, ruta, estado):
+    peticiones_en_curso.inc(valor=-1)
+    duracion_peticiones.observar(time.perf_counter() - comienzo, metodo, ruta, estado)
+    viajes_por_peticion.observar(viajes.total, metodo, ruta)
+    if viajes.revisar(f"{metodo} {ruta}"):
+        n_mas_uno.inc(metodo, ruta)
+    if viajes.excedido:
+        presupuesto_excedido.inc(metodo, ruta)
+
+
+def instrumentar_flask(app):
+    from flask import Response, g, request
+
+    @app.before_request
+    def _comenzar_metricas():
+        peticiones_en_curso.inc()
+        g.metricas = [time.perf_counter(), viajes_peticion.set(Viajes()), 500]
+
+    @app.after_request
+    def _estado_metricas(respuesta):
+        if "metricas" in g:
+            g.metricas[2] = respuesta.status_code
+        return respuesta
+
+    @app.teardown_request
+    def _terminar_metricas(error=None):
+        metricas = g.pop("metricas", None)
+        if metricas is None:
+            return
+        comienzo, token, estado = metricas
+        viajes = viajes_peticion.get()
+        viajes_peticion.reset(token)
+        ruta = request.url_rule.rule if request.url_rule else "-"
+        _terminar_peticion(comienzo, viajes, request.method, ruta, estado)
+
+    app.add_url_rule("/metrics", "metrics", lambda: Response(exponer(), content_type=TIPO_CONTENIDO))
+
+
+class MiddlewareMetricas:
+    """Middleware ASGI: mide cada petición HTTP sin envolverla en otra tarea"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+            await send(mensaje)
+
+        peticiones_en_curso.inc()
+        viajes = Viajes()
+        token = viajes_peticion.set(viajes)
+        comienzo = time.perf_counter()
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            viajes_peticion.reset(token)
+            ruta = getattr(scope.get("route"), "path", "-")
+            _terminar_peticion(comienzo, viajes, scope["method"], ruta, estado[0])
+
+
+def instrumentar_fastapi(app):
+    from fastapi.responses import Response
+
+    app.add_middleware(MiddlewareMetricas)
+    app.add_api_route("/metrics", lambda: Response(exponer(), media_type=TIPO_CONTENIDO),
+                      include_in_schema=False)
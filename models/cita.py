@@ -0,0 +1,20 @@
+from pydantic import BaseModel
+from datetime import datetime
+
+
+class Cita(BaseModel):
+    IdPaciente: int
+    IdMedico: int
+    FechaCita: datetime
+    Motivo: str
+    Estado: str
+
+
+# Las citas en estos estados no ocupan el horario del médico
+ESTADOS_INACTIVOS = ("Cancelada",)
+
+# Transiciones que aplica transiciones_estado.py cuando la cita ya pasó
+TRANSICIONES_VENCIDAS = {
+    "Pendiente": "Ausente",
+    "Confirmada": "Completada",
+}
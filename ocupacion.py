@@ -0,0 +1,116 @@
+import threading
+from datetime import date, timedelta
+
+from horarios import DURACION_CITA_MINUTOS, mascara_cita
+from metricas import cache_consultas
+
+
+class OcupacionMedicos:
+    """Máscaras de bloques ocupados por (médico, día), cargadas bajo demanda.
+
+    `leer(id_medico, dia)` devuelve las tuplas (clave, FechaCita) activas de
+    ese día; se llama solo la primera vez que se consulta un día. La clave es
+    el IdCita o, para ocurrencias de series aún no materializadas, una tupla
+    ("serie", IdSerie, FechaCita).
+
+    Si otro proceso materializa una ocurrencia de un día ya cargado, la cita
+    creada no está en memoria y el horario sigue bajo la clave de la serie:
+    `liberar` con el horario anterior y `recargar` resuelven ese caso.
+    """
+
+    def __init__(self, leer):
+        self._leer = leer
+        self._dias = {}
+        self._ubicacion = {}
+        self._lock = threading.Lock()
+
+    def _citas_dia(self, id_medico, dia):
+        clave = (id_medico, dia)
+        with self._lock:
+            citas = self._dias.get(clave)
+        if citas is not None:
+            cache_consultas.inc("ocupacion", "acierto")
+            return citas
+        cache_consultas.inc("ocupacion", "fallo")
+        leidas = {id_cita: mascara_cita(fecha) for id_cita, fecha in self._leer(id_medico, dia)}
+        with self._lock:
+            if clave not in self._dias:
+                self._podar()
+                self._dias[clave] = leidas
+                for id_cita in leidas:
+                    self._ubicacion[id_cita] = clave
+            return self._dias[clave]
+
+    def conoce(self, id_cita):
+        with self._lock:
+            return id_cita in self._ubicacion
+
+    def recargar(self, id_medico, dia):
+        """Volver a leer un día ya cargado; conserva las claves temporales
+        (tuplas que no son de series), que no están en la base"""
+        clave = (id_medico, dia)
+        leidas = {id_cita: mascara_cita(fecha) for id_cita, fecha in self._leer(id_medico, dia)}
+        with self._lock:
+            anteriores = self._dias.get(clave, {})
+            for id_cita in anteriores:
+                if self._ubicacion.get(id_cita) == clave:
+                    del self._ubicacion[id_cita]
+            for id_cita, mascara in anteriores.items():
+                if isinstance(id_cita, tuple) and id_cita[0] != "serie":
+                    leidas[id_cita] = mascara
+            self._dias[clave] = leidas
+            for id_cita in leidas:
+                self._ubicacion[id_cita] = clave
+
+    def _podar(self):
+        """Descartar los días ya pasados; nadie vuelve a reservar en ellos"""
+        ayer = date.today() - timedelta(days=1)
+        for clave in [c for c in self._dias if c[1] < ayer]:
+            for id_cita in self._dias.pop(clave):
+                self._ubicacion.pop(id_cita, None)
+
+    def mascara(self, id_medico, dia, excluir=None):
+        citas = self._citas_dia(id_medico, dia)
+        ocupados = 0
+        with self._lock:
+            for id_cita, mascara in citas.items():
+                if id_cita != excluir:
+                    ocupados |= mascara
+        return ocupados
+
+    def choca(self, id_medico, instante, excluir=None, duracion=DURACION_CITA_MINUTOS):
+        return bool(self.mascara(id_medico, instante.date(), excluir) & mascara_cita(instante, duracion))
+
+    def ocupar(self, id_cita, id_medico, instante, duracion=DURACION_CITA_MINUTOS, cargar=True):
+        """Marcar el horario de una cita; con cargar=False solo si el día ya está en memoria"""
+        self.liberar(id_cita)
+        if cargar:
+            citas = self._citas_dia(id_medico, instante.date())
+        else:
+            with self._lock:
+                citas = self._dias.get((id_medico, instante.date()))
+            if citas is None:
+                return
+        with self._lock:
+            citas[id_cita] = mascara_cita(instante, duracion)
+            self._ubicacion[id_cita] = (id_medico, instante.date())
+
+    def liberar(self, id_cita, id_medico=None, instante=None):
+        """Quitar una cita; si no está en memoria y se indica dónde estaba, se
+        quita la ocurrencia de serie de ese horario (la cita es esa ocurrencia,
+        materializada por otro proceso)"""
+        with self._lock:
+            clave = self._ubicacion.pop(id_cita, None)
+            if clave is not None:
+                if clave in self._dias:
+                    self._dias[clave].pop(id_cita, None)
+                return
+            if instante is None:
+                return
+            clave = (id_medico, instante.date())
+            citas = self._dias.get(clave)
+            if citas is None:
+                return
+            for otra in [c for c in citas if isinstance(c, tuple) and c[0] == "serie" and c[2] == instante]:
+                del citas[otra]
+                self._ubicacion.pop(otra, None)
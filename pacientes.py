@@ -1,17 +1,123 @@
 from flask import Flask, request, jsonify
-import pyodbc
+import threading
+
+from acceso_datos import conectar, conectar_sin_medir, marcar_endpoint
+from autocompletado import IndicePrefijos
+from fusion_pacientes import fusionar
+from indice_hash import IndiceHash
+from metricas import instrumentar_flask
+from perfilador import instrumentar_flask as perfilar_flask
+from planes import instrumentar_flask as planes_flask
+from trazas import instrumentar_flask as trazar_flask
+from texto import normalizar_email, normalizar_telefono
 
 app = Flask(__name__)
+instrumentar_flask(app)
+trazar_flask(app)
+perfilar_flask(app)
+
+# Índices en memoria para el autocompletado y las búsquedas exactas; se cargan
+# al arrancar (o en la primera consulta) y después se mantienen al día con cada
+# alta, modificación y baja.
+indice_nombres = IndicePrefijos()
+indice_telefono = IndiceHash(normalizar_telefono)
+indice_email = IndiceHash(normalizar_email)
+_indices_cargados = False
+_lock_indices = threading.Lock()
+
+
+connection_string = (
+    'DRIVER={ODBC Driver 17 for SQL Server};'
+    'SERVER=localhost;'
+    'DATABASE=ClinicaMedica;'
+    'UID=usuario_sql;'
+    'PWD=beatriz1902'
+)
 
 
 def conexion():
-    return pyodbc.connect(
-        'DRIVER={ODBC Driver 17 for SQL Server};'
-        'SERVER=localhost;'
-        'DATABASE=ClinicaMedica;'
-        'UID=usuario_sql;'
-        'PWD=beatriz1902'
-    )
+    return conectar(connection_string)
+
+
+planes_flask(app, lambda: conectar_sin_medir(connection_string))
+
+
+@app.before_request
+def _marcar_endpoint():
+    marcar_endpoint(request.method, request.url_rule.rule if request.url_rule else "-")
+
+
+def _cargar_indices():
+    global _indices_cargados
+    with _lock_indices:
+        if _indices_cargados:
+            return
+        conn = conexion()
+        cursor = conn.cursor()
+        cursor.execute("SELECT IdPaciente, Nombre, Apellido, Telefono, Email FROM Pacientes")
+        filas = cursor.fetchall()
+        conn.close()
+        indice_nombres.cargar(
+            (fila.IdPaciente, f"{fila.Nombre} {fila.Apellido}", [f"{fila.Nombre} {fila.Apellido}"])
+            for fila in filas
+        )
+        indice_telefono.cargar((fila.IdPaciente, fila.Telefono) for fila in filas)
+        indice_email.cargar((fila.IdPaciente, fila.Email) for fila in filas)
+        _indices_cargados = True
+
+
+def _indexar_paciente(id, datos):
+    nombre = f"{datos['Nombre']} {datos['Apellido']}"
+    indice_nombres.agregar(id, nombre, [nombre])
+    indice_telefono.agregar(id, datos.get('Telefono'))
+    indice_email.agregar(id, datos.get('Email'))
+
+
+def _refrescar_exactos(paciente):
+    """Poner al día los índices exactos con una fila leída de la base; solo
+    escribe si el valor cambió (otro proceso lo modificó)"""
+    id = paciente['IdPaciente']
+    for indice, campo in ((indice_telefono, 'Telefono'), (indice_email, 'Email')):
+        if indice.valor(id) != (indice.normalizador(paciente[campo]) or None):
+            indice.agregar(id, paciente[campo])
+
+
+def _desindexar_paciente(id):
+    indice_nombres.eliminar(id)
+    indice_telefono.eliminar(id)
+    indice_email.eliminar(id)
+
+
+def _pacientes_por_ids(cursor, ids):
+    marcadores = ", ".join("?" for _ in ids)
+    cursor.execute(f"SELECT * FROM Pacientes WHERE IdPaciente IN ({marcadores})", ids)
+    columnas = [col[0] for col in cursor.description]
+    return [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+
+
+def _buscar_exacto(indice, campo, consulta_respaldo, valor):
+    """Resolver primero con el índice en memoria y, si no hay coincidencias o
+    las filas ya no tienen ese valor (otro proceso las modificó o borró), con
+    el índice de la base de datos"""
+    _cargar_indices()
+    clave = indice.normalizador(valor)
+    ids = indice.buscar(valor)
+    conn = conexion()
+    cursor = conn.cursor()
+    pacientes = _pacientes_por_ids(cursor, ids) if ids else []
+    vigentes = [paciente for paciente in pacientes if indice.normalizador(paciente[campo]) == clave]
+    if not ids or len(vigentes) != len(ids):
+        for id in set(ids) - {paciente['IdPaciente'] for paciente in pacientes}:
+            _desindexar_paciente(id)
+        for paciente in pacientes:
+            _refrescar_exactos(paciente)
+        cursor.execute(consulta_respaldo, (clave,))
+        ids = [fila[0] for fila in cursor.fetchall()]
+        pacientes = _pacientes_por_ids(cursor, ids) if ids else []
+        for paciente in pacientes:
+            _refrescar_exactos(paciente)
+    conn.close()
+    return pacientes
 
 
 @app.route('/api/pacientes', methods=['GET'])
@@ -25,6 +131,42 @@ def obtener_pacientes():
     return jsonify(pacientes)
 
 
+@app.route('/api/pacientes/autocompletar', methods=['GET'])
+def autocompletar_pacientes():
+    _cargar_indices()
+    prefijo = request.args.get('q', '')
+    limite = min(request.args.get('limite', 10, type=int), 50)
+    return jsonify(indice_nombres.buscar(prefijo, limite))
+
+
+@app.route('/api/pacientes/telefono/<telefono>', methods=['GET'])
+def obtener_pacientes_por_telefono(telefono):
+    if not normalizar_telefono(telefono):
+        return jsonify({"mensaje": "Teléfono no válido"}), 400
+    pacientes = _buscar_exacto(
+        indice_telefono,
+        'Telefono',
+        "SELECT IdPaciente FROM Pacientes WHERE TelefonoNormalizado = ?",
+        telefono
+    )
+    if not pacientes:
+        return jsonify({"mensaje": "Paciente no encontrado"}), 404
+    return jsonify(pacientes)
+
+
+@app.route('/api/pacientes/email/<email>', methods=['GET'])
+def obtener_pacientes_por_email(email):
+    pacientes = _buscar_exacto(
+        indice_email,
+        'Email',
+        "SELECT IdPaciente FROM Pacientes WHERE Email = ?",
+        email
+    )
+    if not pacientes:
+        return jsonify({"mensaje": "Paciente no encontrado"}), 404
+    return jsonify(pacientes)
+
+
 @app.route('/api/pacientes/<int:id>', methods=['GET'])
 def obtener_paciente(id):
     conn = conexion()
@@ -45,18 +187,23 @@ def agregar_paciente():
     datos_lista = request.get_json()  # Esto ahora será una lista de diccionarios
     conn = conexion()
     cursor = conn.cursor()
+    ids = []
     
     for datos in datos_lista:  # Iteramos sobre cada paciente
         cursor.execute("""
             INSERT INTO Pacientes (Nombre, Apellido, FechaNacimiento, Sexo, Telefono, Direccion, Email)
+            OUTPUT INSERTED.IdPaciente
             VALUES (?, ?, ?, ?, ?, ?, ?)
         """, (
             datos['Nombre'], datos['Apellido'], datos['FechaNacimiento'], datos['Sexo'],
             datos.get('Telefono', None), datos.get('Direccion', None), datos.get('Email', None)
         ))
+        ids.append(cursor.fetchone()[0])
     
     conn.commit()
     conn.close()
+    for id, datos in zip(ids, datos_lista):
+        _indexar_paciente(id, datos)
     return jsonify({"mensaje": f"{len(datos_lista)} pacientes agregados correctamente"}), 201
 
 
@@ -73,8 +220,11 @@ def actualizar_paciente(id):
         datos['Nombre'], datos['Apellido'], datos['FechaNacimiento'], datos['Sexo'],
         datos['Telefono'], datos['Direccion'], datos['Email'], id
     ))
+    actualizados = cursor.rowcount
     conn.commit()
     conn.close()
+    if actualizados:
+        _indexar_paciente(id, datos)
     return jsonify({"mensaje": "Paciente actualizado correctamente"})
 
 
@@ -85,8 +235,33 @@ def eliminar_paciente(id):
     cursor.execute("DELETE FROM Pacientes WHERE IdPaciente = ?", (id,))
     conn.commit()
     conn.close()
+    _desindexar_paciente(id)
     return jsonify({"mensaje": "Paciente eliminado correctamente"})
 
 
+@app.route('/api/pacientes/fusionar', methods=['POST'])
+def fusionar_pacientes():
+    datos_lista = request.get_json()  # Lista de {"IdSobreviviente": ..., "IdDuplicado": ...}
+    if not isinstance(datos_lista, list):
+        return jsonify({"mensaje": "Se esperaba una lista de pares"}), 400
+    pares = [(datos['IdSobreviviente'], datos['IdDuplicado']) for datos in datos_lista]
+    tamano_lote = request.args.get('lote', 250, type=int)
+    conn = conexion()
+    lotes = []
+    try:
+        for informe in fusionar(conn, pares, tamano_lote):
+            for id in informe.pop('duplicados'):
+                _desindexar_paciente(id)
+            lotes.append(informe)
+    finally:
+        conn.close()
+    return jsonify({
+        "pacientes_eliminados": sum(l['pacientes_eliminados'] for l in lotes),
+        "citas_movidas": sum(l['citas_movidas'] for l in lotes),
+        "lotes": lotes
+    })
+
+
 if __name__ == '__main__':
+    _cargar_indices()
     app.run(debug=True, port=5000)
@@ -0,0 +1,250 @@
+"""Perfilador por muestreo que se enciende en caliente desde un endpoint de admin.
+
+POST /admin/perfil?segundos=10[&intervalo_ms=5][&ruta=GET /citas/][&fraccion=0.1]
+
+Mientras dura, un hilo toma cada `intervalo_ms` las pilas de los demás hilos
+con sys._current_frames(), sin trazar llamadas, así que el costo es el mismo
+haya una petición o cien. Sin `ruta` se muestrea todo el proceso; con `ruta`
+solo los hilos que atienden una petición de esa ruta elegida al azar con
+probabilidad `fraccion`. En FastAPI eso incluye el hilo del event loop, donde
+se validan las peticiones y se serializan las respuestas, y los hilos del pool
+que ejecutan el endpoint de la ruta; mientras haya una muestreada en curso,
+esas muestras pueden mezclar otras peticiones que corren a la vez.
+
+Devuelve las pilas plegadas ("raíz;...;hoja cuenta"), listas para
+flamegraph.pl o speedscope. Solo para administradores (ver admin.autorizado).
+"""
+import contextvars
+import random
+import sys
+import threading
+import time
+
+from admin import autorizado
+
+MAX_SEGUNDOS = 120
+MIN_INTERVALO_MS = 1
+
+_activo = None
+_lock = threading.Lock()
+
+# Registros de perfil de la petición en curso, para liberarlos al terminar (FastAPI)
+_registro_peticion = contextvars.ContextVar("registro_perfil", default=None)
+
+
+class Ocupado(Exception):
+    pass
+
+
+class Perfil:
+    """Pilas plegadas con su cuenta de muestras.
+
+    `coincide(metodo, ruta)` decide si una petición es de la ruta perfilada y
+    `codigos` son los code objects de su endpoint, para reconocer los hilos del
+    pool que la están ejecutando.
+    """
+
+    def __init__(self, intervalo, coincide=None, fraccion=1.0, codigos=()):
+        self.intervalo = intervalo
+        self.coincide = coincide
+        self.fraccion = fraccion
+        self.codigos = frozenset(codigos)
+        self.pilas = {}
+        self.muestras = 0
+        self._hilos = {}
+
+    def entrar(self, metodo, ruta):
+        """Al empezar una petición; devuelve el hilo registrado o None"""
+        if not self.coincide(metodo, ruta) or random.random() >= self.fraccion:
+            return None
+        hilo = threading.get_ident()
+        self._hilos[hilo] = self._hilos.get(hilo, 0) + 1
+        return hilo
+
+    def salir(self, hilo):
+        if hilo is None:
+            return
+        restantes = self._hilos.get(hilo, 1) - 1
+        if restantes:
+            self._hilos[hilo] = restantes
+        else:
+            self._hilos.pop(hilo, None)
+
+    def _en_endpoint(self, marco):
+        while marco is not None:
+            if marco.f_code in self.codigos:
+                return True
+            marco = marco.f_back
+        return False
+
+    def muestrear(self, excluir):
+        nombres = {hilo.ident: hilo.name for hilo in threading.enumerate()}
+        for ident, marco in sys._current_frames().items():
+            if ident in excluir:
+                continue
+            if self.coincide is not None and ident not in self._hilos and not (
+                    self._hilos and self.codigos and self._en_endpoint(marco)):
+                continue
+            pila = []
+            while marco is not None:
+                codigo = marco.f_code
+                pila.append(f"{marco.f_globals.get('__name__', '?')}:{codigo.co_qualname}")
+                marco = marco.f_back
+            pila.append(nombres.get(ident, str(ident)))
+            plegada = ";".join(reversed(pila))
+            self.pilas[plegada] = self.pilas.get(plegada, 0) + 1
+        self.muestras += 1
+
+    def correr(self, segundos):
+        excluir = {threading.get_ident()}
+        fin = time.monotonic() + segundos
+        while time.monotonic() < fin:
+            self.muestrear(excluir)
+            time.sleep(self.intervalo)
+
+    def plegado(self):
+        return "".join(f"{pila} {cuenta}\n" for pila, cuenta in
+                       sorted(self.pilas.items(), key=lambda par: par[1], reverse=True))
+
+
+def perfilar(segundos, intervalo_ms=5, coincide=None, fraccion=1.0, codigos=()):
+    """Muestrear durante `segundos` en el hilo que llama; uno a la vez"""
+    global _activo
+    segundos = min(max(float(segundos), 0.1), MAX_SEGUNDOS)
+    perfil = Perfil(max(float(intervalo_ms), MIN_INTERVALO_MS) / 1000, coincide,
+                    min(max(float(fraccion), 0.0), 1.0), codigos)
+    with _lock:
+        if _activo is not None:
+            raise Ocupado("Ya hay un perfil en curso")
+        _activo = perfil
+    try:
+        perfil.correr(segundos)
+    finally:
+        with _lock:
+            _activo = None
+    return perfil
+
+
+def entrar(metodo, ruta):
+    """(perfil, hilo) si la petición queda muestreada por un perfil por ruta"""
+    perfil = _activo
+    if perfil is None or perfil.coincide is None:
+        return None
+    hilo = perfil.entrar(metodo, ruta)
+    return (perfil, hilo) if hilo is not None else None
+
+
+def salir(registro):
+    if registro is not None:
+        registro[0].salir(registro[1])
+
+
+def _ruta_pedida(texto):
+    """"GET /citas/" -> ("GET", "/citas/")"""
+    metodo, _, ruta = (texto or "").strip().partition(" ")
+    return metodo.upper(), ruta.strip()
+
+
+def _codigos(funcion):
+    codigos = []
+    while funcion is not None:
+        if hasattr(funcion, "__code__"):
+            codigos.append(funcion.__code__)
+        funcion = getattr(funcion, "__wrapped__", None)
+    return codigos
+
+
+def instrumentar_flask(app):
+    from flask import Response, g, jsonify, request
+
+    @app.before_request
+    def _perfil_entrar():
+        if _activo is not None and request.url_rule is not None:
+            g.perfil = entrar(request.method, request.url_rule.rule)
+
+    @app.teardown_request
+    def _perfil_salir(error=None):
+        salir(g.pop("perfil", None))
+
+    @app.route('/admin/perfil', methods=['POST'])
+    def perfil_admin():
+        if not autorizado(request.headers.get("Authorization"), request.headers.get("X-Admin-Token")):
+            return jsonify({"mensaje": "No autorizado"}), 403
+        coincide = None
+        if request.args.get('ruta'):
+            metodo, ruta = _ruta_pedida(request.args['ruta'])
+            reglas = [r for r in app.url_map.iter_rules() if r.rule == ruta and metodo in r.methods]
+            if not reglas:
+                return jsonify({"mensaje": f"Ruta desconocida: {request.args['ruta']}"}), 404
+            coincide = lambda m, r: m == metodo and r == ruta
+        try:
+            perfil = perfilar(request.args.get('segundos', 10, type=float),
+                              request.args.get('intervalo_ms', 5, type=float), coincide,
+                              request.args.get('fraccion', 1.0, type=float))
+        except Ocupado as e:
+            return jsonify({"mensaje": str(e)}), 409
+        return Response(perfil.plegado(), mimetype="text/plain",
+                        headers={"X-Muestras": str(perfil.muestras)})
+
+
+class MiddlewarePerfil:
+    """Deja un lugar para el registro de la petición y lo libera al terminar;
+    lo llena la dependencia `_perfil_entrar`, que ya conoce la ruta resuelta"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _activo is None or _activo.coincide is None:
+            await self.app(scope, receive, send)
+            return
+        lugar = []
+        token = _registro_peticion.set(lugar)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _registro_peticion.reset(token)
+            for registro in lugar:
+                salir(registro)
+
+
+def instrumentar_fastapi(app):
+    """Middleware, dependencia de la app (solo afecta a las rutas que se
+    declaren o incluyan después) y la ruta /admin/perfil"""
+    from typing import Optional
+
+    from fastapi import Depends, HTTPException, Request
+    from fastapi.responses import PlainTextResponse
+
+    async def _perfil_entrar(request: Request):
+        lugar = _registro_peticion.get()
+        if lugar is None or _activo is None:
+            return
+        ruta = request.scope["route"]
+        # Se corre en el hilo del event loop, antes de pasar al pool
+        registro = entrar(request.method, ruta.path)
+        if registro is not None:
+            if not registro[0].codigos:
+                registro[0].codigos = frozenset(_codigos(ruta.endpoint))
+            lugar.append(registro)
+
+    app.add_middleware(MiddlewarePerfil)
+    app.router.dependencies.append(Depends(_perfil_entrar))
+
+    def perfil_admin(request: Request, segundos: float = 10, intervalo_ms: float = 5,
+                     ruta: Optional[str] = None, fraccion: float = 1.0):
+        if not autorizado(request.headers.get("Authorization"), request.headers.get("X-Admin-Token")):
+            raise HTTPException(status_code=403, detail="No autorizado")
+        coincide = None
+        if ruta:
+            metodo, plantilla = _ruta_pedida(ruta)
+            if metodo.lower() not in app.openapi().get("paths", {}).get(plantilla, {}):
+                raise HTTPException(status_code=404, detail=f"Ruta desconocida: {ruta}")
+            coincide = lambda m, r: m == metodo and r == plantilla
+        try:
+            perfil = perfilar(segundos, intervalo_ms, coincide, fraccion)
+        except Ocupado as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return PlainTextResponse(perfil.plegado(), headers={"X-Muestras": str(perfil.muestras)})
+
+    app.add_api_route("/admin/perfil", perfil_admin, methods=["POST"], include_in_schema=False)
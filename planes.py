@@ -0,0 +1,257 @@
+"""Planes de ejecución de las consultas lentas, agrupados por hash de plan.
+
+Cada consulta lenta que anota acceso_datos se busca en la caché de planes de
+SQL Server (sys.dm_exec_query_stats por el texto de la sentencia) y se guarda
+el plan real de su última ejecución (sys.dm_exec_query_plan_stats, requiere
+LAST_QUERY_PLAN_STATS = ON en la base) o, si no está, el plan en caché. La
+búsqueda se hace en un hilo aparte con una conexión sin instrumentar y el
+usuario necesita el permiso VIEW SERVER STATE.
+
+Para que la captura no sume carga:
+  - se limita con un cubo de fichas (CLINICA_PLANES_POR_MINUTO, 6 por omisión;
+    0 la desactiva) y lo que no entra en la cola se descarta;
+  - una sentencia con plan capturado hace menos de CLINICA_PLANES_VIGENCIA
+    segundos (600) no se vuelve a buscar: su lentitud se suma a ese plan.
+
+GET /admin/planes lista los planes con sus cuentas y duraciones;
+GET /admin/planes/<hash> devuelve el XML (se abre en SSMS como .sqlplan).
+"""
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from acceso_datos import registro
+from admin import autorizado
+
+logger = logging.getLogger(__name__)
+
+POR_MINUTO = float(os.environ.get("CLINICA_PLANES_POR_MINUTO", "6"))
+VIGENCIA_SEGUNDOS = float(os.environ.get("CLINICA_PLANES_VIGENCIA", "600"))
+
+CONSULTA_PLAN = r"""
+    SELECT TOP 1
+        CONVERT(VARCHAR(18), qs.query_plan_hash, 1) AS HashPlan,
+        CONVERT(NVARCHAR(MAX), COALESCE(ps.query_plan, qp.query_plan)) AS PlanXml,
+        CASE WHEN ps.query_plan IS NULL THEN 0 ELSE 1 END AS Real
+    FROM sys.dm_exec_query_stats qs
+    CROSS APPLY sys.dm_exec_sql_text(qs.sql_handle) st
+    CROSS APPLY sys.dm_exec_query_plan(qs.plan_handle) qp
+    OUTER APPLY sys.dm_exec_query_plan_stats(qs.plan_handle) ps
+    WHERE st.text LIKE ? ESCAPE '\' AND st.text NOT LIKE '%dm_exec_query_stats%'
+    ORDER BY qs.last_execution_time DESC
+"""
+
+
+def patron_like(sentencia):
+    """Patrón LIKE para encontrar la sentencia normalizada en la caché de planes:
+    los `?` pasan a ser @P1, @P2... y los espacios pueden ser saltos de línea"""
+    escapada = sentencia
+    for caracter in ("\\", "%", "_", "["):
+        escapada = escapada.replace(caracter, "\\" + caracter)
+    escapada = escapada.replace("?, ...", "?").replace("?", "%").replace(" ", "%")
+    return f"%{escapada}%"
+
+
+class CuboFichas:
+    def __init__(self, por_segundo, capacidad):
+        self.por_segundo = por_segundo
+        self.capacidad = capacidad
+        self._fichas = capacidad
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def tomar(self):
+        with self._lock:
+            ahora = time.monotonic()
+            self._fichas = min(self.capacidad, self._fichas + (ahora - self._ultimo) * self.por_segundo)
+            self._ultimo = ahora
+            if self._fichas < 1:
+                return False
+            self._fichas -= 1
+            return True
+
+
+class Plan:
+    def __init__(self, hash_plan, xml, real):
+        self.hash = hash_plan
+        self.xml = xml
+        self.real = real
+        self.sentencias = {}
+        self.lentas = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.capturas = 0
+        self.ultima = None
+
+    def anotar(self, entrada):
+        self.sentencias[entrada["sentencia"]] = self.sentencias.get(entrada["sentencia"], 0) + 1
+        self.lentas += 1
+        self.total_ms += entrada["ms"]
+        self.max_ms = max(self.max_ms, entrada["ms"])
+        self.ultima = entrada["fecha"]
+
+    def resumen(self):
+        return {
+            "hash": self.hash,
+            "real": self.real,
+            "lentas": self.lentas,
+            "total_ms": round(self.total_ms, 3),
+            "media_ms": round(self.total_ms / self.lentas, 3) if self.lentas else None,
+            "max_ms": round(self.max_ms, 3),
+            "capturas": self.capturas,
+            "ultima": self.ultima,
+            "sentencias": dict(self.sentencias),
+        }
+
+
+class Capturador:
+    """Se suscribe a las consultas lentas y guarda un plan por hash"""
+
+    def __init__(self, conectar, por_minuto=POR_MINUTO, vigencia=VIGENCIA_SEGUNDOS):
+        self._conectar = conectar
+        self._cubo = CuboFichas(por_minuto / 60, max(1, por_minuto / 2))
+        self.vigencia = vigencia
+        self._planes = {}
+        self._vigentes = {}
+        self._cola = queue.Queue(maxsize=100)
+        self._lock = threading.Lock()
+        self._conexion = None
+        self.descartadas = 0
+        self.sin_plan = 0
+        threading.Thread(target=self._capturar, name="capturar-planes", daemon=True).start()
+
+    def al_detectar_lenta(self, entrada):
+        with self._lock:
+            vigente = self._vigentes.get(entrada["sentencia"])
+            if vigente is not None and time.monotonic() - vigente[1] < self.vigencia:
+                self._planes[vigente[0]].anotar(entrada)
+                return
+        if not self._cubo.tomar():
+            self.descartadas += 1
+            return
+        try:
+            self._cola.put_nowait(entrada)
+        except queue.Full:
+            self.descartadas += 1
+
+    def _buscar(self, sentencia):
+        if self._conexion is None:
+            self._conexion = self._conectar()
+        cursor = self._conexion.cursor()
+        try:
+            cursor.execute(CONSULTA_PLAN, patron_like(sentencia))
+            return cursor.fetchone()
+        except Exception:
+            self._conexion.close()
+            self._conexion = None
+            raise
+        finally:
+            if self._conexion is not None:
+                cursor.close()
+
+    def _capturar(self):
+        while True:
+            entrada = self._cola.get()
+            try:
+                fila = self._buscar(entrada["sentencia"])
+            except Exception:
+                logger.exception("No se pudo leer el plan de %s", entrada["sentencia"])
+                continue
+            with self._lock:
+                if fila is None:
+                    self.sin_plan += 1
+                    continue
+                plan = self._planes.get(fila.HashPlan)
+                if plan is None:
+                    plan = self._planes[fila.HashPlan] = Plan(fila.HashPlan, fila.PlanXml, bool(fila.Real))
+                elif fila.Real or not plan.real:
+                    plan.xml, plan.real = fila.PlanXml, bool(fila.Real)
+                plan.capturas += 1
+                plan.anotar(entrada)
+                self._vigentes[entrada["sentencia"]] = (plan.hash, time.monotonic())
+
+    def resumen(self):
+        with self._lock:
+            planes = [p.resumen() for p in self._planes.values()]
+        return {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "umbral_ms": registro.umbral_ms,
+            "descartadas": self.descartadas,
+            "sin_plan": self.sin_plan,
+            "planes": sorted(planes, key=lambda p: p["total_ms"], reverse=True),
+        }
+
+    def plan(self, hash_plan):
+        with self._lock:
+            plan = self._planes.get(hash_plan)
+            return plan.xml if plan else None
+
+
+capturador = None
+
+
+def activar(conectar):
+    """Empezar a capturar planes con conexiones de `conectar()`; una vez por proceso"""
+    global capturador
+    if capturador is None and POR_MINUTO > 0:
+        capturador = Capturador(conectar)
+        registro.suscribir_lentas(capturador.al_detectar_lenta)
+    return capturador
+
+
+def instrumentar_flask(app, conectar):
+    from flask import Response, jsonify, request
+
+    activar(conectar)
+
+    def _autorizado():
+        return autorizado(request.headers.get("Authorization"), request.headers.get("X-Admin-Token"))
+
+    @app.route('/admin/planes', methods=['GET'])
+    def planes_admin():
+        if not _autorizado():
+            return jsonify({"mensaje": "No autorizado"}), 403
+        if capturador is None:
+            return jsonify({"mensaje": "Captura de planes desactivada"}), 404
+        return jsonify(capturador.resumen())
+
+    @app.route('/admin/planes/<hash_plan>', methods=['GET'])
+    def plan_admin(hash_plan):
+        if not _autorizado():
+            return jsonify({"mensaje": "No autorizado"}), 403
+        xml = capturador.plan(hash_plan) if capturador else None
+        if xml is None:
+            return jsonify({"mensaje": "Plan no encontrado"}), 404
+        return Response(xml, mimetype="application/xml", headers={
+            "Content-Disposition": f'attachment; filename="{hash_plan}.sqlplan"'})
+
+
+def instrumentar_fastapi(app, conectar):
+    from fastapi import HTTPException, Request
+    from fastapi.responses import Response
+
+    activar(conectar)
+
+    def _verificar(request):
+        if not autorizado(request.headers.get("Authorization"), request.headers.get("X-Admin-Token")):
+            raise HTTPException(status_code=403, detail="No autorizado")
+
+    def planes_admin(request: Request):
+        _verificar(request)
+        if capturador is None:
+            raise HTTPException(status_code=404, detail="Captura de planes desactivada")
+        return capturador.resumen()
+
+    def plan_admin(hash_plan: str, request: Request):
+        _verificar(request)
+        xml = capturador.plan(hash_plan) if capturador else None
+        if xml is None:
+            raise HTTPException(status_code=404, detail="Plan no encontrado")
+        return Response(xml, media_type="application/xml", headers={
+            "Content-Disposition": f'attachment; filename="{hash_plan}.sqlplan"'})
+
+    app.add_api_route("/admin/planes", planes_admin, methods=["GET"], include_in_schema=False)
+    app.add_api_route("/admin/planes/{hash_plan}", plan_admin, methods=["GET"], include_in_schema=False)
@@ -0,0 +1,308 @@
+"""Recordatorios de citas por email y SMS, 24 h y 2 h antes de FechaCita.
+
+Uso: python recordatorios.py --smtp-host localhost --smtp-port 1025 \\
+         --sms-url http://localhost:8080/sms
+
+Cada `--ventana` minutos se leen de una vez las citas cuyo recordatorio vence
+en la ventana siguiente y se programan en una rueda de temporizadores. Al
+vencer, se agrupan en lotes y se envían por conexiones SMTP/HTTP reutilizadas
+de un pool. Lo enviado se anota en RecordatoriosEnviados, que sirve además de
+registro para no repetir envíos (si el proceso cae entre el envío y la
+anotación, ese recordatorio puede salir dos veces). Para probar en local
+sirve cualquier servidor SMTP de depuración (p. ej. `python -m aiosmtpd -n`)
+y cualquier servicio HTTP que acepte POST.
+"""
+import argparse
+import json
+import logging
+import queue
+import smtplib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from email.message import EmailMessage
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from urllib.parse import urlsplit
+
+import pyodbc
+
+from models.cita import ESTADOS_INACTIVOS
+from rueda_temporal import RuedaTemporal
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=MANUEL\\MSSQL2022;"
+    "DATABASE=ClinicaMedica;"
+    "Trusted_Connection=yes;"
+)
+
+logger = logging.getLogger(__name__)
+
+ANTICIPACIONES = {"24h": timedelta(hours=24), "2h": timedelta(hours=2)}
+MAX_INTENTOS = 5
+
+
+class PoolSMTP:
+    """Conexiones SMTP abiertas y reutilizadas entre lotes"""
+
+    def __init__(self, host, port, tamano=4, usuario=None, clave=None, tls=False):
+        self.host, self.port, self.usuario, self.clave, self.tls = host, port, usuario, clave, tls
+        self.tamano = tamano
+        self._libres = queue.LifoQueue()
+        for _ in range(tamano):
+            self._libres.put(None)
+
+    def _abrir(self):
+        conexion = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.tls:
+            conexion.starttls()
+        if self.usuario:
+            conexion.login(self.usuario, self.clave)
+        return conexion
+
+    def enviar_lote(self, mensajes):
+        """Enviar EmailMessage por una sola conexión; devuelve los que fallaron"""
+        conexion = self._libres.get()
+        fallidos = []
+        try:
+            for mensaje in mensajes:
+                try:
+                    if conexion is None:
+                        conexion = self._abrir()
+                    conexion.send_message(mensaje)
+                except (smtplib.SMTPException, OSError):
+                    logger.exception("Fallo SMTP enviando a %s", mensaje["To"])
+                    fallidos.append(mensaje)
+                    self._descartar(conexion)
+                    conexion = None
+        finally:
+            self._libres.put(conexion)
+        return fallidos
+
+    @staticmethod
+    def _descartar(conexion):
+        """QUIT si el servidor todavía responde; si no, cerrar el socket igual"""
+        if conexion is None:
+            return
+        try:
+            conexion.quit()
+        except (smtplib.SMTPException, OSError):
+            conexion.close()
+
+    def cerrar(self):
+        while not self._libres.empty():
+            self._descartar(self._libres.get())
+
+
+class PoolHTTP:
+    """Conexiones keep-alive a la pasarela de SMS; cada lote es un solo POST"""
+
+    def __init__(self, url, tamano=4, timeout=30):
+        partes = urlsplit(url)
+        self._clase = HTTPSConnection if partes.scheme == "https" else HTTPConnection
+        self._destino = partes.netloc
+        self._ruta = partes.path or "/"
+        self.timeout = timeout
+        self.tamano = tamano
+        self._libres = queue.LifoQueue()
+        for _ in range(tamano):
+            self._libres.put(None)
+
+    def enviar_lote(self, mensajes):
+        """POST de una lista JSON de {"telefono", "texto"}; devuelve los que fallaron"""
+        conexion = self._libres.get()
+        try:
+            if conexion is None:
+                conexion = self._clase(self._destino, timeout=self.timeout)
+            cuerpo = json.dumps(mensajes).encode("utf-8")
+            conexion.request("POST", self._ruta, body=cuerpo,
+                             headers={"Content-Type": "application/json"})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            if respuesta.status >= 300:
+                logger.error("La pasarela de SMS respondió %s", respuesta.status)
+                return mensajes
+            return []
+        except (OSError, HTTPException):
+            # HTTPException (BadStatusLine, IncompleteRead...) deja la conexión a
+            # mitad de un pedido: no sirve para el siguiente y no vuelve al pool
+            logger.exception("Fallo HTTP enviando %d SMS", len(mensajes))
+            if conexion is not None:
+                conexion.close()
+            conexion = None
+            return mensajes
+        finally:
+            self._libres.put(conexion)
+
+    def cerrar(self):
+        while not self._libres.empty():
+            conexion = self._libres.get()
+            if conexion is not None:
+                conexion.close()
+
+
+class Despachador:
+    def __init__(self, conectar, smtp, sms, remitente, ventana_minutos=10, tamano_lote=50):
+        self._conectar = conectar
+        self.smtp = smtp
+        self.sms = sms
+        self.remitente = remitente
+        self.ventana = timedelta(minutes=ventana_minutos)
+        self.tamano_lote = tamano_lote
+        self._pools = {"email": smtp, "sms": sms}
+        self._rueda = RuedaTemporal(resolucion=1.0, ranuras=3600, reloj=time.time)
+        self._pendientes = {}
+        self._hasta = {tipo: None for tipo in ANTICIPACIONES}
+        hilos = (smtp.tamano if smtp else 0) + (sms.tamano if sms else 0)
+        self._hilos = ThreadPoolExecutor(max_workers=max(hilos, 1), thread_name_prefix="recordatorios")
+
+    def cargar_ventana(self, ahora):
+        """Programar los recordatorios que vencen antes de ahora + ventana"""
+        conn = self._conectar()
+        cursor = conn.cursor()
+        inactivos = ", ".join("?" for _ in ESTADOS_INACTIVOS)
+        for tipo, anticipacion in ANTICIPACIONES.items():
+            desde = self._hasta[tipo] or ahora + anticipacion
+            hasta = ahora + anticipacion + self.ventana
+            if hasta <= desde:
+                continue
+            cursor.execute(f"""
+                SELECT c.IdCita, c.FechaCita, p.Nombre, p.Telefono, p.Email,
+                       m.Nombre + ' ' + m.Apellido AS NombreMedico,
+                       e.Canal AS Enviado
+                FROM Citas c
+                JOIN Pacientes p ON p.IdPaciente = c.IdPaciente
+                JOIN Medicos m ON m.IdMedico = c.IdMedico
+                LEFT JOIN RecordatoriosEnviados e ON e.IdCita = c.IdCita AND e.Tipo = ?
+                WHERE c.FechaCita >= ? AND c.FechaCita < ? AND c.Estado NOT IN ({inactivos})
+            """, tipo, desde, hasta, *ESTADOS_INACTIVOS)
+            filas = cursor.fetchall()
+            enviados = {(fila.IdCita, fila.Enviado) for fila in filas if fila.Enviado}
+            for fila in filas:
+                for canal, destino in (("email", fila.Email), ("sms", fila.Telefono)):
+                    clave = (fila.IdCita, tipo, canal)
+                    if not self._pools[canal] or not destino or (fila.IdCita, canal) in enviados or clave in self._pendientes:
+                        continue
+                    self._pendientes[clave] = {"fila": fila, "destino": destino, "intentos": 0}
+                    self._rueda.agregar(clave, (fila.FechaCita - anticipacion).timestamp())
+            self._hasta[tipo] = hasta
+        conn.close()
+
+    def _texto(self, fila):
+        return (f"Hola {fila.Nombre}, le recordamos su cita con {fila.NombreMedico} "
+                f"el {fila.FechaCita:%d/%m/%Y} a las {fila.FechaCita:%H:%M}.")
+
+    def despachar(self):
+        """Enviar en lotes los recordatorios vencidos; reprograma los fallidos"""
+        vencidos = self._rueda.avanzar()
+        if not vencidos:
+            return 0
+        por_canal = {"email": [], "sms": []}
+        for clave in vencidos:
+            por_canal[clave[2]].append(clave)
+
+        trabajos = []
+        if por_canal["email"]:
+            for i in range(0, len(por_canal["email"]), self.tamano_lote):
+                claves = por_canal["email"][i:i + self.tamano_lote]
+                mensajes = []
+                for clave in claves:
+                    mensaje = EmailMessage()
+                    mensaje["From"] = self.remitente
+                    mensaje["To"] = self._pendientes[clave]["destino"]
+                    mensaje["Subject"] = "Recordatorio de cita"
+                    mensaje["X-Clave-Recordatorio"] = "-".join(map(str, clave))
+                    mensaje.set_content(self._texto(self._pendientes[clave]["fila"]))
+                    mensajes.append(mensaje)
+                trabajos.append((claves, self._hilos.submit(self.smtp.enviar_lote, mensajes),
+                                 lambda m: tuple(m["X-Clave-Recordatorio"].split("-"))))
+        if por_canal["sms"]:
+            for i in range(0, len(por_canal["sms"]), self.tamano_lote):
+                claves = por_canal["sms"][i:i + self.tamano_lote]
+                mensajes = [
+                    {"clave": "-".join(map(str, clave)),
+                     "telefono": self._pendientes[clave]["destino"],
+                     "texto": self._texto(self._pendientes[clave]["fila"])}
+                    for clave in claves
+                ]
+                trabajos.append((claves, self._hilos.submit(self.sms.enviar_lote, mensajes),
+                                 lambda m: tuple(m["clave"].split("-"))))
+
+        enviados = []
+        for claves, futuro, clave_de in trabajos:
+            fallidos = {clave_de(m) for m in futuro.result()}
+            for clave in claves:
+                if (str(clave[0]), clave[1], clave[2]) in fallidos:
+                    self._reintentar(clave)
+                else:
+                    enviados.append(clave)
+                    del self._pendientes[clave]
+        self._anotar(enviados)
+        return len(enviados)
+
+    def _reintentar(self, clave):
+        pendiente = self._pendientes[clave]
+        pendiente["intentos"] += 1
+        if pendiente["intentos"] >= MAX_INTENTOS:
+            logger.error("Se descarta el recordatorio %s tras %d intentos", clave, MAX_INTENTOS)
+            del self._pendientes[clave]
+            return
+        self._rueda.agregar(clave, time.time() + 30 * 2 ** pendiente["intentos"])
+
+    def _anotar(self, enviados):
+        if not enviados:
+            return
+        conn = self._conectar()
+        cursor = conn.cursor()
+        cursor.fast_executemany = True
+        cursor.executemany("""
+            INSERT INTO RecordatoriosEnviados (IdCita, Tipo, Canal)
+            SELECT ?, ?, ?
+            WHERE NOT EXISTS (
+                SELECT 1 FROM RecordatoriosEnviados WHERE IdCita = ? AND Tipo = ? AND Canal = ?
+            )
+        """, [clave + clave for clave in enviados])
+        conn.commit()
+        conn.close()
+
+    def ejecutar(self, intervalo=1.0):
+        proxima_carga = datetime.min
+        while True:
+            ahora = datetime.now()
+            if ahora >= proxima_carga:
+                self.cargar_ventana(ahora)
+                proxima_carga = ahora + self.ventana / 2
+            enviados = self.despachar()
+            if enviados:
+                logger.info("%d recordatorios enviados", enviados)
+            time.sleep(intervalo)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Enviar recordatorios de citas")
+    parser.add_argument("--smtp-host", help="servidor SMTP (sin esto no se envían emails)")
+    parser.add_argument("--smtp-port", type=int, default=25)
+    parser.add_argument("--smtp-usuario")
+    parser.add_argument("--smtp-clave")
+    parser.add_argument("--smtp-tls", action="store_true")
+    parser.add_argument("--remitente", default="recordatorios@clinica.local")
+    parser.add_argument("--sms-url", help="URL de la pasarela de SMS (sin esto no se envían SMS)")
+    parser.add_argument("--conexiones", type=int, default=4, help="conexiones por pool")
+    parser.add_argument("--lote", type=int, default=50, help="mensajes por lote")
+    parser.add_argument("--ventana", type=int, default=10, help="minutos que se leen por adelantado")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    smtp = PoolSMTP(args.smtp_host, args.smtp_port, args.conexiones, args.smtp_usuario,
+                    args.smtp_clave, args.smtp_tls) if args.smtp_host else None
+    sms = PoolHTTP(args.sms_url, args.conexiones) if args.sms_url else None
+    despachador = Despachador(lambda: pyodbc.connect(connection_string), smtp, sms,
+                              args.remitente, args.ventana, args.lote)
+    try:
+        despachador.ejecutar()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pool in (smtp, sms):
+            if pool:
+                pool.cerrar()
@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+
+from horarios import DURACION_CITA_MINUTOS, inicios_libres, mascara_cita
+
+
+def _minuto(instante):
+    return instante.hour * 60 + instante.minute
+
+
+def planificar(citas, libres, id_medico, paso=DURACION_CITA_MINUTOS):
+    """Asignar a cada cita un horario libre sin choques entre sí.
+
+    `citas` son dicts con IdCita, IdMedico y FechaCita en orden cronológico;
+    `libres` mapea (IdMedico, fecha) a la máscara de bloques disponibles y se
+    va descontando a medida que se asigna, así dos citas nunca reciben el
+    mismo horario. Se prefiere el día más cercano, luego la hora más parecida
+    y, a igualdad, el mismo médico. Devuelve (movimientos, sin_asignar).
+    """
+    movimientos, sin_asignar = [], []
+    for cita in citas:
+        original = cita["FechaCita"]
+        mejor = None
+        for (medico, dia), mascara in libres.items():
+            for minuto in inicios_libres(mascara, paso):
+                costo = (abs((dia - original.date()).days), abs(minuto - _minuto(original)),
+                         medico != id_medico, medico)
+                if mejor is None or costo < mejor[0]:
+                    mejor = (costo, medico, dia, minuto)
+        if mejor is None:
+            sin_asignar.append(cita)
+            continue
+        _, medico, dia, minuto = mejor
+        nueva = datetime.combine(dia, datetime.min.time()) + timedelta(minutes=minuto)
+        libres[(medico, dia)] &= ~mascara_cita(nueva)
+        movimientos.append({
+            "IdCita": cita["IdCita"],
+            "IdPaciente": cita["IdPaciente"],
+            "Desde": {"IdMedico": cita["IdMedico"], "FechaCita": original},
+            "Hacia": {"IdMedico": medico, "FechaCita": nueva}
+        })
+    return movimientos, sin_asignar
@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from horarios import DURACION_CITA_MINUTOS, mascara_cita
+from rueda_temporal import RuedaTemporal
+
+
+class Retencion:
+    def __init__(self, id_retencion, id_paciente, id_medico, fecha_cita, expira):
+        self.IdRetencion = id_retencion
+        self.IdPaciente = id_paciente
+        self.IdMedico = id_medico
+        self.FechaCita = fecha_cita
+        self.expira = expira
+
+    def a_dict(self):
+        return {
+            "IdRetencion": self.IdRetencion,
+            "IdPaciente": self.IdPaciente,
+            "IdMedico": self.IdMedico,
+            "FechaCita": self.FechaCita,
+            "expira": self.expira
+        }
+
+
+class Retenciones:
+    """Reservas temporales de horarios que caducan solas (sin tocar la base de datos).
+
+    Con `al_vencer`, un hilo revisa los vencimientos cada segundo aunque no
+    haya consultas y llama `al_vencer(retencion)` por cada una que caducó (no
+    por las liberadas a mano).
+    """
+
+    def __init__(self, al_vencer=None):
+        self._rueda = RuedaTemporal(resolucion=1.0, ranuras=3600)
+        self._retenciones = {}
+        self._por_dia = {}
+        self._lock = threading.Lock()
+        self._al_vencer = al_vencer
+        if al_vencer is not None:
+            threading.Thread(target=self._vigilar, name="vencer-retenciones", daemon=True).start()
+
+    def _vigilar(self):
+        while True:
+            time.sleep(self._rueda.resolucion)
+            self._expirar()
+
+    def _expirar(self):
+        for id_retencion in self._rueda.avanzar():
+            retencion = self._quitar(id_retencion)
+            if retencion is not None and self._al_vencer is not None:
+                self._al_vencer(retencion)
+
+    def _quitar(self, id_retencion):
+        with self._lock:
+            retencion = self._retenciones.pop(id_retencion, None)
+            if retencion is None:
+                return None
+            clave = (retencion.IdMedico, retencion.FechaCita.date())
+            del self._por_dia[clave][id_retencion]
+            if not self._por_dia[clave]:
+                del self._por_dia[clave]
+            return retencion
+
+    def crear(self, id_paciente, id_medico, fecha_cita, minutos):
+        self._expirar()
+        retencion = Retencion(
+            uuid.uuid4().hex, id_paciente, id_medico, fecha_cita,
+            datetime.now() + timedelta(minutes=minutos)
+        )
+        with self._lock:
+            self._retenciones[retencion.IdRetencion] = retencion
+            clave = (id_medico, fecha_cita.date())
+            self._por_dia.setdefault(clave, {})[retencion.IdRetencion] = mascara_cita(fecha_cita)
+        self._rueda.agregar(retencion.IdRetencion, time.monotonic() + minutos * 60)
+        return retencion
+
+    def obtener(self, id_retencion):
+        self._expirar()
+        with self._lock:
+            return self._retenciones.get(id_retencion)
+
+    def liberar(self, id_retencion):
+        self._rueda.cancelar(id_retencion)
+        return self._quitar(id_retencion)
+
+    def mascara(self, id_medico, dia, excluir=None):
+        """Bloques retenidos de un médico en un día"""
+        self._expirar()
+        retenidos = 0
+        with self._lock:
+            for id_retencion, mascara in self._por_dia.get((id_medico, dia), {}).items():
+                if id_retencion != excluir:
+                    retenidos |= mascara
+        return retenidos
+
+    def choca(self, id_medico, instante, excluir=None, duracion=DURACION_CITA_MINUTOS):
+        return bool(self.mascara(id_medico, instante.date(), excluir) & mascara_cita(instante, duracion))
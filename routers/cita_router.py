@@ -1,11 +1,43 @@
-from fastapi import APIRouter, HTTPException
-from models.cita import Cita
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
+from models.cita import Cita, ESTADOS_INACTIVOS
 from pydantic import BaseModel
-from datetime import datetime
-from typing import List
-import pyodbc
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import threading
 
-router = APIRouter(prefix="/citas", tags=["citas"])
+from acceso_datos import conectar, marcar_endpoint
+from agenda import AgendaDiaria
+from busqueda import IndiceInvertido
+from carriles import CarrilesReserva
+from eventos_citas import publicar, suscribir
+from horarios import (
+    DURACION_CITA_MINUTOS, CacheHorarios, inicios_libres, mascara_cita, mascara_intervalo,
+    validar_cita
+)
+from lista_espera import EntradaEspera, ListaEspera
+from ocupacion import OcupacionMedicos
+from reprogramacion import planificar
+from retenciones import Retenciones
+from series import FRECUENCIAS, ocurrencias, ocurrencias_de_fila
+from trazas import clase_ruta
+
+
+async def _marcar_endpoint(request: Request):
+    marcar_endpoint(request.method, request.scope["route"].path)
+
+
+router = APIRouter(prefix="/citas", tags=["citas"], dependencies=[Depends(_marcar_endpoint)],
+                   route_class=clase_ruta())
+
+logger = logging.getLogger(__name__)
+
+# Índice invertido sobre Motivo; se carga en la primera búsqueda y se actualiza
+# con cada alta, modificación y baja de citas.
+indice_motivos = IndiceInvertido()
+_indice_cargado = False
+_lock_indice = threading.Lock()
 
 connection_string = (
     "DRIVER={ODBC Driver 17 for SQL Server};"
@@ -14,6 +46,86 @@ connection_string = (
     "Trusted_Connection=yes;"
 )
 
+horarios_medicos = CacheHorarios(lambda: conectar(connection_string))
+
+
+def _citas_activas(cursor, id_medico, desde, hasta):
+    inactivos = ", ".join("?" for _ in ESTADOS_INACTIVOS)
+    cursor.execute(f"""
+        SELECT IdCita, FechaCita FROM Citas
+        WHERE IdMedico = ? AND FechaCita >= ? AND FechaCita < ? AND Estado NOT IN ({inactivos})
+    """, id_medico, desde, hasta, *ESTADOS_INACTIVOS)
+    return [(row.IdCita, row.FechaCita) for row in cursor.fetchall()]
+
+
+def _ocurrencias_pendientes(cursor, id_medico, desde, hasta):
+    """Ocurrencias de series activas del médico en [desde, hasta) que aún no son filas de Citas"""
+    return _ocurrencias_pendientes_de(cursor, [id_medico], desde, hasta).get(id_medico, [])
+
+
+def _ocurrencias_pendientes_de(cursor, ids_medico, desde, hasta):
+    """Lo mismo para varios médicos con una sola consulta: {IdMedico: [(clave, fecha)]}"""
+    marcadores = ", ".join("?" for _ in ids_medico)
+    cursor.execute(f"""
+        SELECT IdSerie, IdMedico, Inicio, Frecuencia, Intervalo, Cantidad, Hasta, MaterializadaHasta
+        FROM SeriesCitas WHERE IdMedico IN ({marcadores}) AND Activa = 1
+    """, *ids_medico)
+    pendientes = {}
+    for serie in cursor.fetchall():
+        for fecha in ocurrencias_de_fila(serie, desde, hasta - timedelta(microseconds=1)):
+            if serie.MaterializadaHasta is None or fecha > serie.MaterializadaHasta:
+                pendientes.setdefault(serie.IdMedico, []).append((("serie", serie.IdSerie, fecha), fecha))
+    return pendientes
+
+
+def _leer_ocupacion(id_medico, dia):
+    inicio = datetime.combine(dia, datetime.min.time())
+    fin = inicio + timedelta(days=1)
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    citas = _citas_activas(cursor, id_medico, inicio, fin)
+    citas += _ocurrencias_pendientes(cursor, id_medico, inicio, fin)
+    conn.close()
+    return citas
+
+
+# Las altas y modificaciones de un mismo médico se serializan en su carril y
+# los choques se comprueban contra la ocupación en memoria de ese médico, así
+# la base de datos no recibe escrituras concurrentes sobre la misma agenda.
+carriles = CarrilesReserva()
+ocupacion = OcupacionMedicos(_leer_ocupacion)
+
+# Horarios retenidos mientras el paciente completa la reserva; caducan solos
+retenciones = Retenciones(al_vencer=lambda retencion: _oferta_vencida(retencion))
+
+
+def _leer_agenda(fecha):
+    inicio = datetime.combine(fecha, datetime.min.time())
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT c.IdCita, c.IdPaciente, c.IdMedico, c.FechaCita, c.Motivo, c.Estado,
+               p.Nombre + ' ' + p.Apellido AS NombrePaciente
+        FROM Citas c JOIN Pacientes p ON p.IdPaciente = c.IdPaciente
+        WHERE c.FechaCita >= ? AND c.FechaCita < ?
+    """, inicio, inicio + timedelta(days=1))
+    citas = [dict(_fila_a_cita(row), NombrePaciente=row.NombrePaciente) for row in cursor.fetchall()]
+    conn.close()
+    return citas
+
+
+def _leer_nombre_paciente(id_paciente):
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("SELECT Nombre, Apellido FROM Pacientes WHERE IdPaciente = ?", id_paciente)
+    row = cursor.fetchone()
+    conn.close()
+    return f"{row.Nombre} {row.Apellido}" if row else None
+
+
+# Agenda del día por médico, armada en memoria y parchada en cada escritura
+agenda = AgendaDiaria(_leer_agenda, _leer_nombre_paciente)
+
 
 class CitaResponse(BaseModel):
     IdCita: int
@@ -24,19 +136,847 @@ class CitaResponse(BaseModel):
     Estado: str
 
 
+class RetencionRequest(BaseModel):
+    IdPaciente: int
+    IdMedico: int
+    FechaCita: datetime
+    Minutos: int = 10
+
+
+class ConfirmacionRetencion(BaseModel):
+    Motivo: str
+    Estado: str = "Pendiente"
+
+
+# Serie recurrente al estilo RRULE: FREQ=Frecuencia, INTERVAL, COUNT=Cantidad, UNTIL=Hasta
+class SerieCitasRequest(BaseModel):
+    IdPaciente: int
+    IdMedico: int
+    Inicio: datetime
+    Frecuencia: str
+    Intervalo: int = 1
+    Cantidad: Optional[int] = None
+    Hasta: Optional[datetime] = None
+    Motivo: str
+
+
+MAX_DIAS_BUSQUEDA = 60
+
+
+# Nuevo horario para una ocurrencia que materializar() no pudo crear por choque
+class ReprogramacionOmitidaRequest(BaseModel):
+    FechaCita: datetime
+    IdMedico: Optional[int] = None
+
+
+class ReprogramacionRequest(BaseModel):
+    IdMedico: int
+    Desde: datetime
+    Hasta: datetime
+    DiasBusqueda: int = 14
+    Aplicar: bool = False
+
+
+class EsperaRequest(BaseModel):
+    IdPaciente: int
+    IdMedico: Optional[int] = None
+    Especialidad: Optional[str] = None
+    Prioridad: int = 3
+    Desde: Optional[datetime] = None
+    Hasta: Optional[datetime] = None
+
+
+class BusquedaCitasResponse(BaseModel):
+    total: int
+    pagina: int
+    tamano: int
+    citas: List[CitaResponse]
+
+
+def _fila_a_cita(row):
+    return {
+        "IdCita": row.IdCita,
+        "IdPaciente": row.IdPaciente,
+        "IdMedico": row.IdMedico,
+        "FechaCita": row.FechaCita,
+        "Motivo": row.Motivo,
+        "Estado": row.Estado
+    }
+
+
+def _cita_guardada(id, cita, anterior=None):
+    """Publicar un alta o modificación; `anterior` trae IdMedico, FechaCita y Estado previos"""
+    publicar("guardada", id=id, cita=cita, anterior=anterior)
+
+
+def _cita_eliminada(id, anterior=None):
+    publicar("eliminada", id=id, cita=None, anterior=anterior)
+
+
+@suscribir
+def _actualizar_vistas(evento, id, cita, anterior):
+    """Mantener al día el índice de motivos y la agenda en memoria"""
+    if cita is None:
+        indice_motivos.eliminar(id)
+        agenda.aplicar(id, None)
+        return
+    indice_motivos.agregar(id, cita.IdMedico, cita.FechaCita, cita.Motivo)
+    agenda.aplicar(id, {
+        "IdCita": id,
+        "IdPaciente": cita.IdPaciente,
+        "IdMedico": cita.IdMedico,
+        "FechaCita": cita.FechaCita,
+        "Motivo": cita.Motivo,
+        "Estado": cita.Estado
+    })
+
+
+def _validar_horario(cita):
+    """409 si la cita cae fuera del horario de atención del médico"""
+    if cita.Estado in ESTADOS_INACTIVOS:
+        return
+    error = validar_cita(horarios_medicos.obtener(cita.IdMedico), cita.FechaCita)
+    if error:
+        raise HTTPException(status_code=409, detail=error)
+
+
+def _comprobar_choque(cita, id_cita=None, retencion=None):
+    """409 si el médico ya tiene otra cita o retención que se superpone (dentro del carril)"""
+    if cita.Estado in ESTADOS_INACTIVOS:
+        return
+    if ocupacion.choca(cita.IdMedico, cita.FechaCita, excluir=id_cita):
+        if id_cita is None or ocupacion.conoce(id_cita) or not _sin_choque_al_recargar(cita, id_cita):
+            raise HTTPException(status_code=409, detail="El médico ya tiene una cita en ese horario")
+    if retenciones.choca(cita.IdMedico, cita.FechaCita, excluir=retencion):
+        raise HTTPException(status_code=409, detail="El horario está retenido por otra reserva")
+
+
+def _sin_choque_al_recargar(cita, id_cita):
+    """La cita no está en memoria: puede ser una ocurrencia que otro proceso
+    materializó después de cargar el día. Se vuelve a leer el día (estamos en
+    el carril del médico) y se comprueba de nuevo."""
+    ocupacion.recargar(cita.IdMedico, cita.FechaCita.date())
+    return not ocupacion.choca(cita.IdMedico, cita.FechaCita, excluir=id_cita)
+
+
+def _registrar_ocupacion(id, cita, anterior=None):
+    """`anterior` = (IdMedico, FechaCita) previos, para liberar también la
+    ocurrencia de serie si la cita no estaba en memoria"""
+    if anterior is not None:
+        ocupacion.liberar(id, *anterior)
+    if cita.Estado in ESTADOS_INACTIVOS:
+        ocupacion.liberar(id)
+    else:
+        ocupacion.ocupar(id, cita.IdMedico, cita.FechaCita)
+
+
+def _insertar_cita(cita, retencion=None):
+    _comprobar_choque(cita, retencion=retencion)
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO Citas (IdPaciente, IdMedico, FechaCita, Motivo, Estado)
+        OUTPUT INSERTED.IdCita
+        VALUES (?, ?, ?, ?, ?)
+    """, cita.IdPaciente, cita.IdMedico, cita.FechaCita, cita.Motivo, cita.Estado)
+    id = cursor.fetchone()[0]
+    if retencion is not None:
+        # Si la retención era una oferta de la lista de espera, la entrada queda asignada
+        cursor.execute("""
+            UPDATE ListaEspera SET Estado = 'Asignada', IdCita = ?
+            WHERE IdRetencion = ? AND Estado = 'Ofrecida'
+        """, id, retencion)
+    conn.commit()
+    conn.close()
+    _registrar_ocupacion(id, cita)
+    return id
+
+
+def _modificar_cita(id, cita):
+    _comprobar_choque(cita, id)
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("""
+        UPDATE Citas
+        SET IdPaciente = ?, IdMedico = ?, FechaCita = ?, Motivo = ?, Estado = ?
+        OUTPUT DELETED.IdMedico, DELETED.FechaCita, DELETED.Estado
+        WHERE IdCita = ?
+    """, cita.IdPaciente, cita.IdMedico, cita.FechaCita, cita.Motivo, cita.Estado, id)
+    row = cursor.fetchone()
+    if row is None:
+        conn.close()
+        raise HTTPException(status_code=404, detail="Cita no encontrada")
+    conn.commit()
+    conn.close()
+    _registrar_ocupacion(id, cita, (row.IdMedico, row.FechaCita))
+    return {"IdMedico": row.IdMedico, "FechaCita": row.FechaCita, "Estado": row.Estado}
+
+
+def _retener(cita, minutos):
+    _comprobar_choque(cita)
+    return retenciones.crear(cita.IdPaciente, cita.IdMedico, cita.FechaCita, minutos)
+
+
+def _confirmar_retencion(id_retencion, confirmacion):
+    retencion = retenciones.obtener(id_retencion)
+    if retencion is None:
+        raise HTTPException(status_code=404, detail="Retención no encontrada o vencida")
+    cita = Cita(
+        IdPaciente=retencion.IdPaciente, IdMedico=retencion.IdMedico,
+        FechaCita=retencion.FechaCita, Motivo=confirmacion.Motivo, Estado=confirmacion.Estado
+    )
+    id = _insertar_cita(cita, retencion=id_retencion)
+    retenciones.liberar(id_retencion)
+    return id, cita
+
+
+def _reprogramar_omitida(id_omitida, cita):
+    """Crear la cita de una ocurrencia omitida y marcarla como reprogramada (dentro del carril)"""
+    _comprobar_choque(cita)
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("""
+        INSERT INTO Citas (IdPaciente, IdMedico, FechaCita, Motivo, Estado)
+        OUTPUT INSERTED.IdCita
+        VALUES (?, ?, ?, ?, ?)
+    """, cita.IdPaciente, cita.IdMedico, cita.FechaCita, cita.Motivo, cita.Estado)
+    id = cursor.fetchone()[0]
+    cursor.execute("""
+        UPDATE SeriesOmitidas SET Reprogramada = 1, IdCita = ?
+        WHERE IdOmitida = ? AND Reprogramada = 0
+    """, id, id_omitida)
+    if cursor.rowcount == 0:
+        conn.rollback()
+        conn.close()
+        raise HTTPException(status_code=409, detail="La ocurrencia ya fue reprogramada")
+    conn.commit()
+    conn.close()
+    _registrar_ocupacion(id, cita)
+    return id
+
+
+MAX_OCURRENCIAS = 260
+
+
+def _crear_serie(serie):
+    """Comprobar en bloque los choques de toda la serie y guardarla (dentro del carril)"""
+    fechas = list(ocurrencias(serie.Inicio, serie.Frecuencia, serie.Intervalo,
+                              serie.Cantidad, serie.Hasta))
+    if not fechas:
+        raise HTTPException(status_code=422, detail="La serie no tiene ocurrencias")
+    if len(fechas) > MAX_OCURRENCIAS:
+        raise HTTPException(status_code=422, detail=f"La serie supera {MAX_OCURRENCIAS} ocurrencias")
+
+    desde = datetime.combine(fechas[0].date(), datetime.min.time())
+    hasta = datetime.combine(fechas[-1].date(), datetime.min.time()) + timedelta(days=1)
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    ocupados = {}
+    for _, fecha in (_citas_activas(cursor, serie.IdMedico, desde, hasta)
+                     + _ocurrencias_pendientes(cursor, serie.IdMedico, desde, hasta)):
+        ocupados[fecha.date()] = ocupados.get(fecha.date(), 0) | mascara_cita(fecha)
+    horario = horarios_medicos.obtener(serie.IdMedico)
+    choques = [
+        fecha for fecha in fechas
+        if validar_cita(horario, fecha)
+        or (ocupados.get(fecha.date(), 0) | retenciones.mascara(serie.IdMedico, fecha.date()))
+        & mascara_cita(fecha)
+    ]
+    if choques:
+        conn.close()
+        raise HTTPException(status_code=409, detail={
+            "mensaje": "Algunas ocurrencias chocan con otras citas o están fuera de horario",
+            "choques": [fecha.isoformat() for fecha in choques]
+        })
+
+    cursor.execute("""
+        INSERT INTO SeriesCitas (IdPaciente, IdMedico, Inicio, Frecuencia, Intervalo, Cantidad, Hasta, Motivo)
+        OUTPUT INSERTED.IdSerie
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, serie.IdPaciente, serie.IdMedico, serie.Inicio, serie.Frecuencia, serie.Intervalo,
+        serie.Cantidad, serie.Hasta, serie.Motivo)
+    id_serie = cursor.fetchone()[0]
+    conn.commit()
+    conn.close()
+    for fecha in fechas:
+        ocupacion.ocupar(("serie", id_serie, fecha), serie.IdMedico, fecha, cargar=False)
+    return id_serie, len(fechas)
+
+
+def _planificar_reprogramacion(solicitud):
+    """Armar el plan de reprogramación (en el carril del médico de origen);
+    devuelve (afectadas, movimientos, sin_asignar)"""
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    inactivos = ", ".join("?" for _ in ESTADOS_INACTIVOS)
+    cursor.execute(f"""
+        SELECT * FROM Citas
+        WHERE IdMedico = ? AND FechaCita >= ? AND FechaCita < ? AND Estado NOT IN ({inactivos})
+        ORDER BY FechaCita
+    """, solicitud.IdMedico, solicitud.Desde, solicitud.Hasta, *ESTADOS_INACTIVOS)
+    afectadas = [_fila_a_cita(row) for row in cursor.fetchall()]
+    if not afectadas:
+        conn.close()
+        return afectadas, [], []
+
+    cursor.execute("""
+        SELECT IdMedico FROM Medicos
+        WHERE Especialidad = (SELECT Especialidad FROM Medicos WHERE IdMedico = ?)
+    """, solicitud.IdMedico)
+    candidatos = {row.IdMedico for row in cursor.fetchall()} | {solicitud.IdMedico}
+
+    # Ocupación de todos los candidatos en la ventana de búsqueda con una sola
+    # consulta; las citas que se van a mover no cuentan como ocupadas.
+    primer_dia = max(solicitud.Desde.date(), date.today())
+    ultimo_dia = solicitud.Hasta.date() + timedelta(days=solicitud.DiasBusqueda)
+    inicio = datetime.combine(primer_dia, datetime.min.time())
+    fin = datetime.combine(ultimo_dia, datetime.min.time()) + timedelta(days=1)
+    ids_afectadas = {cita["IdCita"] for cita in afectadas}
+    marcadores = ", ".join("?" for _ in candidatos)
+    cursor.execute(f"""
+        SELECT IdCita, IdMedico, FechaCita FROM Citas
+        WHERE IdMedico IN ({marcadores}) AND FechaCita >= ? AND FechaCita < ?
+          AND Estado NOT IN ({inactivos})
+    """, *candidatos, inicio, fin, *ESTADOS_INACTIVOS)
+    ocupados = {}
+    for row in cursor.fetchall():
+        if row.IdCita not in ids_afectadas:
+            clave = (row.IdMedico, row.FechaCita.date())
+            ocupados[clave] = ocupados.get(clave, 0) | mascara_cita(row.FechaCita)
+    for medico, pendientes in _ocurrencias_pendientes_de(cursor, list(candidatos), inicio, fin).items():
+        for _, fecha in pendientes:
+            clave = (medico, fecha.date())
+            ocupados[clave] = ocupados.get(clave, 0) | mascara_cita(fecha)
+
+    libres = {}
+    horarios = horarios_medicos.obtener_varios(candidatos)
+    for medico in candidatos:
+        horario = horarios[medico]
+        if horario is None:
+            continue
+        dia = primer_dia
+        while dia <= ultimo_dia:
+            mascara = horario.mascara_dia(dia) & ~ocupados.get((medico, dia), 0)
+            mascara &= ~retenciones.mascara(medico, dia)
+            if medico == solicitud.IdMedico:
+                # El médico no está disponible dentro del rango pedido
+                mascara &= ~mascara_intervalo(dia, solicitud.Desde, solicitud.Hasta)
+            # Nada de horarios que ya pasaron
+            mascara &= ~mascara_intervalo(dia, datetime.min, datetime.now())
+            if mascara:
+                libres[(medico, dia)] = mascara
+            dia += timedelta(days=1)
+
+    conn.close()
+    movimientos, sin_asignar = planificar(afectadas, libres, solicitud.IdMedico)
+    return afectadas, movimientos, sin_asignar
+
+
+def _apartar_destinos(movimientos):
+    """En el carril del médico de destino: comprobar y apartar en memoria los
+    horarios a los que se mueven sus citas, para que ninguna reserva de ese
+    médico los tome mientras se aplica el plan. Devuelve las claves apartadas
+    o None si alguno ya está ocupado."""
+    apartados = []
+    for movimiento in movimientos:
+        medico, fecha = movimiento["Hacia"]["IdMedico"], movimiento["Hacia"]["FechaCita"]
+        if (ocupacion.choca(medico, fecha, excluir=movimiento["IdCita"])
+                or retenciones.choca(medico, fecha)):
+            for clave in apartados:
+                ocupacion.liberar(clave)
+            return None
+        clave = ("reprogramacion", movimiento["IdCita"])
+        ocupacion.ocupar(clave, medico, fecha)
+        apartados.append(clave)
+    return apartados
+
+
+def _aplicar_reprogramacion(afectadas, movimientos):
+    """Todos los movimientos en una sola transacción con sentencias de conjunto"""
+    inactivos = ", ".join("?" for _ in ESTADOS_INACTIVOS)
+    conn = conectar(connection_string)
+    cursor = conn.cursor()
+    cursor.execute("CREATE TABLE #Movimientos (IdCita INT PRIMARY KEY, IdMedico INT, FechaCita DATETIME)")
+    cursor.fast_executemany = True
+    cursor.executemany(
+        "INSERT INTO #Movimientos (IdCita, IdMedico, FechaCita) VALUES (?, ?, ?)",
+        [(m["IdCita"], m["Hacia"]["IdMedico"], m["Hacia"]["FechaCita"]) for m in movimientos]
+    )
+    # Si entretanto otra escritura (por ejemplo un script fuera de la API) tomó
+    # alguno de los horarios, el plan ya no vale. UPDLOCK + HOLDLOCK mantiene
+    # bloqueados los rangos revisados hasta el commit: nadie inserta en ellos
+    # entre esta comprobación y el UPDATE.
+    cursor.execute(f"""
+        SELECT COUNT(*) FROM #Movimientos m
+        JOIN Citas c WITH (UPDLOCK, HOLDLOCK) ON c.IdMedico = m.IdMedico
+         AND c.FechaCita > DATEADD(minute, -?, m.FechaCita)
+         AND c.FechaCita < DATEADD(minute, ?, m.FechaCita)
+        WHERE c.Estado NOT IN ({inactivos})
+          AND c.IdCita NOT IN (SELECT IdCita FROM #Movimientos)
+    """, DURACION_CITA_MINUTOS, DURACION_CITA_MINUTOS, *ESTADOS_INACTIVOS)
+    if cursor.fetchone()[0]:
+        conn.rollback()
+        conn.close()
+        raise HTTPException(status_code=409, detail="La agenda cambió mientras se planificaba; vuelva a intentarlo")
+    cursor.execute("""
+        UPDATE c SET c.IdMedico = m.IdMedico, c.FechaCita = m.FechaCita
+        FROM Citas c JOIN #Movimientos m ON m.IdCita = c.IdCita
+    """)
+    conn.commit()
+    conn.close()
+    por_id = {cita["IdCita"]: cita for cita in afectadas}
+    for movimiento in movimientos:
+        original = por_id[movimiento["IdCita"]]
+        cita = Cita(
+            IdPaciente=original["IdPaciente"], IdMedico=movimiento["Hacia"]["IdMedico"],
+            FechaCita=movimiento["Hacia"]["FechaCita"], Motivo=original["Motivo"], Estado=original["Estado"]
+        )
+        _registrar_ocupacion(movimiento["IdCita"], cita, (original["IdMedico"], original["FechaCita"]))
+        _cita_guardada(movimiento["IdCita"], cita)
+
+
+def _reprogramar(solicitud):
+    """Planificar en el carril del médico de origen; para aplicar, apartar los
+    horarios de destino en el carril de cada médico de destino (de a uno, sin
+    que un carril espere a otro) y recién entonces escribir"""
+    afectadas, movimientos, sin_asignar = carriles.ejecutar(
+        solicitud.IdMedico, _planificar_reprogramacion, solicitud)
+    if not solicitud.Aplicar or not movimientos:
+        return {"movimientos": movimientos, "sin_asignar": sin_asignar, "aplicado": False}
+
+    por_medico = {}
+    for movimiento in movimientos:
+        por_medico.setdefault(movimiento["Hacia"]["IdMedico"], []).append(movimiento)
+    apartados = []
+    try:
+        for medico in sorted(por_medico):
+            claves = carriles.ejecutar(medico, _apartar_destinos, por_medico[medico])
+            if claves is None:
+                raise HTTPException(status_code=409,
+                                    detail="La agenda cambió mientras se planificaba; vuelva a intentarlo")
+            apartados.extend(claves)
+        carriles.ejecutar(solicitud.IdMedico, _aplicar_reprogramacion, afectadas, movimientos)
+    finally:
+        for clave in apartados:
+            ocupacion.liberar(clave)
+    return {"movimientos": movimientos, "sin_asignar": sin_asignar, "aplicado": True}
+
+
+# Lista de espera: cuando se libera un horario (baja, cancelación o cambio de
+# hora) se ofrece enseguida al mejor candidato reteniéndoselo unos minutos.
+# El emparejamiento corre en su propio hilo para no demorar la respuesta ni
+# esperar desde un carril a otro carril.
+MINUTOS_OFERTA = 15
+lista_espera = ListaEspera()
+_lista_cargada = False
+_lock_lista = threading.Lock()
+_despachador_espera = ThreadPoolExecutor(max_workers=1, thread_name_prefix="lista-espera")
+_especialidades = {}
+
+
+def _entrada_de_fila(row):
+    return EntradaEspera(row.IdEspera, row.IdPaciente, row.IdMedico, row.Especialidad,
+                         row.Prioridad, row.Desde, row.Hasta, row.Alta)
+
+
+def _cargar_lista_espera():
+    global _lista_cargada
+    with _lock_lista:
+        if _lista_cargada:
+            return
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM ListaEspera WHERE Estado = 'Esperando'")
+        for row in cursor.fetchall():
+            lista_espera.agregar(_entrada_de_fila(row))
+        conn.close()
+        _lista_cargada = True
+
+
+def _especialidad(id_medico):
+    if id_medico not in _especialidades:
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("SELECT Especialidad FROM Medicos WHERE IdMedico = ?", id_medico)
+        row = cursor.fetchone()
+        conn.close()
+        _especialidades[id_medico] = row.Especialidad if row else None
+    return _especialidades[id_medico]
+
+
+@suscribir
+def _horario_liberado(evento, id, cita, anterior):
+    """Detectar si la escritura dejó libre un horario futuro y encolar la oferta"""
+    if anterior is None or anterior["Estado"] in ESTADOS_INACTIVOS:
+        return
+    if anterior["FechaCita"] <= datetime.now():
+        return
+    if (cita is not None and cita.Estado not in ESTADOS_INACTIVOS
+            and cita.IdMedico == anterior["IdMedico"] and cita.FechaCita == anterior["FechaCita"]):
+        return
+    _despachador_espera.submit(_ofrecer_horario, anterior["IdMedico"], anterior["FechaCita"])
+
+
+def _ofrecer_horario(id_medico, fecha_cita):
+    try:
+        _cargar_lista_espera()
+        entrada = lista_espera.tomar_mejor(id_medico, _especialidad(id_medico), fecha_cita)
+        if entrada is None:
+            return
+        cita = Cita(IdPaciente=entrada.IdPaciente, IdMedico=id_medico, FechaCita=fecha_cita,
+                    Motivo="", Estado="Pendiente")
+        try:
+            retencion = carriles.ejecutar(id_medico, _retener, cita, MINUTOS_OFERTA)
+        except HTTPException:
+            # Alguien tomó el horario antes; el candidato conserva su lugar
+            lista_espera.agregar(entrada)
+            return
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ListaEspera
+            SET Estado = 'Ofrecida', IdRetencion = ?, MedicoOfrecido = ?, FechaOfrecida = ?
+            WHERE IdEspera = ?
+        """, retencion.IdRetencion, id_medico, fecha_cita, entrada.IdEspera)
+        conn.commit()
+        conn.close()
+    except Exception:
+        logger.exception("No se pudo ofrecer el horario %s del médico %s", fecha_cita, id_medico)
+
+
+def _oferta_vencida(retencion):
+    _despachador_espera.submit(_reofrecer, retencion)
+
+
+def _reofrecer(retencion):
+    """Si la retención vencida era una oferta de la lista de espera, devolver
+    al paciente a la lista (conserva su lugar para otros horarios) y ofrecer el
+    mismo horario al siguiente candidato"""
+    try:
+        _cargar_lista_espera()
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("""
+            UPDATE ListaEspera
+            SET Estado = 'Esperando', IdRetencion = NULL, MedicoOfrecido = NULL, FechaOfrecida = NULL
+            OUTPUT INSERTED.IdEspera, INSERTED.IdPaciente, INSERTED.IdMedico, INSERTED.Especialidad,
+                   INSERTED.Prioridad, INSERTED.Desde, INSERTED.Hasta, INSERTED.Alta
+            WHERE IdRetencion = ? AND Estado = 'Ofrecida'
+        """, retencion.IdRetencion)
+        row = cursor.fetchone()
+        conn.commit()
+        conn.close()
+        if row is None:
+            return
+        if retencion.FechaCita > datetime.now():
+            # Antes de devolverlo a la lista, para que no se le vuelva a ofrecer el mismo horario
+            _ofrecer_horario(retencion.IdMedico, retencion.FechaCita)
+        lista_espera.agregar(_entrada_de_fila(row))
+    except Exception:
+        logger.exception("No se pudo volver a ofrecer el horario %s del médico %s",
+                         retencion.FechaCita, retencion.IdMedico)
+
+
+def _cargar_indice():
+    global _indice_cargado
+    with _lock_indice:
+        if _indice_cargado:
+            return
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("SELECT IdCita, IdMedico, FechaCita, Motivo FROM Citas")
+        while True:
+            rows = cursor.fetchmany(10000)
+            if not rows:
+                break
+            for row in rows:
+                indice_motivos.agregar(row.IdCita, row.IdMedico, row.FechaCita, row.Motivo)
+        conn.close()
+        _indice_cargado = True
+
+
 @router.post("/", response_model=dict)
 def crear_cita(cita: Cita):
     """Crear una nueva cita"""
     try:
-        conn = pyodbc.connect(connection_string)
+        _validar_horario(cita)
+        id = carriles.ejecutar(cita.IdMedico, _insertar_cita, cita)
+        _cita_guardada(id, cita)
+        return {"mensaje": "Cita creada exitosamente"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/holds", response_model=dict)
+def crear_retencion(solicitud: RetencionRequest):
+    """Retener un horario durante unos minutos antes de confirmar la cita"""
+    try:
+        if not 1 <= solicitud.Minutos <= 60:
+            raise HTTPException(status_code=422, detail="Minutos debe estar entre 1 y 60")
+        cita = Cita(
+            IdPaciente=solicitud.IdPaciente, IdMedico=solicitud.IdMedico,
+            FechaCita=solicitud.FechaCita, Motivo="", Estado="Pendiente"
+        )
+        _validar_horario(cita)
+        retencion = carriles.ejecutar(cita.IdMedico, _retener, cita, solicitud.Minutos)
+        return retencion.a_dict()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/holds/{id_retencion}/confirmar", response_model=dict)
+def confirmar_retencion(id_retencion: str, confirmacion: ConfirmacionRetencion):
+    """Convertir una retención vigente en una cita"""
+    try:
+        retencion = retenciones.obtener(id_retencion)
+        if retencion is None:
+            raise HTTPException(status_code=404, detail="Retención no encontrada o vencida")
+        id, cita = carriles.ejecutar(
+            retencion.IdMedico, _confirmar_retencion, id_retencion, confirmacion
+        )
+        _cita_guardada(id, cita)
+        return {"mensaje": "Cita creada exitosamente", "IdCita": id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/holds/{id_retencion}", response_model=dict)
+def liberar_retencion(id_retencion: str):
+    """Liberar una retención antes de que venza"""
+    if retenciones.liberar(id_retencion) is None:
+        raise HTTPException(status_code=404, detail="Retención no encontrada o vencida")
+    return {"mensaje": "Retención liberada exitosamente"}
+
+
+@router.post("/series", response_model=dict)
+def crear_serie(serie: SerieCitasRequest):
+    """Crear una serie de citas recurrentes"""
+    try:
+        if serie.Frecuencia not in FRECUENCIAS or serie.Intervalo < 1:
+            raise HTTPException(status_code=422, detail=f"Frecuencia debe ser una de {FRECUENCIAS}")
+        if serie.Cantidad is None and serie.Hasta is None:
+            raise HTTPException(status_code=422, detail="Indique Cantidad o Hasta")
+        id_serie, cantidad = carriles.ejecutar(serie.IdMedico, _crear_serie, serie)
+        return {"mensaje": "Serie creada exitosamente", "IdSerie": id_serie, "ocurrencias": cantidad}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/series/{id_serie}/ocurrencias", response_model=dict)
+def obtener_ocurrencias(id_serie: int, desde: Optional[datetime] = None, hasta: Optional[datetime] = None):
+    """Ocurrencias de una serie dentro de una ventana (por defecto, los próximos 90 días)"""
+    try:
+        desde = desde or datetime.now()
+        hasta = min(hasta or desde + timedelta(days=90), desde + timedelta(days=366))
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM SeriesCitas WHERE IdSerie = ?", id_serie)
+        serie = cursor.fetchone()
+        if serie is None:
+            conn.close()
+            raise HTTPException(status_code=404, detail="Serie no encontrada")
+        cursor.execute("""
+            SELECT IdOmitida, FechaCita, Reprogramada FROM SeriesOmitidas
+            WHERE IdSerie = ? AND FechaCita >= ? AND FechaCita <= ?
+        """, id_serie, desde, hasta)
+        omitidas = {row.FechaCita: row for row in cursor.fetchall()}
+        conn.close()
+        ocurrencias_serie = []
+        for fecha in ocurrencias_de_fila(serie, desde, hasta):
+            omitida = omitidas.get(fecha)
+            ocurrencia = {
+                "FechaCita": fecha,
+                "materializada": (omitida is None and serie.MaterializadaHasta is not None
+                                  and fecha <= serie.MaterializadaHasta)
+            }
+            if omitida is not None:
+                ocurrencia["omitida"] = {"IdOmitida": omitida.IdOmitida,
+                                         "Reprogramada": bool(omitida.Reprogramada)}
+            ocurrencias_serie.append(ocurrencia)
+        return {"IdSerie": id_serie, "ocurrencias": ocurrencias_serie}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/series/{id_serie}/omitidas", response_model=dict)
+def obtener_omitidas(id_serie: int):
+    """Ocurrencias que chocaron al materializar y aún no se reprogramaron"""
+    try:
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT IdOmitida, FechaCita, Alta FROM SeriesOmitidas
+            WHERE IdSerie = ? AND Reprogramada = 0
+            ORDER BY FechaCita
+        """, id_serie)
+        rows = cursor.fetchall()
+        conn.close()
+        return {
+            "IdSerie": id_serie,
+            "omitidas": [{"IdOmitida": row.IdOmitida, "FechaCita": row.FechaCita, "Alta": row.Alta}
+                         for row in rows]
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/series/{id_serie}/omitidas/{id_omitida}/reprogramar", response_model=dict)
+def reprogramar_omitida(id_serie: int, id_omitida: int, solicitud: ReprogramacionOmitidaRequest):
+    """Dar un nuevo horario a una ocurrencia omitida; crea la cita y la marca como reprogramada"""
+    try:
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT s.IdPaciente, s.IdMedico, s.Motivo
+            FROM SeriesOmitidas o JOIN SeriesCitas s ON s.IdSerie = o.IdSerie
+            WHERE o.IdOmitida = ? AND o.IdSerie = ? AND o.Reprogramada = 0
+        """, id_omitida, id_serie)
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Ocurrencia omitida no encontrada o ya reprogramada")
+        cita = Cita(IdPaciente=row.IdPaciente, IdMedico=solicitud.IdMedico or row.IdMedico,
+                    FechaCita=solicitud.FechaCita, Motivo=row.Motivo, Estado="Pendiente")
+        _validar_horario(cita)
+        id = carriles.ejecutar(cita.IdMedico, _reprogramar_omitida, id_omitida, cita)
+        _cita_guardada(id, cita)
+        return {"mensaje": "Ocurrencia reprogramada", "IdCita": id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/reprogramar", response_model=dict)
+def reprogramar_citas(solicitud: ReprogramacionRequest):
+    """Mover las citas de un médico no disponible; sin Aplicar solo devuelve el plan"""
+    try:
+        if solicitud.Hasta <= solicitud.Desde:
+            raise HTTPException(status_code=422, detail="Hasta debe ser posterior a Desde")
+        if not 0 <= solicitud.DiasBusqueda <= MAX_DIAS_BUSQUEDA:
+            raise HTTPException(status_code=422,
+                                detail=f"DiasBusqueda debe estar entre 0 y {MAX_DIAS_BUSQUEDA}")
+        return _reprogramar(solicitud)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/espera", response_model=dict)
+def agregar_a_espera(solicitud: EsperaRequest):
+    """Anotar a un paciente en la lista de espera de un médico o especialidad"""
+    try:
+        if (solicitud.IdMedico is None) == (solicitud.Especialidad is None):
+            raise HTTPException(status_code=422, detail="Indique IdMedico o Especialidad (solo uno)")
+        _cargar_lista_espera()
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("""
-            INSERT INTO Citas (IdPaciente, IdMedico, FechaCita, Motivo, Estado)
-            VALUES (?, ?, ?, ?, ?)
-        """, cita.IdPaciente, cita.IdMedico, cita.FechaCita, cita.Motivo, cita.Estado)
+            INSERT INTO ListaEspera (IdPaciente, IdMedico, Especialidad, Prioridad, Desde, Hasta)
+            OUTPUT INSERTED.IdEspera, INSERTED.Alta
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, solicitud.IdPaciente, solicitud.IdMedico, solicitud.Especialidad, solicitud.Prioridad,
+            solicitud.Desde, solicitud.Hasta)
+        row = cursor.fetchone()
         conn.commit()
         conn.close()
-        return {"mensaje": "Cita creada exitosamente"}
+        lista_espera.agregar(EntradaEspera(
+            row.IdEspera, solicitud.IdPaciente, solicitud.IdMedico, solicitud.Especialidad,
+            solicitud.Prioridad, solicitud.Desde, solicitud.Hasta, row.Alta
+        ))
+        return {"mensaje": "Paciente agregado a la lista de espera", "IdEspera": row.IdEspera}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/espera/{id_espera}", response_model=dict)
+def obtener_espera(id_espera: int):
+    """Estado de una entrada de la lista de espera, con la oferta si la hay"""
+    try:
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM ListaEspera WHERE IdEspera = ?", id_espera)
+        row = cursor.fetchone()
+        conn.close()
+        if row is None:
+            raise HTTPException(status_code=404, detail="Entrada de espera no encontrada")
+        columnas = [col[0] for col in cursor.description]
+        entrada = dict(zip(columnas, row))
+        if row.Estado == 'Ofrecida' and row.IdRetencion:
+            retencion = retenciones.obtener(row.IdRetencion)
+            entrada["oferta"] = retencion.a_dict() if retencion else None
+        return entrada
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.delete("/espera/{id_espera}", response_model=dict)
+def quitar_de_espera(id_espera: int):
+    """Retirar a un paciente de la lista de espera"""
+    try:
+        lista_espera.quitar(id_espera)
+        conn = conectar(connection_string)
+        cursor = conn.cursor()
+        cursor.execute("UPDATE ListaEspera SET Estado = 'Retirada' WHERE IdEspera = ?", id_espera)
+        if cursor.rowcount == 0:
+            conn.close()
+            raise HTTPException(status_code=404, detail="Entrada de espera no encontrada")
+        conn.commit()
+        conn.close()
+        return {"mensaje": "Paciente retirado de la lista de espera"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/agenda/{id_medico}", response_model=dict)
+def obtener_agenda(id_medico: int, fecha: Optional[date] = None, version: Optional[int] = None):
+    """Agenda del día de un médico; responde 304 si la versión no cambió"""
+    try:
+        fecha = fecha or date.today()
+        actual, citas = agenda.obtener(id_medico, fecha)
+        if version == actual:
+            return Response(status_code=304)
+        return {"IdMedico": id_medico, "fecha": fecha, "version": actual, "citas": citas}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/disponibilidad", response_model=dict)
+def obtener_disponibilidad(medico: int, fecha: date, paso: int = DURACION_CITA_MINUTOS):
+    """Horarios libres de un médico en un día (sin citas ni retenciones)"""
+    try:
+        horario = horarios_medicos.obtener(medico)
+        if horario is None:
+            raise HTTPException(status_code=404, detail="El médico no tiene horario definido")
+        libres = (horario.mascara_dia(fecha) & ~ocupacion.mascara(medico, fecha)
+                  & ~retenciones.mascara(medico, fecha))
+        return {
+            "IdMedico": medico,
+            "fecha": fecha,
+            "horarios": [
+                datetime.combine(fecha, datetime.min.time()) + timedelta(minutes=minuto)
+                for minuto in inicios_libres(libres, max(paso, 5))
+            ]
+        }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -45,7 +985,7 @@ def crear_cita(cita: Cita):
 def obtener_citas():
     """Obtener todas las citas"""
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM Citas")
         rows = cursor.fetchall()
@@ -65,11 +1005,34 @@ def obtener_citas():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/buscar", response_model=BusquedaCitasResponse)
+def buscar_citas(q: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None,
+                 medico: Optional[int] = None, pagina: int = 1, tamano: int = 20):
+    """Buscar citas por motivo, con filtros por fecha y médico"""
+    try:
+        _cargar_indice()
+        pagina = max(pagina, 1)
+        tamano = min(max(tamano, 1), 100)
+        total, ids = indice_motivos.buscar(q, desde, hasta, medico, pagina, tamano)
+        citas = []
+        if ids:
+            conn = conectar(connection_string)
+            cursor = conn.cursor()
+            marcadores = ", ".join("?" for _ in ids)
+            cursor.execute(f"SELECT * FROM Citas WHERE IdCita IN ({marcadores})", *ids)
+            por_id = {row.IdCita: _fila_a_cita(row) for row in cursor.fetchall()}
+            conn.close()
+            citas = [por_id[id] for id in ids if id in por_id]
+        return {"total": total, "pagina": pagina, "tamano": tamano, "citas": citas}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/{id}", response_model=CitaResponse)
 def obtener_cita(id: int):
     """Obtener una cita por ID"""
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM Citas WHERE IdCita = ?", id)
         row = cursor.fetchone()
@@ -94,18 +1057,9 @@ def obtener_cita(id: int):
 def actualizar_cita(id: int, cita: Cita):
     """Actualizar una cita existente"""
     try:
-        conn = pyodbc.connect(connection_string)
-        cursor = conn.cursor()
-        cursor.execute("""
-            UPDATE Citas
-            SET IdPaciente = ?, IdMedico = ?, FechaCita = ?, Motivo = ?, Estado = ?
-            WHERE IdCita = ?
-        """, cita.IdPaciente, cita.IdMedico, cita.FechaCita, cita.Motivo, cita.Estado, id)
-        if cursor.rowcount == 0:
-            conn.close()
-            raise HTTPException(status_code=404, detail="Cita no encontrada")
-        conn.commit()
-        conn.close()
+        _validar_horario(cita)
+        anterior = carriles.ejecutar(cita.IdMedico, _modificar_cita, id, cita)
+        _cita_guardada(id, cita, anterior)
         return {"mensaje": "Cita actualizada exitosamente"}
     except HTTPException:
         raise
@@ -117,14 +1071,21 @@ def actualizar_cita(id: int, cita: Cita):
 def eliminar_cita(id: int):
     """Eliminar una cita"""
     try:
-        conn = pyodbc.connect(connection_string)
+        conn = conectar(connection_string)
         cursor = conn.cursor()
-        cursor.execute("DELETE FROM Citas WHERE IdCita = ?", id)
-        if cursor.rowcount == 0:
+        cursor.execute("""
+            DELETE FROM Citas
+            OUTPUT DELETED.IdMedico, DELETED.FechaCita, DELETED.Estado
+            WHERE IdCita = ?
+        """, id)
+        row = cursor.fetchone()
+        if row is None:
             conn.close()
             raise HTTPException(status_code=404, detail="Cita no encontrada")
         conn.commit()
         conn.close()
+        ocupacion.liberar(id, row.IdMedico, row.FechaCita)
+        _cita_eliminada(id, {"IdMedico": row.IdMedico, "FechaCita": row.FechaCita, "Estado": row.Estado})
         return {"mensaje": "Cita eliminada exitosamente"}
     except HTTPException:
         raise
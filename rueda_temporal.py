@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class RuedaTemporal:
+    """Rueda de temporizadores: vencimientos repartidos en ranuras circulares.
+
+    Agregar y cancelar cuestan O(1); `avanzar` solo recorre las ranuras cuyo
+    tiempo ya pasó desde la última llamada. Los vencimientos más lejanos que
+    una vuelta completa se quedan en su ranura hasta la vuelta que les toca.
+    """
+
+    def __init__(self, resolucion=1.0, ranuras=3600, reloj=time.monotonic):
+        self.resolucion = resolucion
+        self.reloj = reloj
+        self._ranuras = [dict() for _ in range(ranuras)]
+        self._ubicacion = {}
+        self._tick = int(reloj() // resolucion)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._ubicacion)
+
+    def agregar(self, clave, vence):
+        """Programar `clave` para el instante `vence` (en la escala de `reloj`)"""
+        with self._lock:
+            self._quitar(clave)
+            tick = max(int(vence // self.resolucion), self._tick)
+            ranura = tick % len(self._ranuras)
+            self._ranuras[ranura][clave] = vence
+            self._ubicacion[clave] = ranura
+
+    def cancelar(self, clave):
+        with self._lock:
+            self._quitar(clave)
+
+    def _quitar(self, clave):
+        ranura = self._ubicacion.pop(clave, None)
+        if ranura is not None:
+            self._ranuras[ranura].pop(clave, None)
+
+    def avanzar(self, ahora=None):
+        """Devolver (y olvidar) las claves vencidas hasta `ahora`"""
+        ahora = self.reloj() if ahora is None else ahora
+        vencidas = []
+        with self._lock:
+            actual = int(ahora // self.resolucion)
+            pasos = min(actual - self._tick + 1, len(self._ranuras))
+            for tick in range(actual - pasos + 1, actual + 1):
+                ranura = self._ranuras[tick % len(self._ranuras)]
+                for clave, vence in list(ranura.items()):
+                    if vence <= ahora:
+                        del ranura[clave]
+                        del self._ubicacion[clave]
+                        vencidas.append(clave)
+            self._tick = actual
+        return vencidas
@@ -0,0 +1,157 @@
+"""Series de citas recurrentes.
+
+Una serie se guarda una sola vez en SeriesCitas y sus ocurrencias se generan
+bajo demanda. Este módulo también materializa como filas de Citas las
+ocurrencias de los próximos días:
+
+Uso: python series.py [--dias 14]
+"""
+import argparse
+import calendar
+from datetime import datetime, timedelta
+
+import pyodbc
+
+from horarios import DURACION_CITA_MINUTOS
+from models.cita import ESTADOS_INACTIVOS
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=MANUEL\\MSSQL2022;"
+    "DATABASE=ClinicaMedica;"
+    "Trusted_Connection=yes;"
+)
+
+FRECUENCIAS = ("SEMANAL", "MENSUAL")
+
+
+def _sumar_meses(fecha, meses):
+    mes = fecha.month - 1 + meses
+    anio, mes = fecha.year + mes // 12, mes % 12 + 1
+    return fecha.replace(year=anio, month=mes, day=min(fecha.day, calendar.monthrange(anio, mes)[1]))
+
+
+def ocurrencias(inicio, frecuencia, intervalo=1, cantidad=None, hasta=None, desde=None, limite=None):
+    """Generar las fechas de la serie, opcionalmente solo las de [desde, limite].
+
+    Como en RRULE: `cantidad` (COUNT) y `hasta` (UNTIL) cortan la serie; la
+    ventana solo evita generar lo que no se pidió. Sin ningún tope el
+    generador es infinito.
+    """
+    if frecuencia not in FRECUENCIAS:
+        raise ValueError(f"Frecuencia no soportada: {frecuencia}")
+    k = 0
+    if desde is not None and desde > inicio:
+        # Saltar directamente a la primera ocurrencia de la ventana
+        if frecuencia == "SEMANAL":
+            k = -(-(desde - inicio).days // (7 * intervalo))
+        else:
+            meses = (desde.year - inicio.year) * 12 + desde.month - inicio.month
+            k = max(meses // intervalo - 1, 0)
+    while cantidad is None or k < cantidad:
+        if frecuencia == "SEMANAL":
+            fecha = inicio + timedelta(weeks=k * intervalo)
+        else:
+            fecha = _sumar_meses(inicio, k * intervalo)
+        if (hasta is not None and fecha > hasta) or (limite is not None and fecha > limite):
+            return
+        k += 1
+        if desde is not None and fecha < desde:
+            continue
+        yield fecha
+
+
+def ocurrencias_de_fila(fila, desde=None, limite=None):
+    return ocurrencias(fila.Inicio, fila.Frecuencia, fila.Intervalo, fila.Cantidad, fila.Hasta,
+                       desde, limite)
+
+
+def _choques_en_lote(filas):
+    """Marcar las ocurrencias del lote que chocan con otra anterior del mismo médico"""
+    ultima = {}
+    marcadas = []
+    for fila in sorted(filas, key=lambda f: (f[2], f[3], f[0])):
+        anterior = ultima.get(fila[2])
+        choca = anterior is not None and fila[3] < anterior + timedelta(minutes=DURACION_CITA_MINUTOS)
+        if not choca:
+            ultima[fila[2]] = fila[3]
+        marcadas.append(fila + (int(choca),))
+    return marcadas
+
+
+def materializar(conn, dias=14):
+    """Insertar en Citas las ocurrencias de los próximos `dias` días de cada serie activa.
+
+    Las ocurrencias se cargan en una tabla temporal y se insertan con una sola
+    sentencia de conjunto. Las que chocan con citas existentes o con otra
+    ocurrencia del mismo lote no se pierden: quedan en SeriesOmitidas para que
+    la clínica las reprograme. Devuelve (insertadas, omitidas).
+    """
+    limite = datetime.now() + timedelta(days=dias)
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT IdSerie, IdPaciente, IdMedico, Inicio, Frecuencia, Intervalo, Cantidad, Hasta,
+               Motivo, MaterializadaHasta
+        FROM SeriesCitas
+        WHERE Activa = 1 AND (MaterializadaHasta IS NULL OR MaterializadaHasta < ?)
+    """, limite)
+    filas = []
+    for serie in cursor.fetchall():
+        for fecha in ocurrencias_de_fila(serie, limite=limite):
+            if serie.MaterializadaHasta is None or fecha > serie.MaterializadaHasta:
+                filas.append((serie.IdSerie, serie.IdPaciente, serie.IdMedico, fecha, serie.Motivo))
+    if not filas:
+        return 0, 0
+
+    cursor.execute("""
+        CREATE TABLE #Ocurrencias (
+            IdSerie INT, IdPaciente INT, IdMedico INT, FechaCita DATETIME, Motivo VARCHAR(255),
+            Choque BIT
+        )
+    """)
+    cursor.fast_executemany = True
+    cursor.executemany("INSERT INTO #Ocurrencias VALUES (?, ?, ?, ?, ?, ?)", _choques_en_lote(filas))
+    inactivos = ", ".join("?" for _ in ESTADOS_INACTIVOS)
+    # UPDLOCK/HOLDLOCK: nadie puede reservar esos horarios hasta el commit
+    cursor.execute(f"""
+        UPDATE o SET o.Choque = 1
+        FROM #Ocurrencias o
+        WHERE o.Choque = 0 AND EXISTS (
+            SELECT 1 FROM Citas c WITH (UPDLOCK, HOLDLOCK)
+            WHERE c.IdMedico = o.IdMedico
+              AND c.FechaCita > DATEADD(minute, -?, o.FechaCita)
+              AND c.FechaCita < DATEADD(minute, ?, o.FechaCita)
+              AND c.Estado NOT IN ({inactivos})
+        )
+    """, DURACION_CITA_MINUTOS, DURACION_CITA_MINUTOS, *ESTADOS_INACTIVOS)
+    cursor.execute("""
+        INSERT INTO Citas (IdPaciente, IdMedico, FechaCita, Motivo, Estado)
+        SELECT IdPaciente, IdMedico, FechaCita, Motivo, 'Pendiente'
+        FROM #Ocurrencias
+        WHERE Choque = 0
+    """)
+    insertadas = cursor.rowcount
+    cursor.execute("""
+        INSERT INTO SeriesOmitidas (IdSerie, FechaCita)
+        SELECT IdSerie, FechaCita FROM #Ocurrencias WHERE Choque = 1
+    """)
+    omitidas = cursor.rowcount
+    cursor.execute("""
+        UPDATE s SET s.MaterializadaHasta = o.Ultima
+        FROM SeriesCitas s
+        JOIN (SELECT IdSerie, MAX(FechaCita) AS Ultima FROM #Ocurrencias GROUP BY IdSerie) o
+          ON o.IdSerie = s.IdSerie
+    """)
+    cursor.execute("DROP TABLE #Ocurrencias")
+    conn.commit()
+    return insertadas, omitidas
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Materializar las próximas ocurrencias de las series")
+    parser.add_argument("--dias", type=int, default=14, help="horizonte en días")
+    args = parser.parse_args()
+    conn = pyodbc.connect(connection_string)
+    insertadas, omitidas = materializar(conn, args.dias)
+    conn.close()
+    print(f"{insertadas} citas creadas, {omitidas} ocurrencias omitidas por choque (ver SeriesOmitidas)")
@@ -0,0 +1,182 @@
+"""Simulación de capacidad por especialidad bajo distintas políticas de agenda.
+
+Uso: python simulador.py --minutos 15,20,30 --sobrecupo 0,0.1,0.2 [--dias 365]
+
+Del historial de Citas se estima, por especialidad, la demanda diaria de cada
+médico, la tasa de ausencias (Ausente frente a Completada) y la duración real
+de las consultas (la separación entre citas completadas consecutivas del mismo
+médico y día). Luego se simulan `dias` jornadas por médico para cada política
+(minutos por cita y fracción de sobrecupo), remuestreando ese historial.
+
+Las esperas salen de la recursión de Lindley, inicio_i = max(llegada_i, fin_i-1),
+evaluada columna a columna sobre una matriz (jornadas x pacientes): el bucle
+recorre solo los pacientes de una jornada y cada paso es vectorial sobre todas
+las jornadas de la especialidad a la vez.
+"""
+import argparse
+import json
+from datetime import datetime, timedelta
+
+import numpy as np
+import pyodbc
+
+from horarios import DURACION_CITA_MINUTOS
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=MANUEL\\MSSQL2022;"
+    "DATABASE=ClinicaMedica;"
+    "Trusted_Connection=yes;"
+)
+
+# Separaciones mayores no son una consulta sino un hueco en la agenda
+MAX_DURACION_MINUTOS = 120
+PERCENTILES = (50, 90, 95)
+
+
+class Historial:
+    """Lo observado en una especialidad, en arrays listos para remuestrear"""
+
+    def __init__(self, medicos, demanda, ausencia, duraciones):
+        self.medicos = medicos
+        self.demanda = demanda
+        self.ausencia = ausencia
+        self.duraciones = duraciones
+
+
+def cargar_historial(conn, desde):
+    """{Especialidad: Historial} a partir de las citas desde la fecha `desde`"""
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT m.Especialidad, c.IdMedico, c.FechaCita, c.Estado
+        FROM Citas c
+        JOIN Medicos m ON m.IdMedico = c.IdMedico
+        WHERE c.FechaCita >= ? AND c.FechaCita < ? AND c.Estado IN ('Completada', 'Ausente')
+        ORDER BY m.Especialidad, c.IdMedico, c.FechaCita
+    """, desde, datetime.now())
+    filas = cursor.fetchall()
+    historiales = {}
+    inicio = 0
+    while inicio < len(filas):
+        especialidad = filas[inicio].Especialidad
+        fin = inicio
+        while fin < len(filas) and filas[fin].Especialidad == especialidad:
+            fin += 1
+        bloque = filas[inicio:fin]
+        medico = np.fromiter((f.IdMedico for f in bloque), dtype=np.int64, count=len(bloque))
+        # FechaCita es hora local sin zona: el día es la fecha del calendario y
+        # la hora, los minutos desde la medianoche local (no los del epoch UTC)
+        dia = np.fromiter((f.FechaCita.toordinal() for f in bloque), dtype=np.int64, count=len(bloque))
+        minutos = np.fromiter((f.FechaCita.hour * 60 + f.FechaCita.minute + f.FechaCita.second / 60
+                               for f in bloque), dtype=np.float64, count=len(bloque))
+        completada = np.fromiter((f.Estado == "Completada" for f in bloque), dtype=bool,
+                                 count=len(bloque))
+
+        # Demanda: citas por (médico, día) con al menos una cita
+        _, demanda = np.unique(np.stack([medico, dia]), axis=1, return_counts=True)
+        # Duración: separación entre completadas consecutivas de la misma jornada
+        m, d, t = medico[completada], dia[completada], minutos[completada]
+        misma = (m[1:] == m[:-1]) & (d[1:] == d[:-1])
+        duraciones = np.diff(t)[misma]
+        duraciones = duraciones[(duraciones > 0) & (duraciones <= MAX_DURACION_MINUTOS)]
+        if duraciones.size == 0:
+            duraciones = np.array([float(DURACION_CITA_MINUTOS)])
+
+        historiales[especialidad] = Historial(
+            medicos=len(np.unique(medico)),
+            demanda=demanda,
+            ausencia=1 - completada.mean(),
+            duraciones=duraciones
+        )
+        inicio = fin
+    return historiales
+
+
+def simular(historial, minutos_cita, sobrecupo=0.0, jornada=480, dias=365, rng=None):
+    """Simular `dias` jornadas por médico con la política dada.
+
+    Con sobrecupo s se dan citas cada minutos_cita / (1 + s) minutos, hasta
+    llenar la jornada. Devuelve utilización, horas extra, pacientes atendidos,
+    demanda sin cupo y percentiles de espera (en minutos, solo presentados).
+    """
+    rng = rng or np.random.default_rng()
+    jornadas = historial.medicos * dias
+    intervalo = minutos_cita / (1 + sobrecupo)
+    cupo = int(jornada // intervalo)
+
+    demanda = rng.choice(historial.demanda, size=jornadas)
+    citados = np.minimum(demanda, cupo)
+    llegada = np.arange(cupo) * intervalo
+    citado = np.arange(cupo)[None, :] < citados[:, None]
+    presente = citado & (rng.random((jornadas, cupo)) >= historial.ausencia)
+    servicio = np.where(presente, rng.choice(historial.duraciones, size=(jornadas, cupo)), 0.0)
+
+    espera = np.zeros((jornadas, cupo))
+    fin = np.zeros(jornadas)
+    for i in range(cupo):
+        comienzo = np.maximum(llegada[i], fin)
+        espera[:, i] = comienzo - llegada[i]
+        fin = np.where(presente[:, i], comienzo + servicio[:, i], fin)
+
+    esperas = espera[presente]
+    ocupado = servicio.sum(axis=1)
+    return {
+        "minutos_cita": minutos_cita,
+        "sobrecupo": sobrecupo,
+        "cupo_diario": cupo,
+        "utilizacion": float(ocupado.sum() / (jornadas * jornada)),
+        "horas_extra_por_jornada": float(np.maximum(fin - jornada, 0).mean() / 60),
+        "atendidos_por_jornada": float(presente.sum() / jornadas),
+        "demanda_sin_cupo": float((demanda - citados).sum() / max(demanda.sum(), 1)),
+        "espera": {f"p{p}": float(v) for p, v in
+                   zip(PERCENTILES, np.percentile(esperas, PERCENTILES) if esperas.size
+                       else [0.0] * len(PERCENTILES))}
+    }
+
+
+def _lista(texto, tipo):
+    return [tipo(valor) for valor in texto.split(",") if valor]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simular políticas de agenda por especialidad")
+    parser.add_argument("--minutos", default="15,20,30", help="minutos por cita, separados por coma")
+    parser.add_argument("--sobrecupo", default="0,0.1,0.2", help="fracciones de sobrecupo")
+    parser.add_argument("--jornada", type=int, default=480, help="minutos de atención por jornada")
+    parser.add_argument("--dias", type=int, default=365, help="jornadas simuladas por médico")
+    parser.add_argument("--historial", type=int, default=365, help="días de historial a usar")
+    parser.add_argument("--especialidad", help="simular solo esta especialidad")
+    parser.add_argument("--semilla", type=int, help="semilla para repetir resultados")
+    parser.add_argument("--json", action="store_true", help="imprimir el resultado como JSON")
+    args = parser.parse_args()
+
+    conn = pyodbc.connect(connection_string)
+    historiales = cargar_historial(conn, datetime.now() - timedelta(days=args.historial))
+    conn.close()
+    if args.especialidad:
+        historiales = {k: v for k, v in historiales.items() if k == args.especialidad}
+
+    rng = np.random.default_rng(args.semilla)
+    resultados = {}
+    for especialidad, historial in historiales.items():
+        resultados[especialidad] = [
+            simular(historial, minutos, sobrecupo, args.jornada, args.dias, rng)
+            for minutos in _lista(args.minutos, int)
+            for sobrecupo in _lista(args.sobrecupo, float)
+        ]
+
+    if args.json:
+        print(json.dumps(resultados, indent=2, ensure_ascii=False))
+    else:
+        for especialidad, filas in resultados.items():
+            historial = historiales[especialidad]
+            print(f"\n{especialidad}: {historial.medicos} médicos, "
+                  f"ausencias {historial.ausencia:.1%}, "
+                  f"duración media {historial.duraciones.mean():.1f} min")
+            print("  min  sobrecupo  cupo  utiliz.  extra(h)  atendidos  sin cupo  espera p50/p90/p95")
+            for r in filas:
+                e = r["espera"]
+                print(f"  {r['minutos_cita']:>3}  {r['sobrecupo']:>9.0%}  {r['cupo_diario']:>4}  "
+                      f"{r['utilizacion']:>7.1%}  {r['horas_extra_por_jornada']:>8.2f}  "
+                      f"{r['atendidos_por_jornada']:>9.1f}  {r['demanda_sin_cupo']:>8.1%}  "
+                      f"{e['p50']:.0f}/{e['p90']:.0f}/{e['p95']:.0f}")
@@ -0,0 +1,18 @@
+-- Pares de pacientes posiblemente duplicados, generados por duplicados.py.
+-- Estado: 'Pendiente' hasta que alguien los revise ('Aprobado' o 'Descartado').
+USE ClinicaMedica;
+GO
+
+CREATE TABLE PacientesDuplicados (
+    IdPaciente1 INT NOT NULL,
+    IdPaciente2 INT NOT NULL,
+    Puntaje DECIMAL(5, 4) NOT NULL,
+    IdGrupo INT NOT NULL,
+    Estado VARCHAR(20) NOT NULL DEFAULT 'Pendiente',
+    FechaDeteccion DATETIME NOT NULL DEFAULT GETDATE(),
+    CONSTRAINT PK_PacientesDuplicados PRIMARY KEY (IdPaciente1, IdPaciente2)
+);
+GO
+
+CREATE INDEX IX_PacientesDuplicados_Estado ON PacientesDuplicados (Estado, IdGrupo);
+GO
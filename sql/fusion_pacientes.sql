@@ -0,0 +1,7 @@
+-- Índice que usa fusion_pacientes.py para mover las citas de cada duplicado
+-- sin recorrer la tabla Citas completa.
+USE ClinicaMedica;
+GO
+
+CREATE INDEX IX_Citas_IdPaciente ON Citas (IdPaciente);
+GO
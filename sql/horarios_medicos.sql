@@ -0,0 +1,29 @@
+-- Plantillas de horario de los médicos (ver horarios.py).
+-- Bloques guarda un día como 288 bits (un bit por cada 5 minutos, el bit 0
+-- es 00:00-00:05) en little-endian. DiaSemana: 0 = lunes ... 6 = domingo.
+USE ClinicaMedica;
+GO
+
+CREATE TABLE HorariosMedicos (
+    IdMedico INT NOT NULL REFERENCES Medicos (IdMedico) ON DELETE CASCADE,
+    DiaSemana TINYINT NOT NULL CHECK (DiaSemana BETWEEN 0 AND 6),
+    Bloques BINARY(36) NOT NULL,
+    CONSTRAINT PK_HorariosMedicos PRIMARY KEY (IdMedico, DiaSemana)
+);
+GO
+
+-- Excepciones por fecha que reemplazan la plantilla semanal. Con IdMedico NULL
+-- son feriados de toda la clínica; Bloques en cero significa que no se atiende.
+CREATE TABLE ExcepcionesHorario (
+    IdExcepcion INT IDENTITY PRIMARY KEY,
+    IdMedico INT NULL REFERENCES Medicos (IdMedico) ON DELETE CASCADE,
+    Fecha DATE NOT NULL,
+    Bloques BINARY(36) NOT NULL
+);
+GO
+
+CREATE UNIQUE INDEX UX_ExcepcionesHorario ON ExcepcionesHorario (IdMedico, Fecha);
+GO
+
+CREATE INDEX IX_Citas_IdMedico_FechaCita ON Citas (IdMedico, FechaCita) INCLUDE (Estado);
+GO
@@ -0,0 +1,7 @@
+-- Índice que recorre transiciones_estado.py para encontrar las citas vencidas
+-- de cada estado sin leer la tabla completa.
+USE ClinicaMedica;
+GO
+
+CREATE INDEX IX_Citas_Estado_FechaCita ON Citas (Estado, FechaCita);
+GO
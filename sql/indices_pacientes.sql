@@ -0,0 +1,49 @@
+-- Índices para las búsquedas exactas por teléfono y email de pacientes.
+-- El teléfono se guarda con formato libre, así que se indexa una columna
+-- calculada con solo los dígitos 0-9, igual que normalizar_telefono().
+--
+-- La columna es una expresión en línea, posición por posición sobre los 20
+-- caracteres de Telefono: una función escalar T-SQL en una columna calculada
+-- (aun PERSISTED) obliga a que todo plan sobre Pacientes corra en serie.
+USE ClinicaMedica;
+GO
+
+-- Se puede volver a ejecutar: reemplaza las versiones anteriores de la columna
+-- (la que solo quitaba algunos separadores y la que usaba dbo.SoloDigitos)
+DROP INDEX IF EXISTS IX_Pacientes_TelefonoNormalizado ON Pacientes;
+ALTER TABLE Pacientes DROP COLUMN IF EXISTS TelefonoNormalizado;
+DROP FUNCTION IF EXISTS dbo.SoloDigitos;
+GO
+
+ALTER TABLE Pacientes ADD TelefonoNormalizado AS CAST(
+        CASE WHEN ASCII(SUBSTRING(Telefono, 1, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 1, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 2, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 2, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 3, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 3, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 4, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 4, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 5, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 5, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 6, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 6, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 7, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 7, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 8, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 8, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 9, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 9, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 10, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 10, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 11, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 11, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 12, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 12, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 13, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 13, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 14, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 14, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 15, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 15, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 16, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 16, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 17, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 17, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 18, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 18, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 19, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 19, 1) ELSE '' END
+        + CASE WHEN ASCII(SUBSTRING(Telefono, 20, 1)) BETWEEN 48 AND 57 THEN SUBSTRING(Telefono, 20, 1) ELSE '' END
+    AS VARCHAR(20)) PERSISTED;
+GO
+
+CREATE INDEX IX_Pacientes_TelefonoNormalizado ON Pacientes (TelefonoNormalizado);
+GO
+
+-- La intercalación por defecto no distingue mayúsculas, así que basta con Email
+IF NOT EXISTS (SELECT 1 FROM sys.indexes WHERE name = 'IX_Pacientes_Email'
+               AND object_id = OBJECT_ID('Pacientes'))
+    CREATE INDEX IX_Pacientes_Email ON Pacientes (Email);
+GO
@@ -0,0 +1,31 @@
+-- Lista de espera de pacientes por médico o por especialidad. Cuando se libera
+-- un horario se ofrece al mejor candidato (Prioridad, luego Alta) y la entrada
+-- pasa a 'Ofrecida' con la retención creada para él; al confirmarla pasa a
+-- 'Asignada' con la cita creada, y si vence vuelve a 'Esperando'.
+USE ClinicaMedica;
+GO
+
+CREATE TABLE ListaEspera (
+    IdEspera INT IDENTITY PRIMARY KEY,
+    IdPaciente INT NOT NULL REFERENCES Pacientes (IdPaciente),
+    IdMedico INT NULL REFERENCES Medicos (IdMedico),
+    Especialidad VARCHAR(100) NULL,
+    Prioridad INT NOT NULL DEFAULT 3,
+    Desde DATETIME NULL,
+    Hasta DATETIME NULL,
+    Alta DATETIME NOT NULL DEFAULT GETDATE(),
+    Estado VARCHAR(20) NOT NULL DEFAULT 'Esperando',
+    IdRetencion VARCHAR(32) NULL,
+    MedicoOfrecido INT NULL,
+    FechaOfrecida DATETIME NULL,
+    IdCita INT NULL REFERENCES Citas (IdCita),
+    CHECK ((IdMedico IS NULL AND Especialidad IS NOT NULL)
+        OR (IdMedico IS NOT NULL AND Especialidad IS NULL))
+);
+GO
+
+CREATE INDEX IX_ListaEspera_Estado ON ListaEspera (Estado);
+GO
+
+CREATE INDEX IX_ListaEspera_IdRetencion ON ListaEspera (IdRetencion) WHERE IdRetencion IS NOT NULL;
+GO
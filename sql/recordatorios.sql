@@ -0,0 +1,14 @@
+-- Registro de recordatorios enviados. La clave primaria evita que un mismo
+-- recordatorio (cita, 24h/2h, email/sms) se anote dos veces y el despachador
+-- la consulta para no volver a enviarlo tras un reinicio.
+USE ClinicaMedica;
+GO
+
+CREATE TABLE RecordatoriosEnviados (
+    IdCita INT NOT NULL REFERENCES Citas (IdCita) ON DELETE CASCADE,
+    Tipo VARCHAR(3) NOT NULL,
+    Canal VARCHAR(5) NOT NULL,
+    FechaEnvio DATETIME NOT NULL DEFAULT GETDATE(),
+    PRIMARY KEY (IdCita, Tipo, Canal)
+);
+GO
@@ -0,0 +1,39 @@
+-- Series de citas recurrentes (ver series.py). Las ocurrencias no se guardan:
+-- se generan bajo demanda y las de los próximos días se materializan en Citas
+-- hasta MaterializadaHasta.
+USE ClinicaMedica;
+GO
+
+CREATE TABLE SeriesCitas (
+    IdSerie INT IDENTITY PRIMARY KEY,
+    IdPaciente INT NOT NULL REFERENCES Pacientes (IdPaciente),
+    IdMedico INT NOT NULL REFERENCES Medicos (IdMedico),
+    Inicio DATETIME NOT NULL,
+    Frecuencia VARCHAR(10) NOT NULL CHECK (Frecuencia IN ('SEMANAL', 'MENSUAL')),
+    Intervalo INT NOT NULL DEFAULT 1 CHECK (Intervalo >= 1),
+    Cantidad INT NULL,
+    Hasta DATETIME NULL,
+    Motivo VARCHAR(255) NOT NULL,
+    MaterializadaHasta DATETIME NULL,
+    Activa BIT NOT NULL DEFAULT 1
+);
+GO
+
+CREATE INDEX IX_SeriesCitas_IdMedico ON SeriesCitas (IdMedico) WHERE Activa = 1;
+GO
+
+-- Ocurrencias que materializar() no pudo crear porque el horario estaba
+-- ocupado; quedan pendientes hasta que la clínica las reprograme
+-- (GET /citas/series/{id}/omitidas y POST .../omitidas/{id}/reprogramar).
+CREATE TABLE SeriesOmitidas (
+    IdOmitida INT IDENTITY PRIMARY KEY,
+    IdSerie INT NOT NULL REFERENCES SeriesCitas (IdSerie),
+    FechaCita DATETIME NOT NULL,
+    Alta DATETIME NOT NULL DEFAULT GETDATE(),
+    Reprogramada BIT NOT NULL DEFAULT 0,
+    IdCita INT NULL REFERENCES Citas (IdCita)
+);
+GO
+
+CREATE INDEX IX_SeriesOmitidas_Pendientes ON SeriesOmitidas (IdSerie, FechaCita) WHERE Reprogramada = 0;
+GO
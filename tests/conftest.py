@@ -0,0 +1,48 @@
+"""Las pruebas corren contra la base local de benchmarks (SQLite con la misma
+interfaz que pyodbc), sin SQL Server."""
+import os
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks import base_local  # noqa: E402
+
+# Los módulos que hacen `import pyodbc` se pueden importar en las pruebas
+base_local.instalar()
+
+
+@pytest.fixture(scope="session")
+def cliente_citas(tmp_path_factory):
+    base_local.configurar(tmp_path_factory.mktemp("base") / "clinica.db")
+    base_local.sembrar(pacientes=300, medicos=5, dias=20)
+    base_local.instalar()
+    # La base local no tiene caché de planes que consultar
+    os.environ.setdefault("CLINICA_PLANES_POR_MINUTO", "0")
+    import citas
+    from fastapi.testclient import TestClient
+    return TestClient(citas.app, raise_server_exceptions=False)
+
+
+@pytest.fixture
+def horario_libre(cliente_citas):
+    """Devuelve una función que busca (IdMedico, FechaCita) libres en los próximos días"""
+    usados = set()
+
+    def buscar():
+        for dias in range(1, 15):
+            fecha = date.today() + timedelta(days=dias)
+            for medico in range(1, 6):
+                respuesta = cliente_citas.get("/citas/disponibilidad",
+                                              params={"medico": medico, "fecha": fecha.isoformat()})
+                if respuesta.status_code != 200:
+                    continue
+                for horario in respuesta.json()["horarios"]:
+                    if (medico, horario) not in usados:
+                        usados.add((medico, horario))
+                        return medico, horario
+        pytest.skip("No hay horarios libres en la base sembrada")
+
+    return buscar
@@ -0,0 +1,18 @@
+import acceso_datos
+from acceso_datos import Registro, conectar
+
+SENTENCIA = "SELECT IdPaciente FROM Pacientes WHERE IdPaciente <= ?"
+
+
+def test_iterar_el_cursor_cuenta_las_filas(cliente_citas, monkeypatch):
+    registro = Registro(umbral_ms=10_000)
+    monkeypatch.setattr(acceso_datos, "registro", registro)
+    with conectar("") as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(SENTENCIA, 5)
+            ids = [fila.IdPaciente for fila in cursor]
+    conn.close()
+    assert ids == [1, 2, 3, 4, 5]
+    [resumen] = registro.sentencias()
+    assert resumen["ejecuciones"] == 1
+    assert resumen["filas"] == 5
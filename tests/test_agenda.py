@@ -0,0 +1,31 @@
+from datetime import date, datetime, time
+
+from agenda import AgendaDiaria
+
+HOY = date.today()
+
+
+def _cita(id_cita, hora, motivo="Control"):
+    return {"IdCita": id_cita, "IdPaciente": 7, "IdMedico": 1,
+            "FechaCita": datetime.combine(HOY, time(hora)), "Motivo": motivo,
+            "Estado": "Pendiente", "NombrePaciente": "Ana Gómez"}
+
+
+def test_procesos_con_las_mismas_citas_dan_la_misma_version():
+    citas = [_cita(1, 9), _cita(2, 10)]
+    # Dos trabajadores: uno parcha el alta, el otro vuelve a leer el día
+    primero = AgendaDiaria(lambda fecha: list(citas), lambda id_paciente: "Ana Gómez")
+    segundo = AgendaDiaria(lambda fecha: list(citas), lambda id_paciente: "Ana Gómez")
+    version, _ = primero.obtener(1, HOY)
+    assert segundo.obtener(1, HOY)[0] == version
+
+    nueva = _cita(3, 11)
+    citas.append(nueva)
+    primero.aplicar(3, {k: v for k, v in nueva.items() if k != "NombrePaciente"})
+    segundo.construir_dia(HOY)
+    assert primero.obtener(1, HOY)[0] == segundo.obtener(1, HOY)[0] != version
+
+
+def test_agendas_vacias_de_distintos_medicos_tienen_distinta_version():
+    agenda = AgendaDiaria(lambda fecha: [], lambda id_paciente: None)
+    assert agenda.obtener(1, HOY)[0] != agenda.obtener(2, HOY)[0]
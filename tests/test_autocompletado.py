@@ -0,0 +1,27 @@
+from autocompletado import IndicePrefijos, claves_de
+
+
+def test_claves_de_cubre_cada_palabra():
+    assert claves_de("María  José Pérez") == ["maria jose perez", "jose perez", "perez"]
+
+
+def test_agregar_reemplaza_el_registro():
+    indice = IndicePrefijos()
+    indice.agregar(1, "Ana Gómez", ["Ana Gómez"])
+    indice.agregar(1, "Ana López", ["Ana López"])
+    assert indice.buscar("gom") == []
+    assert indice.buscar("lop") == [{"id": 1, "texto": "Ana López"}]
+    assert len(indice) == 2
+
+
+def test_agregar_cerca_del_limite_cuenta_las_claves_que_reemplaza():
+    indice = IndicePrefijos(max_entradas=4)
+    assert indice.agregar(1, "Ana Gómez", ["Ana Gómez"])
+    assert indice.agregar(2, "Luis", ["Luis"])
+    # Reemplazar 2 claves por 3 deja 4 entradas: cabe
+    assert indice.agregar(1, "Ana María Gómez", ["Ana María Gómez"])
+    assert indice.buscar("mar") == [{"id": 1, "texto": "Ana María Gómez"}]
+    # Si no cabe, el registro anterior sigue indexado
+    assert not indice.agregar(2, "Luis Alberto Ruiz", ["Luis Alberto Ruiz"])
+    assert indice.buscar("lu") == [{"id": 2, "texto": "Luis"}]
+    assert len(indice) == 4
@@ -0,0 +1,22 @@
+import pytest
+
+from busqueda import raiz, terminos
+
+
+@pytest.mark.parametrize("palabras", [
+    ("dolor", "dolores"),
+    ("cabeza", "cabezas"),
+    ("control", "controles"),
+    ("alergico", "alergica", "alergicos"),
+])
+def test_variantes_comparten_raiz(palabras):
+    assert len({raiz(p) for p in palabras}) == 1
+
+
+def test_raiz_deja_al_menos_tres_letras():
+    assert raiz("ojos") == "ojo"
+    assert raiz("pie") == "pie"
+
+
+def test_terminos_quita_acentos_y_palabras_vacias():
+    assert terminos("Control de la Presión arterial") == terminos("controles presion arterial")
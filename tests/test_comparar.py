@@ -0,0 +1,125 @@
+import json
+import sys
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+from benchmarks import comparar
+from benchmarks.comparar import cargar, mann_whitney, p_minimo
+
+POR_ID = "SELECT * FROM Pacientes WHERE IdPaciente = ?"
+CON_IN = "SELECT * FROM Pacientes WHERE IdPaciente IN (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+
+def _opciones(**cambios):
+    return Namespace(**dict(umbral=10, umbral_p95=20, umbral_sentencias=25, umbral_viajes=5, alfa=0.05,
+                            remuestreos=300, semilla=0, solo=None, todas=False, json=False, **cambios))
+
+
+def _repeticion(rng, escala, sentencias, peticiones=60):
+    latencias = (rng.lognormal(0, 0.2, peticiones) * 10 * escala).round(3).tolist()
+    return {
+        "peticiones": peticiones,
+        "errores": 0,
+        "latencias_ms": latencias,
+        "sentencias": [{"sentencia": sentencia, "ejecuciones": por_peticion * peticiones,
+                        "total_ms": por_peticion * peticiones * ms * escala, "media_ms": ms * escala}
+                       for sentencia, por_peticion, ms in sentencias],
+    }
+
+
+def _corridas(tmp_path, nombre, derivas, factor=1.0, sentencias=((POR_ID, 1, 0.5),), semilla=0):
+    """Un archivo por corrida; cada corrida tiene su propia deriva de la máquina
+    que comparten sus repeticiones"""
+    rng = np.random.default_rng(semilla)
+    rutas = []
+    for i, deriva in enumerate(derivas):
+        informe = {
+            "version": comparar.VERSION_RESULTADOS, "commit": nombre, "fecha": "2026-10-19",
+            "parametros": {"peticiones": 60, "pacientes": 2000, "medicos": 20, "dias": 120,
+                           "semilla": 0, "repeticiones": 3},
+            "resultados": [{"servicio": "medicos", "endpoint": "GET /medicos/", "concurrencia": 1,
+                            "repeticiones": [_repeticion(rng, deriva * factor, sentencias)
+                                             for _ in range(3)]}],
+        }
+        ruta = tmp_path / f"{nombre}{i}.json"
+        ruta.write_text(json.dumps(informe), encoding="utf-8")
+        rutas.append(str(ruta))
+    return ",".join(rutas)
+
+
+# Corridas alternadas: la base i y la nueva i corren seguidas con la misma deriva
+DERIVAS = [1.0, 1.25, 0.85, 1.15, 0.95]
+
+
+def test_mann_whitney_exacta():
+    p, superioridad = mann_whitney([1, 2, 3, 4, 5], [6, 7, 8, 9, 10])
+    assert p == pytest.approx(2 / 252)
+    assert superioridad == 1.0
+    assert mann_whitney([1, 2, 3], [1, 2, 3])[0] == 1.0
+    assert mann_whitney([], [1]) == (None, None)
+
+
+def test_mann_whitney_aproximada_con_muestras_grandes():
+    rng = np.random.default_rng(1)
+    p, superioridad = mann_whitney(rng.normal(0, 1, 200), rng.normal(0.5, 1, 200))
+    assert p < 0.001
+    assert superioridad > 0.6
+
+
+def test_p_minimo():
+    assert p_minimo(3, 3) == pytest.approx(0.1)
+    assert p_minimo(4, 4) < 0.05
+    assert p_minimo(1, 0) == 1.0
+
+
+def test_cargar_marca_la_corrida_de_cada_repeticion(tmp_path):
+    informe = cargar(_corridas(tmp_path, "a", DERIVAS[:2]))
+    assert informe["parametros"]["corridas"] == 2
+    assert [r["corrida"] for r in informe["resultados"][0]["repeticiones"]] == [0, 0, 0, 1, 1, 1]
+
+
+def test_a_a_con_deriva_entre_corridas_sale_con_0(tmp_path, monkeypatch, capsys):
+    base = _corridas(tmp_path, "a", DERIVAS, semilla=1)
+    nuevo = _corridas(tmp_path, "b", DERIVAS, semilla=2)
+    assert comparar.comparar(cargar(base), cargar(nuevo), _opciones())["regresiones"] == 0
+    monkeypatch.setattr(sys, "argv", ["comparar", base, nuevo])
+    with pytest.raises(SystemExit) as salida:
+        comparar.main()
+    assert salida.value.code == 0
+
+
+def test_regresion_real_se_detecta(tmp_path):
+    base = _corridas(tmp_path, "a", DERIVAS, semilla=1)
+    nuevo = _corridas(tmp_path, "b", DERIVAS, factor=1.5, semilla=2)
+    informe = comparar.comparar(cargar(base), cargar(nuevo), _opciones())
+    assert informe["regresiones"] == 1
+    assert any(m.startswith("p50") for m in informe["endpoints"][0]["motivos"])
+
+
+def test_pocas_corridas_avisan_y_no_son_significativas(tmp_path):
+    base = _corridas(tmp_path, "a", DERIVAS[:1], semilla=1)
+    nuevo = _corridas(tmp_path, "b", DERIVAS[:1], factor=1.5, semilla=2)
+    informe = comparar.comparar(cargar(base), cargar(nuevo), _opciones())
+    assert informe["regresiones"] == 0
+    assert informe["endpoints"][0]["veredicto"] == comparar.DUDOSO
+    assert any("corridas" in aviso for aviso in informe["avisos"])
+
+
+def test_reemplazar_n_consultas_por_una_con_in_no_es_regresion(tmp_path):
+    base = _corridas(tmp_path, "a", DERIVAS, sentencias=((POR_ID, 10, 0.5),), semilla=1)
+    nuevo = _corridas(tmp_path, "b", DERIVAS, factor=0.8, sentencias=((CON_IN, 1, 1.0),), semilla=2)
+    informe = comparar.comparar(cargar(base), cargar(nuevo), _opciones())
+    endpoint = informe["endpoints"][0]
+    assert informe["regresiones"] == 0
+    assert {s["estado"] for s in endpoint["sentencias"]} == {"nueva", "eliminada"}
+    assert endpoint["viajes_por_peticion"] == [10.0, 1.0]
+
+
+def test_mas_tiempo_en_la_base_con_otra_forma_es_regresion(tmp_path):
+    base = _corridas(tmp_path, "a", DERIVAS, sentencias=((POR_ID, 1, 0.5),), semilla=1)
+    nuevo = _corridas(tmp_path, "b", DERIVAS, sentencias=((CON_IN, 1, 5.0),), semilla=2)
+    informe = comparar.comparar(cargar(base), cargar(nuevo), _opciones())
+    assert informe["regresiones"] == 1
+    assert any(m.startswith("tiempo en la base") for m in informe["endpoints"][0]["motivos"])
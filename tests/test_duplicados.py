@@ -0,0 +1,48 @@
+from datetime import date
+
+import pytest
+
+from duplicados import claves_bloqueo, comparar_bloques, jaro_winkler, puntaje, similitud_fechas
+
+
+def _paciente(id, fecha, nombre="maria", apellido="garcia lopez", sexo="F", telefono="", email=None):
+    return (id, nombre, apellido, fecha, sexo, telefono, email)
+
+
+def test_jaro_winkler_casos_conocidos():
+    assert jaro_winkler("martha", "marhta") == pytest.approx(0.9611, abs=1e-4)
+    assert jaro_winkler("garcia", "garcia") == 1.0
+    assert jaro_winkler("", "garcia") == 0.0
+
+
+@pytest.mark.parametrize("otra, esperado", [
+    (date(1980, 3, 12), 1.0),
+    (date(1980, 3, 13), 0.95),
+    (date(1980, 12, 3), 0.95),
+    (date(1980, 3, 28), 0.75),
+    (date(1975, 6, 1), 0.0),
+    (None, 0.0),
+])
+def test_similitud_fechas(otra, esperado):
+    assert similitud_fechas(date(1980, 3, 12), otra) == esperado
+
+
+def test_claves_bloqueo_por_fecha_y_primer_apellido():
+    paciente = _paciente(1, date(1980, 3, 12))
+    assert claves_bloqueo(paciente) == [("fecha", date(1980, 3, 12)), ("apellido", "garcia", "m")]
+    assert claves_bloqueo(_paciente(2, None, apellido="")) == []
+
+
+def test_par_que_solo_difiere_en_la_fecha_se_detecta_por_apellido():
+    p = _paciente(1, date(1980, 3, 12))
+    q = _paciente(2, date(1980, 12, 3))
+    assert puntaje(p, q) >= 0.88
+    clave_p, clave_q = claves_bloqueo(p)[1], claves_bloqueo(q)[1]
+    assert clave_p == clave_q
+    assert comparar_bloques(([[p, q]], 0.88)) == [(1, 2, round(puntaje(p, q), 4))]
+
+
+def test_fechas_distintas_sin_otro_indicio_no_alcanzan_el_umbral():
+    p = _paciente(1, date(1980, 3, 12))
+    q = _paciente(2, date(1992, 7, 30))
+    assert comparar_bloques(([[p, q]], 0.88)) == []
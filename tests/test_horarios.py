@@ -0,0 +1,32 @@
+import pytest
+
+from horarios import DIA_COMPLETO, mascara_de_tramos, tramos_de_mascara
+
+
+def test_tramos_a_mascara_y_vuelta():
+    tramos = [("08:00", "12:00"), ("14:30", "18:00")]
+    mascara = mascara_de_tramos(tramos)
+    assert tramos_de_mascara(mascara) == tramos
+    assert mascara_de_tramos([("00:00", "00:15")]) == 0b111
+
+
+def test_tramos_solapados_se_unen():
+    assert tramos_de_mascara(mascara_de_tramos([("08:00", "10:00"), ("09:00", "11:00")])) == [
+        ("08:00", "11:00")
+    ]
+
+
+def test_dia_completo():
+    assert mascara_de_tramos([("00:00", "24:00")]) == DIA_COMPLETO
+
+
+@pytest.mark.parametrize("tramo", [
+    ("8:00", "12:00"),
+    ("12:00", "08:00"),
+    ("10:00", "10:00"),
+    ("20:00", "24:05"),
+    ("08:02", "12:00"),
+])
+def test_tramos_invalidos(tramo):
+    with pytest.raises(ValueError):
+        mascara_de_tramos([tramo])
@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from ocupacion import OcupacionMedicos
+
+NUEVE = datetime(2026, 11, 2, 9, 0)
+
+
+def test_liberar_cita_materializada_por_otro_proceso_quita_la_ocurrencia():
+    # El día se cargó cuando la ocurrencia aún no era una fila de Citas
+    ocupacion = OcupacionMedicos(lambda medico, dia: [(("serie", 7, NUEVE), NUEVE)])
+    assert ocupacion.choca(1, NUEVE)
+    ocupacion.liberar(123)
+    assert ocupacion.choca(1, NUEVE)
+    ocupacion.liberar(123, 1, NUEVE)
+    assert not ocupacion.choca(1, NUEVE)
+
+
+def test_recargar_lee_el_dia_y_conserva_las_claves_temporales():
+    filas = [(("serie", 7, NUEVE), NUEVE)]
+    ocupacion = OcupacionMedicos(lambda medico, dia: list(filas))
+    ocupacion.ocupar(("reprogramacion", 5), 1, datetime(2026, 11, 2, 11, 0))
+    filas[:] = [(123, NUEVE)]
+    ocupacion.recargar(1, NUEVE.date())
+    assert ocupacion.conoce(123)
+    assert not ocupacion.conoce(("serie", 7, NUEVE))
+    assert ocupacion.choca(1, datetime(2026, 11, 2, 11, 0))
+    assert not ocupacion.choca(1, NUEVE, excluir=123)
@@ -0,0 +1,31 @@
+from rueda_temporal import RuedaTemporal
+
+
+def test_avanzar_devuelve_solo_lo_vencido():
+    rueda = RuedaTemporal(resolucion=1.0, ranuras=10, reloj=lambda: 0.0)
+    rueda.agregar("a", 3.0)
+    rueda.agregar("b", 5.5)
+    rueda.agregar("c", 25.0)
+    assert rueda.avanzar(2.9) == []
+    assert rueda.avanzar(5.0) == ["a"]
+    assert rueda.avanzar(6.0) == ["b"]
+    # "c" comparte ranura con vencimientos de vueltas anteriores y espera su vuelta
+    assert rueda.avanzar(15.0) == []
+    assert rueda.avanzar(25.0) == ["c"]
+    assert len(rueda) == 0
+
+
+def test_reprogramar_y_cancelar():
+    rueda = RuedaTemporal(resolucion=1.0, ranuras=10, reloj=lambda: 0.0)
+    rueda.agregar("a", 2.0)
+    rueda.agregar("a", 4.0)
+    rueda.agregar("b", 3.0)
+    rueda.cancelar("b")
+    assert rueda.avanzar(3.0) == []
+    assert rueda.avanzar(4.0) == ["a"]
+
+
+def test_vencimiento_en_el_pasado_sale_en_el_siguiente_avance():
+    rueda = RuedaTemporal(resolucion=1.0, ranuras=10, reloj=lambda: 100.0)
+    rueda.agregar("a", 50.0)
+    assert rueda.avanzar(100.0) == ["a"]
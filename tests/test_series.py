@@ -0,0 +1,76 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+
+import series
+from benchmarks import base_local
+
+
+def _serie(inicio, frecuencia, intervalo=1, cantidad=None, hasta=None):
+    return SimpleNamespace(Inicio=inicio, Frecuencia=frecuencia, Intervalo=intervalo,
+                           Cantidad=cantidad, Hasta=hasta)
+
+
+def test_serie_semanal_con_cantidad():
+    fila = _serie(datetime(2026, 1, 5, 9), "SEMANAL", intervalo=2, cantidad=3)
+    assert list(series.ocurrencias_de_fila(fila)) == [
+        datetime(2026, 1, 5, 9), datetime(2026, 1, 19, 9), datetime(2026, 2, 2, 9)
+    ]
+
+
+def test_ventana_salta_a_la_primera_ocurrencia_sin_contar_de_mas():
+    fila = _serie(datetime(2026, 1, 5, 9), "SEMANAL", cantidad=10)
+    ventana = list(series.ocurrencias_de_fila(fila, datetime(2026, 3, 1), datetime(2026, 12, 31)))
+    # La cantidad corta en la décima semana aunque la ventana siga
+    assert ventana == [datetime(2026, 3, 2, 9), datetime(2026, 3, 9, 9)]
+
+
+def test_serie_mensual_ajusta_al_ultimo_dia_del_mes():
+    fila = _serie(datetime(2026, 1, 31, 10), "MENSUAL", hasta=datetime(2026, 4, 30, 23))
+    assert list(series.ocurrencias_de_fila(fila)) == [
+        datetime(2026, 1, 31, 10), datetime(2026, 2, 28, 10), datetime(2026, 3, 31, 10),
+        datetime(2026, 4, 30, 10)
+    ]
+
+
+def test_frecuencia_desconocida():
+    with pytest.raises(ValueError):
+        list(series.ocurrencias_de_fila(_serie(datetime(2026, 1, 5), "DIARIA", cantidad=1)))
+
+
+def test_ocurrencia_omitida_se_lista_y_se_reprograma(cliente_citas, horario_libre):
+    medico, fecha = horario_libre()
+    respuesta = cliente_citas.post("/citas/series", json={
+        "IdPaciente": 1, "IdMedico": medico, "Inicio": fecha, "Frecuencia": "SEMANAL",
+        "Cantidad": 1, "Motivo": "Control"
+    })
+    assert respuesta.status_code == 200
+    id_serie = respuesta.json()["IdSerie"]
+
+    # Otra cita ocupa el horario antes de materializar
+    conn = base_local.connect()
+    conn.cursor().execute(
+        "INSERT INTO Citas (IdPaciente, IdMedico, FechaCita, Motivo, Estado) VALUES (?, ?, ?, ?, ?)",
+        2, medico, datetime.fromisoformat(fecha), "Urgencia", "Pendiente")
+    conn.commit()
+    series.materializar(conn, dias=30)
+    conn.close()
+
+    omitidas = cliente_citas.get(f"/citas/series/{id_serie}/omitidas").json()["omitidas"]
+    assert len(omitidas) == 1
+    id_omitida = omitidas[0]["IdOmitida"]
+
+    medico_nuevo, fecha_nueva = horario_libre()
+    respuesta = cliente_citas.post(f"/citas/series/{id_serie}/omitidas/{id_omitida}/reprogramar",
+                                   json={"FechaCita": fecha_nueva, "IdMedico": medico_nuevo})
+    assert respuesta.status_code == 200
+    assert cliente_citas.get(f"/citas/series/{id_serie}/omitidas").json()["omitidas"] == []
+
+    ocurrencias = cliente_citas.get(f"/citas/series/{id_serie}/ocurrencias").json()["ocurrencias"]
+    assert ocurrencias[0]["omitida"] == {"IdOmitida": id_omitida, "Reprogramada": True}
+    assert not ocurrencias[0]["materializada"]
+
+    repetida = cliente_citas.post(f"/citas/series/{id_serie}/omitidas/{id_omitida}/reprogramar",
+                                  json={"FechaCita": fecha_nueva})
+    assert repetida.status_code == 404
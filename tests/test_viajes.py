@@ -0,0 +1,39 @@
+import logging
+
+import viajes
+from viajes import Viajes
+
+
+def _cita(medico, fecha):
+    return {"IdPaciente": 1, "IdMedico": medico, "FechaCita": fecha, "Motivo": "Control",
+            "Estado": "Pendiente"}
+
+
+def test_formas_repetidas_se_reportan(caplog):
+    consulta = "SELECT * FROM Pacientes WHERE IdPaciente = ?"
+    v = Viajes()
+    v.anotar("SELECT * FROM Citas", "GET /citas/")
+    for _ in range(viajes.REPETICIONES_N_MAS_UNO):
+        v.anotar(consulta, "GET /citas/")
+    with caplog.at_level(logging.WARNING, logger="viajes"):
+        assert v.revisar("GET /citas/") == [(consulta, viajes.REPETICIONES_N_MAS_UNO)]
+    assert "Posible N+1 en GET /citas/" in caplog.text
+
+
+def test_endpoint_de_escritura_cuenta_viajes_en_el_carril(cliente_citas, horario_libre, monkeypatch, caplog):
+    medico, fecha = horario_libre()
+    monkeypatch.setattr(viajes, "REPETICIONES_N_MAS_UNO", 1)
+    with caplog.at_level(logging.WARNING, logger="viajes"):
+        respuesta = cliente_citas.post("/citas/", json=_cita(medico, fecha))
+    assert respuesta.status_code == 200
+    assert "Posible N+1 en POST /citas/" in caplog.text
+    assert "INSERT INTO Citas" in caplog.text
+
+
+def test_presupuesto_excedido_devuelve_500(cliente_citas, horario_libre, monkeypatch):
+    medico, fecha = horario_libre()
+    monkeypatch.setattr(viajes, "MODO_PRUEBA", True)
+    monkeypatch.setitem(viajes.PRESUPUESTOS, "POST /citas/", 0)
+    respuesta = cliente_citas.post("/citas/", json=_cita(medico, fecha))
+    assert respuesta.status_code == 500
+    assert "superó su presupuesto de 0 viajes" in respuesta.json()["detail"]
@@ -0,0 +1,19 @@
+import unicodedata
+
+
+def normalizar(texto):
+    """Pasar a minúsculas, quitar acentos y colapsar espacios"""
+    if not texto:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(texto))
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(texto.lower().split())
+
+
+def normalizar_telefono(telefono):
+    """Dejar solo los dígitos 0-9 del teléfono, igual que Pacientes.TelefonoNormalizado"""
+    return "".join(c for c in str(telefono or "") if "0" <= c <= "9")
+
+
+def normalizar_email(email):
+    return str(email or "").strip().lower()
@@ -0,0 +1,95 @@
+"""Transiciones automáticas de estado de las citas vencidas.
+
+Uso: python transiciones_estado.py [--lote 1000] [--pausa 0.2] [--cada 15]
+
+Aplica TRANSICIONES_VENCIDAS (Pendiente -> Ausente, Confirmada -> Completada)
+con UPDATE por lotes sobre el índice (Estado, FechaCita). Cada lote es una
+transacción corta que salta las filas bloqueadas, así nunca hace esperar a
+las reservas; entre lotes se hace una pausa para limitar la carga. Como un
+lote corto puede deberse solo a filas saltadas, se sigue hasta un lote vacío.
+"""
+import argparse
+import logging
+import time
+from datetime import datetime, timedelta
+
+import pyodbc
+
+from models.cita import TRANSICIONES_VENCIDAS
+
+connection_string = (
+    "DRIVER={ODBC Driver 17 for SQL Server};"
+    "SERVER=MANUEL\\MSSQL2022;"
+    "DATABASE=ClinicaMedica;"
+    "Trusted_Connection=yes;"
+)
+
+logger = logging.getLogger(__name__)
+
+# Por debajo del umbral de escalado de bloqueos de SQL Server (~5000)
+MAX_LOTE = 4000
+# Error de SQL Server al vencer LOCK_TIMEOUT
+ERROR_TIEMPO_BLOQUEO = 1222
+
+
+def _es_tiempo_de_bloqueo(error):
+    return f"({ERROR_TIEMPO_BLOQUEO})" in str(error)
+
+
+def aplicar_transiciones(conn, lote=1000, pausa=0.2, margen_horas=2):
+    """Aplicar todas las transiciones pendientes; devuelve {(origen, destino): filas}"""
+    lote = min(lote, MAX_LOTE)
+    corte = datetime.now() - timedelta(hours=margen_horas)
+    cursor = conn.cursor()
+    # Si hay un interbloqueo con una reserva, que pierda este proceso
+    cursor.execute("SET DEADLOCK_PRIORITY LOW; SET LOCK_TIMEOUT 1000;")
+    totales = {}
+    for origen, destino in TRANSICIONES_VENCIDAS.items():
+        total = 0
+        while True:
+            comienzo = time.perf_counter()
+            try:
+                cursor.execute("""
+                    UPDATE TOP (?) Citas WITH (ROWLOCK, READPAST)
+                    SET Estado = ?
+                    WHERE Estado = ? AND FechaCita < ?
+                """, lote, destino, origen, corte)
+                filas = cursor.rowcount
+                conn.commit()
+            except pyodbc.Error as error:
+                if not _es_tiempo_de_bloqueo(error):
+                    raise
+                # Un bloqueo que no se pudo saltar: se deja para la próxima pasada
+                conn.rollback()
+                logger.warning("%s -> %s: tiempo de espera de bloqueo agotado, se reintenta luego",
+                               origen, destino)
+                break
+            total += filas
+            logger.info("%s -> %s: %d citas en %.3fs", origen, destino, filas,
+                        time.perf_counter() - comienzo)
+            if filas == 0:
+                break
+            time.sleep(pausa)
+        totales[(origen, destino)] = total
+    return totales
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Aplicar transiciones de estado a las citas vencidas")
+    parser.add_argument("--lote", type=int, default=1000, help=f"filas por UPDATE (máx. {MAX_LOTE})")
+    parser.add_argument("--pausa", type=float, default=0.2, help="segundos de pausa entre lotes")
+    parser.add_argument("--margen-horas", type=float, default=2,
+                        help="horas después de FechaCita antes de cambiar el estado")
+    parser.add_argument("--cada", type=float, default=None,
+                        help="repetir cada N minutos (sin esto, una sola pasada)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    while True:
+        conn = pyodbc.connect(connection_string)
+        for (origen, destino), filas in aplicar_transiciones(
+                conn, args.lote, args.pausa, args.margen_horas).items():
+            logger.info("Total %s -> %s: %d", origen, destino, filas)
+        conn.close()
+        if args.cada is None:
+            break
+        time.sleep(args.cada * 60)
@@ -0,0 +1,402 @@
+"""Trazas por petición: en qué se fue el tiempo (conectar, execute, fetch, serializar).
+
+La decisión de muestrear se toma una vez, al entrar la petición: si trae un
+encabezado `traceparent` (W3C) se respeta su id y su bandera de muestreo; si
+trae `X-Trace-Id` se usa ese id; si no, se genera uno. Las no muestreadas no
+cuestan más que leer un contextvar en cada punto instrumentado. La respuesta
+devuelve `traceparent` y `X-Trace-Id` para poder seguir la traza río abajo.
+
+Configuración por entorno:
+    CLINICA_TRAZAS            archivo .jsonl o URL http(s) de un colector;
+                              sin definir no se exporta ni se muestrea nada
+    CLINICA_TRAZAS_MUESTREO   fracción de peticiones a trazar (0.05)
+
+Uso del colector de prueba y del visor:
+    python trazas.py colector [--puerto 4318] [--salida trazas.jsonl]
+    python trazas.py ver trazas.jsonl [--lentas 10] [--traza ID]
+"""
+import argparse
+import contextvars
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+from functools import wraps
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+MUESTREO = float(os.environ.get("CLINICA_TRAZAS_MUESTREO", "0.05"))
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+_TRACE_ID = re.compile(r"^[0-9a-fA-F]{1,32}$")
+
+traza_actual = contextvars.ContextVar("traza_actual", default=None)
+tramo_actual = contextvars.ContextVar("tramo_actual", default=None)
+
+
+class Traza:
+    __slots__ = ("id", "muestreada", "tramos", "fin_handler")
+
+    def __init__(self, id, muestreada):
+        self.id = id
+        self.muestreada = muestreada
+        self.tramos = []
+        self.fin_handler = None
+
+
+class Tramo:
+    __slots__ = ("traza", "id", "padre", "nombre", "inicio", "comienzo", "atributos", "token")
+
+    def __init__(self, traza, nombre, padre, atributos):
+        self.traza = traza
+        self.id = f"{random.getrandbits(64):016x}"
+        self.padre = padre
+        self.nombre = nombre
+        self.inicio = time.time()
+        self.comienzo = time.perf_counter()
+        self.atributos = atributos
+        self.token = None
+
+
+def abrir(nombre, actual=False, **atributos):
+    """Empezar un tramo dentro de la traza en curso; None si no se está trazando.
+    Con actual=True los tramos que se abran después cuelgan de este."""
+    traza = traza_actual.get()
+    if traza is None or not traza.muestreada:
+        return None
+    tramo = Tramo(traza, nombre, tramo_actual.get(), atributos)
+    if actual:
+        tramo.token = tramo_actual.set(tramo.id)
+    return tramo
+
+
+def cerrar(tramo, **atributos):
+    if tramo is None:
+        return
+    duracion = time.perf_counter() - tramo.comienzo
+    if tramo.token is not None:
+        tramo_actual.reset(tramo.token)
+    if atributos:
+        tramo.atributos.update(atributos)
+    tramo.traza.tramos.append({
+        "traza": tramo.traza.id,
+        "tramo": tramo.id,
+        "padre": tramo.padre,
+        "nombre": tramo.nombre,
+        "inicio": round(tramo.inicio, 6),
+        "duracion_ms": round(duracion * 1000, 3),
+        "atributos": tramo.atributos,
+    })
+
+
+def marcar_fin_handler():
+    traza = traza_actual.get()
+    if traza is not None:
+        traza.fin_handler = time.perf_counter()
+
+
+class ExportadorArchivo:
+    def __init__(self, ruta):
+        self.ruta = ruta
+
+    def exportar(self, tramos):
+        with open(self.ruta, "a", encoding="utf-8") as archivo:
+            for tramo in tramos:
+                archivo.write(json.dumps(tramo, ensure_ascii=False, default=str) + "\n")
+
+
+class ExportadorHTTP:
+    """POST de una lista JSON de tramos por traza, reutilizando la conexión"""
+
+    def __init__(self, url):
+        partes = urlsplit(url)
+        clase = HTTPSConnection if partes.scheme == "https" else HTTPConnection
+        self._conexion = clase(partes.hostname, partes.port, timeout=5)
+        self._ruta = partes.path or "/"
+
+    def exportar(self, tramos):
+        cuerpo = json.dumps(tramos, ensure_ascii=False, default=str).encode("utf-8")
+        try:
+            self._conexion.request("POST", self._ruta, cuerpo, {"Content-Type": "application/json"})
+            respuesta = self._conexion.getresponse()
+            respuesta.read()
+        except (OSError, HTTPException):
+            # Cerrarla la deja lista para reconectar en el próximo envío; si no,
+            # queda a mitad de un pedido y todos los siguientes fallan
+            self._conexion.close()
+            raise
+        if not 200 <= respuesta.status < 300:
+            logger.warning("El colector de trazas respondió %s %s", respuesta.status, respuesta.reason)
+
+
+class Exportacion:
+    """Cola hacia un hilo que exporta; si el destino no da abasto se descartan trazas"""
+
+    def __init__(self, exportador, maximo=10_000):
+        self._exportador = exportador
+        self._cola = queue.Queue(maxsize=maximo)
+        threading.Thread(target=self._exportar, name="exportar-trazas", daemon=True).start()
+
+    def enviar(self, tramos):
+        try:
+            self._cola.put_nowait(tramos)
+        except queue.Full:
+            pass
+
+    def _exportar(self):
+        while True:
+            tramos = self._cola.get()
+            try:
+                self._exportador.exportar(tramos)
+            except Exception:
+                logger.exception("No se pudieron exportar %d tramos", len(tramos))
+
+
+def _exportacion_configurada():
+    destino = os.environ.get("CLINICA_TRAZAS")
+    if not destino:
+        return None
+    if destino.startswith(("http://", "https://")):
+        return Exportacion(ExportadorHTTP(destino))
+    return Exportacion(ExportadorArchivo(destino))
+
+
+exportacion = _exportacion_configurada()
+
+
+def comenzar_peticion(encabezado_traceparent, encabezado_trace_id):
+    """Crear la traza de la petición; devuelve (traza, id del tramo padre remoto)"""
+    coincidencia = _TRACEPARENT.match(encabezado_traceparent or "")
+    if coincidencia:
+        id_traza, padre, banderas = coincidencia.groups()
+        muestreada = bool(int(banderas, 16) & 1)
+    else:
+        padre = None
+        if encabezado_trace_id and _TRACE_ID.match(encabezado_trace_id):
+            id_traza = encabezado_trace_id.lower().rjust(32, "0")
+        else:
+            id_traza = f"{random.getrandbits(128):032x}"
+        muestreada = random.random() < MUESTREO
+    return Traza(id_traza, muestreada and exportacion is not None), padre
+
+
+def encabezados_respuesta(traza, raiz):
+    id_tramo = raiz.id if raiz is not None else "0" * 16
+    return {
+        "traceparent": f"00-{traza.id}-{id_tramo}-{'01' if traza.muestreada else '00'}",
+        "X-Trace-Id": traza.id,
+    }
+
+
+def _abrir_raiz(traza, padre, metodo, ruta):
+    if not traza.muestreada:
+        return None
+    tramo = Tramo(traza, "peticion", padre, {"metodo": metodo, "ruta": ruta})
+    tramo.token = tramo_actual.set(tramo.id)
+    return tramo
+
+
+def _terminar_peticion(traza, raiz, ruta, estado):
+    if raiz is None:
+        return
+    cerrar(raiz, ruta=ruta, estado=estado)
+    exportacion.enviar(traza.tramos)
+
+
+def instrumentar_flask(app):
+    from flask import g, request
+    from flask.json.provider import DefaultJSONProvider
+
+    class ProveedorJSONTrazado(DefaultJSONProvider):
+        def response(self, *args, **kwargs):
+            tramo = abrir("serializacion")
+            try:
+                return super().response(*args, **kwargs)
+            finally:
+                cerrar(tramo)
+
+    app.json = ProveedorJSONTrazado(app)
+
+    @app.before_request
+    def _comenzar_traza():
+        traza, padre = comenzar_peticion(request.headers.get("traceparent"),
+                                         request.headers.get("X-Trace-Id"))
+        token = traza_actual.set(traza)
+        g.traza = (traza, token, _abrir_raiz(traza, padre, request.method, request.path))
+
+    @app.after_request
+    def _encabezados_traza(respuesta):
+        if "traza" in g:
+            traza, _, raiz = g.traza
+            respuesta.headers.update(encabezados_respuesta(traza, raiz))
+            g.traza_estado = respuesta.status_code
+        return respuesta
+
+    @app.teardown_request
+    def _terminar_traza(error=None):
+        datos = g.pop("traza", None)
+        if datos is None:
+            return
+        traza, token, raiz = datos
+        ruta = request.url_rule.rule if request.url_rule else "-"
+        _terminar_peticion(traza, raiz, ruta, g.pop("traza_estado", 500))
+        traza_actual.reset(token)
+
+
+class MiddlewareTrazas:
+    """Middleware ASGI: abre la traza, agrega los encabezados y mide la serialización"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encabezados = dict(scope["headers"])
+        traza, padre = comenzar_peticion(
+            encabezados.get(b"traceparent", b"").decode("latin-1"),
+            encabezados.get(b"x-trace-id", b"").decode("latin-1"))
+        token = traza_actual.set(traza)
+        raiz = _abrir_raiz(traza, padre, scope["method"], scope["path"])
+        estado = [500]
+
+        async def enviar(mensaje):
+            if mensaje["type"] == "http.response.start":
+                estado[0] = mensaje["status"]
+                if raiz is not None and traza.fin_handler is not None:
+                    # Del fin del handler al primer byte: jsonable_encoder y render
+                    ahora = time.perf_counter()
+                    tramo = Tramo(traza, "serializacion", raiz.id, {})
+                    tramo.comienzo = traza.fin_handler
+                    tramo.inicio = time.time() - (ahora - traza.fin_handler)
+                    cerrar(tramo)
+                mensaje = dict(mensaje, headers=list(mensaje.get("headers", [])) + [
+                    (clave.lower().encode("latin-1"), valor.encode("latin-1"))
+                    for clave, valor in encabezados_respuesta(traza, raiz).items()])
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _terminar_peticion(traza, raiz, getattr(scope.get("route"), "path", "-"), estado[0])
+            traza_actual.reset(token)
+
+
+def _handler_trazado(funcion):
+    """Envolver el endpoint en un tramo 'handler' y anotar cuándo terminó"""
+    if inspect.iscoroutinefunction(funcion):
+        @wraps(funcion)
+        async def envoltura(*args, **kwargs):
+            tramo = abrir("handler", actual=True)
+            try:
+                return await funcion(*args, **kwargs)
+            finally:
+                cerrar(tramo)
+                marcar_fin_handler()
+    else:
+        @wraps(funcion)
+        def envoltura(*args, **kwargs):
+            tramo = abrir("handler", actual=True)
+            try:
+                return funcion(*args, **kwargs)
+            finally:
+                cerrar(tramo)
+                marcar_fin_handler()
+    return envoltura
+
+
+def clase_ruta():
+    """APIRoute cuyos endpoints quedan envueltos por _handler_trazado"""
+    from fastapi.routing import APIRoute
+
+    class RutaTrazada(APIRoute):
+        def __init__(self, path, endpoint, **kwargs):
+            super().__init__(path, _handler_trazado(endpoint), **kwargs)
+
+    return RutaTrazada
+
+
+def instrumentar_fastapi(app):
+    """Middleware de trazas; las rutas declaradas después en `app` quedan trazadas"""
+    app.add_middleware(MiddlewareTrazas)
+    app.router.route_class = clase_ruta()
+
+
+class _Colector(BaseHTTPRequestHandler):
+    salida = "trazas.jsonl"
+    _lock = threading.Lock()
+
+    def do_POST(self):
+        tramos = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        with self._lock, open(self.salida, "a", encoding="utf-8") as archivo:
+            for tramo in tramos:
+                archivo.write(json.dumps(tramo, ensure_ascii=False) + "\n")
+        self.send_response(204)
+        self.end_headers()
+
+    def log_message(self, formato, *args):
+        pass
+
+
+def _ver(ruta, lentas, id_traza):
+    trazas = {}
+    with open(ruta, encoding="utf-8") as archivo:
+        for linea in archivo:
+            tramo = json.loads(linea)
+            trazas.setdefault(tramo["traza"], []).append(tramo)
+    if id_traza:
+        elegidas = [id_traza]
+    else:
+        raices = {t: next((x for x in tramos if x["nombre"] == "peticion"), None)
+                  for t, tramos in trazas.items()}
+        elegidas = sorted((t for t in raices if raices[t]),
+                          key=lambda t: raices[t]["duracion_ms"], reverse=True)[:lentas]
+    for id_actual in elegidas:
+        tramos = trazas.get(id_actual, [])
+        hijos = {}
+        for tramo in tramos:
+            hijos.setdefault(tramo["padre"], []).append(tramo)
+        ids = {t["tramo"] for t in tramos}
+        print(f"\ntraza {id_actual}")
+        pendientes = [(t, 0) for t in sorted((t for t in tramos if t["padre"] not in ids),
+                                             key=lambda t: t["inicio"], reverse=True)]
+        while pendientes:
+            tramo, nivel = pendientes.pop()
+            atributos = " ".join(f"{k}={v}" for k, v in tramo["atributos"].items())
+            print(f"  {'  ' * nivel}{tramo['nombre']:<14} {tramo['duracion_ms']:>9.3f} ms  {atributos}")
+            pendientes.extend((h, nivel + 1) for h in
+                              sorted(hijos.get(tramo["tramo"], []), key=lambda t: t["inicio"], reverse=True))
+        fases = {}
+        for tramo in tramos:
+            if tramo["nombre"] not in ("peticion", "handler"):
+                fases[tramo["nombre"]] = fases.get(tramo["nombre"], 0) + tramo["duracion_ms"]
+        print("  por fase: " + ", ".join(f"{k} {v:.3f} ms" for k, v in sorted(fases.items())))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Colector de prueba y visor de trazas")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+    colector = ordenes.add_parser("colector", help="recibir tramos por HTTP y guardarlos en JSONL")
+    colector.add_argument("--puerto", type=int, default=4318)
+    colector.add_argument("--salida", default="trazas.jsonl")
+    ver = ordenes.add_parser("ver", help="mostrar el desglose de las trazas más lentas")
+    ver.add_argument("archivo")
+    ver.add_argument("--lentas", type=int, default=10)
+    ver.add_argument("--traza", help="mostrar solo esta traza")
+    args = parser.parse_args()
+
+    if args.orden == "colector":
+        _Colector.salida = args.salida
+        print(f"Colector de trazas en http://localhost:{args.puerto}/ -> {args.salida}")
+        ThreadingHTTPServer(("", args.puerto), _Colector).serve_forever()
+    else:
+        _ver(args.archivo, args.lentas, args.traza)
@@ -0,0 +1,85 @@
+"""Viajes a la base por petición: conteo, patrones N+1 y presupuesto.
+
+acceso_datos anota en `Viajes` cada sentencia que envía, por su forma (el
+texto normalizado). Al terminar la petición, las formas repetidas
+CLINICA_N_MAS_UNO veces o más (5 por omisión) se registran como posible N+1:
+una lista seguida de una consulta por cada id.
+
+CLINICA_PRESUPUESTO_VIAJES fija cuántos viajes puede hacer una petición y
+CLINICA_PRESUPUESTOS lo ajusta por endpoint ("GET /citas/{id}=2;POST
+/citas/=6"). Pasarse se registra siempre; con CLINICA_MODO_PRUEBA=1 además
+la sentencia que se pasa falla con PresupuestoExcedido, para que las pruebas
+y los benchmarks detecten la regresión antes de llegar a producción.
+"""
+import contextvars
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+REPETICIONES_N_MAS_UNO = int(os.environ.get("CLINICA_N_MAS_UNO", "5"))
+MODO_PRUEBA = os.environ.get("CLINICA_MODO_PRUEBA", "") not in ("", "0")
+
+
+def _leer_presupuestos(texto):
+    presupuestos = {}
+    for entrada in filter(None, (e.strip() for e in texto.split(";"))):
+        endpoint, _, limite = entrada.rpartition("=")
+        presupuestos[endpoint.strip()] = int(limite)
+    return presupuestos
+
+
+PRESUPUESTO = int(os.environ["CLINICA_PRESUPUESTO_VIAJES"]) if os.environ.get(
+    "CLINICA_PRESUPUESTO_VIAJES") else None
+PRESUPUESTOS = _leer_presupuestos(os.environ.get("CLINICA_PRESUPUESTOS", ""))
+
+# Viajes de la petición en curso; lo fijan los middlewares de metricas
+viajes_peticion = contextvars.ContextVar("viajes_peticion", default=None)
+
+
+class PresupuestoExcedido(Exception):
+    pass
+
+
+def presupuesto_de(endpoint):
+    return PRESUPUESTOS.get(endpoint, PRESUPUESTO)
+
+
+class Viajes:
+    __slots__ = ("total", "formas", "excedido")
+
+    def __init__(self):
+        self.total = 0
+        self.formas = {}
+        self.excedido = False
+
+    def anotar(self, forma, endpoint):
+        self.total += 1
+        self.formas[forma] = self.formas.get(forma, 0) + 1
+        limite = presupuesto_de(endpoint)
+        if limite is not None and self.total > limite and not self.excedido:
+            self.excedido = True
+            if MODO_PRUEBA:
+                raise PresupuestoExcedido(
+                    f"{endpoint or '-'} superó su presupuesto de {limite} viajes a la base: {forma}")
+
+    def repetidas(self):
+        """[(forma, veces)] que parecen N+1, de la más repetida a la menos"""
+        return sorted(((f, n) for f, n in self.formas.items() if n >= REPETICIONES_N_MAS_UNO),
+                      key=lambda par: par[1], reverse=True)
+
+    def revisar(self, endpoint):
+        """Registrar los patrones N+1 y el exceso de presupuesto; devuelve las repetidas"""
+        repetidas = self.repetidas()
+        for forma, veces in repetidas:
+            logger.warning("Posible N+1 en %s: %d veces %s", endpoint, veces, forma)
+        if self.excedido:
+            logger.warning("%s hizo %d viajes a la base (presupuesto %s)", endpoint, self.total,
+                           presupuesto_de(endpoint))
+        return repetidas
+
+
+def anotar(forma, endpoint):
+    viajes = viajes_peticion.get()
+    if viajes is not None:
+        viajes.anotar(forma, endpoint)